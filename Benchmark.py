@@ -0,0 +1,455 @@
+"""
+Benchmarks for the tagging pipeline in Script_Tagger.
+
+run_benchmarks times each stage of the pipeline (is_well_formatted, tag_lines, sanity_check, split_by_scene,
+passes_test_two and passes_test_three) on every script of a corpus, and reports the throughput, the p50/p99 latency
+per script and the peak memory use of each stage (each stage runs in a process of its own, so that the peak is not
+left over from an earlier stage). It runs on the real scripts in Parseable, and on synthetic screenplays from
+generate_screenplay, which makes scripts with a given number of scenes, density of dialog and indentation style from a
+seed, so that the same corpus can be made again on any machine. The results can be saved as a baseline, and later runs
+are compared against it so that regressions show up as differences.
+
+benchmark_tagger compares the throughput (in lines per second) of the line classifier that Script_Tagger uses now
+against the original one, which matched its patterns inline on every line and extracted character names from the
+"C" lines in a second pass. Both are run over the same lines of every movie in Parseable, which are read into memory
+beforehand so that only the tagging itself is timed.
+"""
+
+import re
+import os
+import sys
+import time
+import json
+import random
+import shutil
+import tempfile
+import contextlib
+import multiprocessing
+import Script_Tagger
+
+try:
+    import resource
+except ImportError:
+    # Peak memory is only reported where the resource module exists (i.e. not on Windows)
+    resource = None
+
+
+BASELINE_FILE = './Benchmark_Baseline.json'
+
+# The indentation (in spaces) of scene headings and descriptions, dialog, parentheticals, character names and
+# transitions in each style of synthetic screenplay.
+INDENTATION_STYLES = {
+    "standard": (0, 10, 16, 22, 45),
+    "imsdb": (15, 25, 30, 37, 55),
+    "narrow": (4, 8, 12, 16, 24)
+}
+
+SYNTHETIC_NAMES = [("JOHN", "male"), ("MARY", "female"), ("PETER", "male"), ("SARAH", "female"), ("DAVID", "male"),
+                   ("ANNA", "female"), ("FRANK", "male"), ("LUCY", "female"), ("GEORGE", "male"), ("EMMA", "female")]
+
+SYNTHETIC_WORDS = ["the", "we", "you", "she", "her", "it", "know", "go", "now", "never", "house", "money", "time",
+                   "door", "tonight", "wait", "look", "think", "really", "again", "here", "there", "gun", "car"]
+
+SYNTHETIC_PLACES = ["KITCHEN", "OFFICE", "STREET", "CAR", "PARK", "APARTMENT", "POLICE STATION", "DINER"]
+
+# The pipeline stages that run_benchmarks times. Each stage takes a movie name (with a cold parse cache) or the tagged
+# lines of the movie, and the tagged lines are always prepared outside of the timing.
+STAGES = ["is_well_formatted", "tag_lines", "sanity_check", "split_by_scene", "passes_test_two", "passes_test_three"]
+
+
+###
+# The original tagger and character name extraction, kept here as the baseline to compare against.
+###
+def legacy_tag_lines(scriptlines, indentations, indentation_frequencies):
+    important_levels = sorted([key for key, value, in indentation_frequencies.most_common(5)])
+    tagged_lines = []
+    for line in range(len(scriptlines)):
+        if indentations[line] == important_levels[0]:
+            if re.match(r'^([\d\.]{2,})?\s*(EXT\.?.*|INT\.?.*)$', scriptlines[line].strip()):
+                tagged_lines.append((scriptlines[line], "S"))
+            else:
+                tagged_lines.append((scriptlines[line], "N"))
+        elif indentations[line] == important_levels[1]:
+            tagged_lines.append((scriptlines[line], "D"))
+        elif indentations[line] == important_levels[2]:
+            tagged_lines.append((scriptlines[line], "M"))
+        elif indentations[line] == important_levels[3]:
+            if re.match(r'^\(.+\)| .+\) | \(.+$', scriptlines[line].strip()):
+                tagged_lines.append((scriptlines[line], "M"))
+            else:
+                tagged_lines.append((scriptlines[line], "C"))
+        elif indentations[line] == important_levels[4]:
+            tagged_lines.append((scriptlines[line], "M"))
+        else:
+            tagged_lines.append((scriptlines[line], "U"))
+    return tagged_lines
+
+
+def legacy_extract_character_names(character_line):
+    if re.match(r'[A-Za-z\.\-]+.*\(.+\)?.*', character_line):
+        character = re.findall(r'([A-Z\-\.\s]+)(\s*\(.*\))?', character_line)[0][0].strip()
+    else:
+        character = character_line.strip()
+    return character
+
+
+def legacy_tagger(scriptlines, indentation_frequencies):
+    indentations = [len(line) - len(line.lstrip()) for line in scriptlines]
+    tagged_lines = legacy_tag_lines(scriptlines, indentations, indentation_frequencies)
+    names = [legacy_extract_character_names(line.strip()) for line, tag in tagged_lines if tag == "C"]
+    return tagged_lines, names
+
+
+def compiled_tagger(scriptlines, indentation_frequencies):
+    tagged_lines = []
+    names = []
+    for line, tag, character in Script_Tagger.classify_lines(scriptlines, indentation_frequencies):
+        tagged_lines.append((line, tag))
+        if character is not None:
+            names.append(character)
+    return tagged_lines, names
+
+
+###
+# Reads the non-empty lines and indentation histogram of every movie in the list
+###
+def load_corpus(movies):
+    corpus = []
+    for movie in movies:
+        try:
+            scriptlines = list(Script_Tagger.iter_script_lines(movie))
+        except FileNotFoundError:
+            continue
+        corpus.append((movie, scriptlines, Script_Tagger.indentation_levels(scriptlines)))
+    return corpus
+
+
+###
+# Times a tagger over the whole corpus (best of repeats), and returns its throughput in lines per second.
+###
+def time_tagger(tagger, corpus, repeats=3):
+    total_lines = sum(len(scriptlines) for movie, scriptlines, frequencies in corpus)
+    best = None
+    for repeat in range(repeats):
+        start = time.perf_counter()
+        for movie, scriptlines, frequencies in corpus:
+            tagger(scriptlines, frequencies)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return total_lines / best if best > 0 else float('inf')
+
+
+###
+# Compares the original tagger with the compiled one on every movie in Parseable, after checking that they agree.
+###
+def benchmark_tagger(movies_file="Parseable", repeats=3):
+    with open(movies_file, 'r') as moviesfile:
+        movies = [movie.strip() for movie in moviesfile.readlines() if len(movie.strip()) > 0]
+    corpus = load_corpus(movies)
+    for movie, scriptlines, frequencies in corpus:
+        if legacy_tagger(scriptlines, frequencies) != compiled_tagger(scriptlines, frequencies):
+            print("Taggers disagree on " + movie)
+    legacy = time_tagger(legacy_tagger, corpus, repeats)
+    compiled = time_tagger(compiled_tagger, corpus, repeats)
+    print("Movies: " + str(len(corpus)))
+    print("Lines: " + str(sum(len(scriptlines) for movie, scriptlines, frequencies in corpus)))
+    print("Original tagger (lines/second): " + str(round(legacy)))
+    print("Compiled tagger (lines/second): " + str(round(compiled)))
+    print("Speedup: " + str(round(compiled / legacy, 2)) + "x")
+    return legacy, compiled
+
+
+###
+# Makes a synthetic screenplay from a seed. Returns the script as a string and the (character, gender) list for its
+# characters file.
+#
+# Each scene starts with a heading and a line of description, followed by beats. A beat is an exchange of dialog
+# (a character name, sometimes a parenthetical, and one to three lines of dialog) with probability dialogue_density,
+# and otherwise a line of description. The words of the dialog sometimes mention men, so that test three has both
+# passing and failing scenes to look at.
+###
+def generate_screenplay(seed, scenes=40, dialogue_density=0.6, style="standard", beats_per_scene=12):
+    generator = random.Random(seed)
+    heading, dialog, parenthetical, character, transition = [" " * width for width in INDENTATION_STYLES[style]]
+    cast = generator.sample(SYNTHETIC_NAMES, generator.randint(3, len(SYNTHETIC_NAMES)))
+    male_words = [name.lower() for name, gender in cast if gender == "male"] + Script_Tagger.MALE_TERMS
+    lines = [transition + "FADE IN:", ""]
+    for scene in range(scenes):
+        lines.append(heading + generator.choice(["INT. ", "EXT. "]) + generator.choice(SYNTHETIC_PLACES) + " - " +
+                     generator.choice(["DAY", "NIGHT"]))
+        lines.append("")
+        lines.append(heading + " ".join(generator.choice(SYNTHETIC_WORDS) for word in range(10)).capitalize() + ".")
+        lines.append("")
+        for beat in range(generator.randint(beats_per_scene // 2, beats_per_scene * 3 // 2)):
+            if generator.random() < dialogue_density:
+                lines.append(character + generator.choice(cast)[0])
+                if generator.random() < 0.1:
+                    lines.append(parenthetical + "(" + generator.choice(["beat", "quietly", "laughing"]) + ")")
+                for line in range(generator.randint(1, 3)):
+                    words = [generator.choice(SYNTHETIC_WORDS) for word in range(generator.randint(4, 9))]
+                    if generator.random() < 0.15:
+                        words[generator.randrange(len(words))] = generator.choice(male_words)
+                    lines.append(dialog + " ".join(words))
+            else:
+                lines.append(heading + " ".join(generator.choice(SYNTHETIC_WORDS) for word in range(12)))
+            lines.append("")
+        if generator.random() < 0.2:
+            lines.append(transition + "CUT TO:")
+            lines.append("")
+    return "\n".join(lines) + "\n", cast
+
+
+###
+# Writes synthetic screenplays (and their characters files) for every combination of style and seed, and returns
+# their movie names.
+###
+def write_synthetic_corpus(script_path, character_path, seed=0, count=10, scenes=40, dialogue_density=0.6,
+                           styles=None):
+    os.makedirs(script_path, exist_ok=True)
+    os.makedirs(character_path, exist_ok=True)
+    movies = []
+    for style in styles or sorted(INDENTATION_STYLES):
+        for number in range(count):
+            movie = "Synthetic " + style + " " + str(number)
+            script, cast = generate_screenplay("{}-{}-{}".format(seed, style, number), scenes, dialogue_density,
+                                               style)
+            with open(os.path.join(script_path, movie + ".script"), 'w') as scriptfile:
+                scriptfile.write(script)
+            with open(os.path.join(character_path, movie), 'w') as charfile:
+                for name, gender in cast:
+                    charfile.write(name + "," + gender + "\n")
+            movies.append(movie)
+    return movies
+
+
+###
+# Temporarily points Script_Tagger at other script, parse cache and character directories.
+###
+@contextlib.contextmanager
+def redirect_paths(script_path=None, cache_path=None, character_path=None):
+    saved = (Script_Tagger.SCRIPT_PATH, Script_Tagger.CACHE_PATH, Script_Tagger.CHARACTER_PATH)
+    Script_Tagger.SCRIPT_PATH = script_path or saved[0]
+    Script_Tagger.CACHE_PATH = cache_path or saved[1]
+    Script_Tagger.CHARACTER_PATH = character_path or saved[2]
+    try:
+        yield
+    finally:
+        Script_Tagger.SCRIPT_PATH, Script_Tagger.CACHE_PATH, Script_Tagger.CHARACTER_PATH = saved
+        Script_Tagger._parsed_scripts.clear()
+
+
+###
+# Throws away every parse that Script_Tagger has kept, both in memory and on disk, so the next stage starts cold.
+###
+def clear_parses():
+    Script_Tagger._parsed_scripts.clear()
+    shutil.rmtree(Script_Tagger.CACHE_PATH, ignore_errors=True)
+
+
+###
+# Returns the function for a stage and the argument it gets for a movie. Stages that take a movie name start with a
+# cold parse cache, unless warm is True. The test stages are timed warm by default, since in a real run the parse is
+# already there by the time they are called.
+###
+def stage_input(stage, movie, warm=None):
+    if stage in ["sanity_check", "split_by_scene"]:
+        return getattr(Script_Tagger, stage), Script_Tagger.tag_lines(movie)
+    if warm is None:
+        warm = stage in ["passes_test_two", "passes_test_three"]
+    if warm:
+        Script_Tagger.parse_script(movie)
+    else:
+        clear_parses()
+    return getattr(Script_Tagger, stage), movie
+
+
+###
+# The value at a fraction of the way through a sorted list of timings (nearest rank)
+###
+def percentile(timings, fraction):
+    if len(timings) == 0:
+        return None
+    return timings[min(len(timings) - 1, max(0, int(round(fraction * len(timings))) - 1))]
+
+
+###
+# The peak resident set size of this process in bytes. ru_maxrss is in bytes on macOS, but in kilobytes elsewhere.
+###
+def peak_rss():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+###
+# Times a stage on every movie (best of repeats per movie), and returns its results as a dictionary with the throughput
+# in scripts and lines per second and the p50 and p99 latency per script.
+###
+def benchmark_stage(stage, movies, line_counts, repeats=3, warm=None):
+    timings = []
+    for movie in movies:
+        best = None
+        for repeat in range(repeats):
+            function, argument = stage_input(stage, movie, warm)
+            start = time.perf_counter()
+            function(argument)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings.append(best)
+    total = sum(timings)
+    timings.sort()
+    return {
+        "scripts": len(movies),
+        "lines": sum(line_counts.values()),
+        "scripts_per_second": len(movies) / total if total > 0 else None,
+        "lines_per_second": sum(line_counts.values()) / total if total > 0 else None,
+        "p50_seconds": percentile(timings, 0.5),
+        "p99_seconds": percentile(timings, 0.99)
+    }
+
+
+###
+# Runs benchmark_stage in a process of its own (started by isolated_stage), with Script_Tagger pointed at the same
+# directories as in the parent, and adds the peak resident set size of that process to the results.
+###
+def run_isolated_stage(paths, stage, movies, line_counts, repeats, warm):
+    with redirect_paths(*paths):
+        results = benchmark_stage(stage, movies, line_counts, repeats, warm)
+    results["peak_rss_bytes"] = peak_rss()
+    return results
+
+
+###
+# ru_maxrss is the peak of the whole process, so a stage run after a hungrier one would report the earlier peak. Each
+# stage is run in a newly spawned process instead, so that its peak covers only the interpreter, the imports and that
+# stage (with its inputs).
+###
+def isolated_stage(stage, movies, line_counts, repeats=3, warm=None):
+    paths = (Script_Tagger.SCRIPT_PATH, Script_Tagger.CACHE_PATH, Script_Tagger.CHARACTER_PATH)
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(run_isolated_stage, (paths, stage, movies, line_counts, repeats, warm))
+
+
+###
+# Times every stage on every movie, and returns the results of each stage as a dictionary with the throughput in
+# scripts and lines per second, the p50 and p99 latency per script, and the peak resident set size of the process
+# that ran the stage. With isolate=False the stages all run in this process, and no peak is reported, since it would be
+# the peak of the whole process so far rather than of the stage.
+###
+def benchmark_stages(movies, stages=None, repeats=3, warm=None, isolate=True):
+    line_counts = {movie: len(list(Script_Tagger.iter_script_lines(movie))) for movie in movies}
+    results = {}
+    for stage in stages or STAGES:
+        if isolate:
+            results[stage] = isolated_stage(stage, movies, line_counts, repeats, warm)
+        else:
+            results[stage] = benchmark_stage(stage, movies, line_counts, repeats, warm)
+            results[stage]["peak_rss_bytes"] = None
+    return results
+
+
+###
+# Reads the movies in Parseable whose scripts and characters files both exist.
+###
+def parseable_corpus(movies_file="Parseable"):
+    with open(movies_file, 'r') as moviesfile:
+        movies = [movie.strip() for movie in moviesfile.readlines() if len(movie.strip()) > 0]
+    return [movie for movie in movies if os.path.exists(Script_Tagger.SCRIPT_PATH + movie + ".script") and
+            os.path.exists(Script_Tagger.CHARACTER_PATH + movie)]
+
+
+###
+# Runs the stage benchmarks on the real corpus (if movies_file exists) and on a synthetic corpus, and returns the
+# results as a dictionary of corpus -> stage -> results. Parses always go to a temporary cache so that the real parse
+# cache is left alone.
+###
+def run_benchmarks(movies_file="Parseable", seed=0, count=10, scenes=40, dialogue_density=0.6, styles=None,
+                   stages=None, repeats=3):
+    results = {}
+    work_path = tempfile.mkdtemp(prefix="bechdel_benchmark_")
+    try:
+        cache_path = os.path.join(work_path, "Parse_Cache") + os.sep
+        if movies_file is not None and os.path.exists(movies_file):
+            with redirect_paths(cache_path=cache_path):
+                movies = parseable_corpus(movies_file)
+                if len(movies) > 0:
+                    results["parseable"] = benchmark_stages(movies, stages, repeats)
+        script_path = os.path.join(work_path, "Scripts") + os.sep
+        character_path = os.path.join(work_path, "Characters") + os.sep
+        movies = write_synthetic_corpus(script_path, character_path, seed, count, scenes, dialogue_density, styles)
+        with redirect_paths(script_path, cache_path, character_path):
+            results["synthetic"] = benchmark_stages(movies, stages, repeats)
+    finally:
+        shutil.rmtree(work_path, ignore_errors=True)
+    return results
+
+
+def save_baseline(results, filename=BASELINE_FILE):
+    with open(filename, 'w') as baseline_file:
+        json.dump(results, baseline_file, indent=2, sort_keys=True)
+
+
+def load_baseline(filename=BASELINE_FILE):
+    with open(filename, 'r') as baseline_file:
+        return json.load(baseline_file)
+
+
+###
+# Compares results against a baseline, and returns the lines of a diff: one per corpus and stage that are in both,
+# with the relative change of each measurement. Throughput that dropped (or latency that rose) by more than tolerance
+# is marked as a regression.
+###
+def compare_to_baseline(results, baseline, tolerance=0.1):
+    diff = []
+    for corpus in sorted(results):
+        for stage in sorted(results[corpus]):
+            old = baseline.get(corpus, {}).get(stage)
+            if old is None:
+                diff.append("+ " + corpus + " " + stage + " (new)")
+                continue
+            new = results[corpus][stage]
+            changes = []
+            regressed = False
+            for measurement in ["lines_per_second", "p50_seconds", "p99_seconds", "peak_rss_bytes"]:
+                if not old.get(measurement) or new.get(measurement) is None:
+                    continue
+                change = (new[measurement] - old[measurement]) / old[measurement]
+                changes.append(measurement + " " + "{:+.1%}".format(change))
+                if measurement == "lines_per_second" and change < -tolerance:
+                    regressed = True
+                elif measurement in ["p50_seconds", "p99_seconds"] and change > tolerance:
+                    regressed = True
+            diff.append(("! " if regressed else "  ") + corpus + " " + stage + ": " + ", ".join(changes))
+    return diff
+
+
+def peak_rss_text(peak):
+    return "n/a" if peak is None else "{:.1f}MB".format(peak / 2 ** 20)
+
+
+###
+# Runs the benchmarks and prints them. If there is a baseline, the results are compared to it, otherwise (or if
+# save_results is True) the results are saved as the new baseline.
+###
+def benchmark_pipeline(baseline_file=BASELINE_FILE, save_results=False, **options):
+    results = run_benchmarks(**options)
+    for corpus in sorted(results):
+        for stage in STAGES:
+            if stage in results[corpus]:
+                stage_results = results[corpus][stage]
+                print(corpus + " " + stage + ": " + str(round(stage_results["lines_per_second"] or 0)) +
+                      " lines/second, p50 " + "{:.2f}".format(1000 * stage_results["p50_seconds"]) + "ms, p99 " +
+                      "{:.2f}".format(1000 * stage_results["p99_seconds"]) + "ms, peak RSS " +
+                      peak_rss_text(stage_results["peak_rss_bytes"]))
+    if os.path.exists(baseline_file):
+        for line in compare_to_baseline(results, load_baseline(baseline_file)):
+            print(line)
+    if save_results or not os.path.exists(baseline_file):
+        save_baseline(results, baseline_file)
+    return results
+
+
+if __name__ == "__main__":
+    benchmark_tagger()
+    benchmark_pipeline()
@@ -0,0 +1,230 @@
+"""
+Incremental re-evaluation of the pipeline (scripts -> Parseable -> Characters -> t1 -> t2 -> t3).
+
+Instead of every stage rewriting its results for every movie, each per-movie result is a node that records the inputs
+it was computed from:
+    parseable: the hash of the script and TAGGER_VERSION
+    t1:        the hash of the script, TAGGER_VERSION and MODEL_VERSION (the genders come from Bing and the name
+               classifier), or with genders="characters", the hash of the characters file and MODEL_VERSION
+    t2, t3:    the hash of the script, TAGGER_VERSION, the hash of the characters file and TEST_VERSION
+
+A build only recomputes the nodes whose inputs have changed since they were last computed, so editing
+Characters/Casino only recomputes Casino's t2 and t3 rows. Just like perform_tests, a movie only gets a t2 row if it
+passed test one and a t3 row if it passed test two, so a result that flips also adds or drops the rows after it.
+
+The nodes are kept in BUILD_STATE, along with the size, modification time and hash of every input file, so that files
+that have not been touched are not hashed again. After a build, Parseable, t1, t2 and t3 are written from the nodes
+and recorded in the Results_Store.
+"""
+
+import os
+import json
+import hashlib
+import Script_Tagger
+import Results_Store
+
+
+BUILD_STATE = './Build_State.json'
+
+NODES = ["parseable", "t1", "t2", "t3"]
+
+
+###
+# Reads the build state, or starts a new one if there is none yet.
+###
+def load_state(filename=BUILD_STATE):
+    try:
+        with open(filename, 'r') as state_file:
+            return json.load(state_file)
+    except (OSError, ValueError):
+        return {"files": {}, "movies": {}}
+
+
+def save_state(state, filename=BUILD_STATE):
+    with open(filename + '.tmp', 'w') as state_file:
+        json.dump(state, state_file, sort_keys=True)
+    os.replace(filename + '.tmp', filename)
+
+
+###
+# The hash of a file's contents, or None if the file does not exist. Files whose size and modification time are the
+# same as the last time they were hashed are not read again.
+###
+def file_hash(state, path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        state["files"].pop(path, None)
+        return None
+    known = state["files"].get(path)
+    if known is not None and known[:2] == [stat.st_mtime_ns, stat.st_size]:
+        return known[2]
+    with open(path, 'rb') as contents:
+        digest = hashlib.sha1(contents.read()).hexdigest()
+    state["files"][path] = [stat.st_mtime_ns, stat.st_size, digest]
+    return digest
+
+
+###
+# The hash of a movie's script or characters file, from the loose file if there is one and from the pack otherwise
+# (where the hash of every entry is already kept in its index).
+###
+def input_hash(state, path, movie, kind):
+    digest = file_hash(state, path)
+    if digest is None:
+        pack = Script_Tagger.corpus_pack()
+        if pack is not None:
+            digest = pack.content_hash(movie, kind)
+    return digest
+
+
+###
+# Keeps track of the inputs of one build: the fingerprints of the files and versions that the nodes depend on, and how
+# many nodes were recomputed, reused or dropped.
+###
+class Build:
+    def __init__(self, state, genders="bing"):
+        from Name_Classifier import MODEL_VERSION
+        self.state = state
+        self.genders = genders
+        self.classifier_version = MODEL_VERSION
+        self.classifier = None
+        self.gender_cache = None
+        self.recomputed = dict((node, 0) for node in NODES)
+        self.reused = dict((node, 0) for node in NODES)
+        self.dropped = dict((node, 0) for node in NODES)
+
+    ###
+    # Returns the value of a node, either from the state if it was computed from the same inputs, or by computing it.
+    ###
+    def node(self, movie, name, dependencies, compute):
+        nodes = self.state["movies"].setdefault(movie, {})
+        known = nodes.get(name)
+        if known is not None and known["deps"] == dependencies:
+            self.reused[name] += 1
+            return known["value"]
+        value = compute(movie)
+        nodes[name] = {"deps": dependencies, "value": value}
+        self.recomputed[name] += 1
+        return value
+
+    def drop(self, movie, names):
+        nodes = self.state["movies"].get(movie, {})
+        for name in names:
+            if nodes.pop(name, None) is not None:
+                self.dropped[name] += 1
+
+    def test_one(self, movie):
+        if self.genders == "characters":
+            characters, gender = Script_Tagger.read_characters(movie)
+            return Script_Tagger.passes_test_one(characters, gender)
+        if self.classifier is None:
+            from Gender_Cache import GenderCache
+            self.classifier = Script_Tagger.make_classifier()
+            self.gender_cache = GenderCache()
+        characters = Script_Tagger.get_popular_characters(Script_Tagger.get_character_names(movie))
+        genders = Script_Tagger.classify_genders_bing(movie, self.classifier, characters, self.gender_cache)
+        return Script_Tagger.passes_test_one(characters, genders)
+
+    ###
+    # Brings every node of a movie up to date.
+    ###
+    def update(self, movie):
+        script = input_hash(self.state, Script_Tagger.SCRIPT_PATH + movie + ".script", movie, "S")
+        if script is None:
+            self.drop(movie, NODES)
+            self.state["movies"].pop(movie, None)
+            return
+        parsed = {"script": script, "tagger": Script_Tagger.TAGGER_VERSION}
+        # The verdict is [well_formatted, sane] (it used to be a single flag, hence the extra input)
+        if not all(self.node(movie, "parseable", dict(parsed, verdict="flags"), parse_verdict)):
+            self.drop(movie, ["t1", "t2", "t3"])
+            return
+        characters = input_hash(self.state, Script_Tagger.CHARACTER_PATH + movie, movie, "C")
+        if self.genders == "characters":
+            if characters is None:
+                self.drop(movie, ["t1", "t2", "t3"])
+                return
+            test_one_inputs = {"characters": characters, "classifier": self.classifier_version}
+        else:
+            test_one_inputs = dict(parsed, classifier=self.classifier_version)
+        if not self.node(movie, "t1", test_one_inputs, self.test_one):
+            self.drop(movie, ["t2", "t3"])
+            return
+        if characters is None:
+            self.drop(movie, ["t2", "t3"])
+            return
+        tests_inputs = dict(parsed, characters=characters, tests=Script_Tagger.TEST_VERSION)
+        if not self.node(movie, "t2", tests_inputs, Script_Tagger.passes_test_two):
+            self.drop(movie, ["t3"])
+            return
+        self.node(movie, "t3", tests_inputs, Script_Tagger.passes_test_three)
+
+    def close(self):
+        if self.gender_cache is not None:
+            self.gender_cache.close()
+
+
+def parse_verdict(movie):
+    parsed = Script_Tagger.parse_script(movie)
+    return [parsed['well_formatted'], parsed['sane']]
+
+
+###
+# The movies in Bechdel_Data, in order (just like get_parseable_movies reads them).
+###
+def read_movies(filename="Bechdel_Data"):
+    with open(filename, 'r') as bechdel_list:
+        return [line.rsplit(',', 2)[0].strip() for line in bechdel_list.readlines()]
+
+
+###
+# Writes Parseable, t1, t2 and t3 from the nodes, in the order of the movies, and records them in the Results_Store.
+###
+def write_outputs(state, movies, parseable_file="Parseable", test_files=("t1", "t2", "t3"),
+                  store_file=Results_Store.STORE_FILE):
+    seen = set()
+    ordered = []
+    for movie in movies:
+        if movie in state["movies"] and movie not in seen:
+            seen.add(movie)
+            ordered.append(movie)
+    verdicts = [(movie,) + tuple(state["movies"][movie]["parseable"]["value"]) for movie in ordered
+                if "parseable" in state["movies"][movie]]
+    with open(parseable_file, 'w') as parseable:
+        for movie, well_formatted, sane in verdicts:
+            if well_formatted and sane:
+                parseable.write(movie + "\n")
+    Results_Store.save_parseable(verdicts, parseable_file, store_file)
+    for test, (name, test_file) in enumerate(zip(NODES[1:], test_files), 1):
+        predictions = [(movie, state["movies"][movie][name]["value"]) for movie in ordered
+                       if state["movies"][movie].get(name) is not None]
+        with open(test_file, 'w') as results:
+            for movie, value in predictions:
+                results.write(movie + "," + str(value) + "\n")
+        Results_Store.save_predictions(test, predictions, test_file, store_file)
+
+
+###
+# Brings every movie in Bechdel_Data (or just the given ones) up to date, writes the outputs, and returns how many
+# nodes of each kind were recomputed, reused and dropped. With force=True, every node is recomputed.
+###
+def build(movies=None, genders="bing", force=False, state_file=BUILD_STATE, bechdel_file="Bechdel_Data"):
+    state = load_state(state_file)
+    if force:
+        state["movies"] = {}
+    all_movies = read_movies(bechdel_file)
+    current = Build(state, genders)
+    try:
+        for movie in (movies if movies is not None else all_movies):
+            if len(movie) > 0:
+                current.update(movie)
+    finally:
+        current.close()
+        save_state(state, state_file)
+    write_outputs(state, all_movies)
+    return {"recomputed": current.recomputed, "reused": current.reused, "dropped": current.dropped}
+
+
+if __name__ == "__main__":
+    print(build())
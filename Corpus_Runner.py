@@ -0,0 +1,199 @@
+"""
+This file runs the stages of Script_Tagger (the parseability check and the three Bechdel tests) over a whole corpus of
+movies at once. Every movie can be tagged and tested independently of every other movie, so instead of looping over
+them one at a time like the perform_test_* functions do, the work is spread over a pool of processes.
+
+The results are written to the same files as before (Parseable, t1, t2 and t3), in the same order as the movies were
+read in, no matter which process finishes first, and are recorded in the Results_Store as well. A movie that raises an
+error is reported and left out of the results rather than stopping the whole run.
+"""
+
+import multiprocessing
+import Script_Tagger
+import Results_Store
+
+
+# The number of worker processes (None uses every core on the machine)
+PROCESSES = None
+
+# The number of movies handed to a worker at once. Bigger chunks mean less scheduling overhead, smaller chunks mean
+# that a few very long scripts are less likely to end up in the same chunk.
+CHUNK_SIZE = 8
+
+# The name classifier used for test one, built once per worker process by load_classifier
+_classifier = None
+
+
+###
+# Runs a single (function, movie) job inside a worker process. Errors are caught and sent back to the parent process
+# as text, so that one bad script does not take down the whole pool.
+###
+def run_job(job):
+    function, movie = job
+    try:
+        return movie, function(movie), None
+    except Exception as er:
+        return movie, None, "{}: {}".format(type(er).__name__, er)
+
+
+###
+# Runs function(movie) for every movie on a pool of processes, and yields (movie, result, error) tuples in the same
+# order as movies. error is None if the function ran successfully.
+###
+def run_corpus(function, movies, processes=PROCESSES, chunksize=CHUNK_SIZE, initializer=None):
+    with multiprocessing.Pool(processes, initializer) as pool:
+        for movie, result, error in pool.imap(run_job, [(function, movie) for movie in movies], chunksize):
+            if error is not None:
+                print("Failed on " + movie + ": " + error)
+            yield movie, result, error
+
+
+###
+# Loads the name classifier for test one. This is run once in every worker process when the pool starts. The parent
+# process loads the classifier before starting the pool, so that the model is trained and saved to Models/ once,
+# rather than by every worker at the same time, and forked workers already have it.
+###
+def load_classifier():
+    global _classifier
+    _classifier = Script_Tagger.make_classifier()
+
+
+###
+# The per-movie work of get_parseable_movies: whether the script of a movie is well formatted and whether its parse is
+# sane, or None if it has no script (like most movies in Bechdel_Data, which is not an error).
+###
+def parse_verdict(movie):
+    try:
+        parsed = Script_Tagger.parse_script(movie)
+    except FileNotFoundError:
+        return None
+    return parsed['well_formatted'], parsed['sane']
+
+
+###
+# The per-movie work of perform_test_one
+###
+def passes_test_one(movie):
+    chars = Script_Tagger.get_popular_characters(Script_Tagger.get_character_names(movie))
+    genders = Script_Tagger.classify_genders_bing(movie, _classifier, chars)
+    return Script_Tagger.passes_test_one(chars, genders)
+
+
+###
+# Reads a list of movies, one per line
+###
+def read_movies(filename):
+    with open(filename, 'r') as moviesfile:
+        return [movie.strip() for movie in moviesfile.readlines() if len(movie.strip()) > 0]
+
+
+###
+# Reads a test results file (t1, t2 or t3) into a dictionary of movie -> whether it passed
+###
+def read_test_results(filename):
+    results = {}
+    with open(filename, 'r') as test_results:
+        for line in test_results:
+            data = line.rsplit(',', 1)
+            if len(data) == 2:
+                results[data[0].strip()] = data[1].strip() == "True"
+    return results
+
+
+###
+# Writes "movie,result" lines for every movie that did not fail, and records them as the predictions for test in the
+# Results_Store (if a test is given)
+###
+def write_test_results(filename, results, test=None):
+    results = [(movie, result) for movie, result, error in results if error is None]
+    with open(filename, 'w') as test_results:
+        for movie, result in results:
+            test_results.write(movie + "," + str(result) + "\n")
+    if test is not None:
+        Results_Store.save_predictions(test, results, filename)
+
+
+###
+# Writes Parseable from the (movie, parse_verdict, error) results, and records the verdicts in the Results_Store
+###
+def write_parseable(results, filename="Parseable"):
+    verdicts = [(movie, verdict[0], verdict[1]) for movie, verdict, error in results
+                if error is None and verdict is not None]
+    with open(filename, "w") as parseable_scripts:
+        for movie, well_formatted, sane in verdicts:
+            if well_formatted and sane:
+                parseable_scripts.write(movie + "\n")
+    Results_Store.save_parseable(verdicts, filename)
+
+
+###
+# Parallel version of get_parseable_movies. Movies without a script are skipped just like before.
+###
+def run_parseable(processes=PROCESSES, chunksize=CHUNK_SIZE):
+    bechdel_list = open("Bechdel_Data", "r")
+    movies = [line.rsplit(',', 2)[0].strip() for line in bechdel_list.readlines()]
+    bechdel_list.close()
+    write_parseable(run_corpus(parse_verdict, movies, processes, chunksize))
+
+
+###
+# Parallel version of perform_test_one, which writes its results to t1
+###
+def run_test_one(processes=PROCESSES, chunksize=CHUNK_SIZE):
+    movies = read_movies("Parseable")
+    Script_Tagger.make_classifier()
+    write_test_results("t1", run_corpus(passes_test_one, movies, processes, chunksize, load_classifier), 1)
+
+
+###
+# Parallel version of perform_test_two, which tests the movies that passed test one
+###
+def run_test_two(processes=PROCESSES, chunksize=CHUNK_SIZE):
+    passed_t1 = read_test_results("t1")
+    movies = [movie for movie in read_movies("Parseable") if passed_t1.get(movie)]
+    write_test_results("t2", run_corpus(Script_Tagger.passes_test_two, movies, processes, chunksize), 2)
+
+
+###
+# Parallel version of perform_test_three, which tests the movies that passed test two
+###
+def run_test_three(processes=PROCESSES, chunksize=CHUNK_SIZE):
+    passed_t2 = read_test_results("t2")
+    movies = [movie for movie in read_movies("Parseable") if passed_t2.get(movie)]
+    write_test_results("t3", run_corpus(Script_Tagger.passes_test_three, movies, processes, chunksize), 3)
+
+
+###
+# Parallel version of perform_tests, which runs all three tests on each movie in one pass with evaluate_movie, using
+# the genders in the characters files.
+###
+def run_tests_together(processes=PROCESSES, chunksize=CHUNK_SIZE):
+    movies = read_movies("Parseable")
+    write_tests_results(list(run_corpus(Script_Tagger.evaluate_movie, movies, processes, chunksize)))
+
+
+###
+# Writes t1, t2 and t3 from the (movie, (passes_t1, passes_t2, passes_t3), error) results of evaluate_movie. Like
+# perform_tests, only the movies that passed test one go in t2, and only the ones that passed test two go in t3.
+# Movies that failed come back with None instead of their results, and are left out of all three.
+###
+def write_tests_results(results):
+    results = [(movie, passed, error) for movie, passed, error in results if error is None]
+    write_test_results("t1", [(movie, passed[0], error) for movie, passed, error in results], 1)
+    write_test_results("t2", [(movie, passed[1], error) for movie, passed, error in results if passed[0]], 2)
+    write_test_results("t3", [(movie, passed[2], error) for movie, passed, error in results if passed[0] and passed[1]],
+                       3)
+
+
+###
+# Runs all three tests, one after another.
+###
+def run_all_tests(processes=PROCESSES, chunksize=CHUNK_SIZE):
+    run_test_one(processes, chunksize)
+    run_test_two(processes, chunksize)
+    run_test_three(processes, chunksize)
+
+
+if __name__ == "__main__":
+    run_parseable()
+    run_all_tests()
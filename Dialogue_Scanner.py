@@ -0,0 +1,117 @@
+"""
+Finds every mention of a set of terms (e.g. the names of the male characters and MALE_TERMS for test three) in the
+dialog of a scene in a single pass.
+
+The terms are split into words and stored in a trie of words, built once per movie. A scene's dialog lines are joined
+into one text and split into words by WORD, and the longest term that starts at each word is followed down the trie.
+Because of that:
+    - punctuation never hides a term ("him," and "his." are found, as is "he" in "he's")
+    - names of more than one word are found as a whole ("CHARLIE CLARK"), even when the dialog wraps between them
+    - the work per word is bounded by the number of words in the longest term, not by how many terms there are
+
+This changes what test three counts as a mention of a man. It used to split each dialog line on whitespace and compare
+every whole piece with the terms, so "him," "his." or "(he" were missed, and a name of more than one word could never
+match. Now words are runs of word characters (WORD), so apostrophes split words too: "he's" and "he'd" are found as
+"he", and "Charlie's" as "Charlie". A term only matches whole words, so "Al" is not found in "Alan" and "he" is not
+found in "hello". Where one term starts another ("CHARLIE" and "CHARLIE CLARK"), the longest one that the dialog has
+wins. Script_Tagger.TEST_VERSION was bumped for this, so the old t2/t3 results are not reused.
+
+Every match is returned as a Reference, which says which term was found, the text that matched, where it is in the
+joined dialog, and which line of the scene it starts on, so that a verdict can be checked by hand.
+"""
+
+import re
+import bisect
+import collections
+
+
+# What counts as a word, both in the terms and in the dialog
+WORD = re.compile(r"\w+")
+
+# The key that marks the end of a term in the trie (no word is empty, so it can never clash with one)
+END = ""
+
+###
+# term:  the term that was found, as it was given to the scanner
+# text:  the text of the dialog that matched it
+# start: where the match starts in the joined dialog of the scene
+# end:   where the match ends in the joined dialog of the scene
+# line:  the index (in the scene) of the line that the match starts on
+###
+Reference = collections.namedtuple("Reference", ["term", "text", "start", "end", "line"])
+
+
+def words(text):
+    return [word.casefold() for word in WORD.findall(text)]
+
+
+class DialogueScanner:
+    def __init__(self, terms):
+        self.trie = {}
+        self.terms = 0
+        for term in terms:
+            term_words = words(term)
+            if len(term_words) == 0:
+                continue
+            node = self.trie
+            for word in term_words:
+                node = node.setdefault(word, {})
+            if END not in node:
+                node[END] = term
+                self.terms += 1
+
+    ###
+    # Joins the dialog ("D") lines of a scene into one text, one line after another. Returns the text, where each
+    # dialog line starts in it, and the index of each dialog line in the scene.
+    ###
+    @staticmethod
+    def dialogue_text(scene):
+        parts = []
+        offsets = []
+        lines = []
+        position = 0
+        for index, (line, tag) in enumerate(scene):
+            if tag == "D":
+                parts.append(line)
+                offsets.append(position)
+                lines.append(index)
+                position += len(line) + 1
+        return "\n".join(parts), offsets, lines
+
+    ###
+    # Yields the References in a scene in the order they appear in. Where terms overlap, the longest one that starts
+    # at a word wins, and the scan carries on after it.
+    ###
+    def iter_references(self, scene):
+        text, offsets, lines = self.dialogue_text(scene)
+        tokens = [(match.group().casefold(), match.start(), match.end()) for match in WORD.finditer(text)]
+        position = 0
+        while position < len(tokens):
+            node = self.trie.get(tokens[position][0])
+            found = None
+            last = position
+            while node is not None:
+                if END in node:
+                    found = (node[END], last)
+                last += 1
+                if last == len(tokens):
+                    break
+                node = node.get(tokens[last][0])
+            if found is None:
+                position += 1
+                continue
+            term, last = found
+            start = tokens[position][1]
+            end = tokens[last][2]
+            line = lines[bisect.bisect_right(offsets, start) - 1]
+            yield Reference(term, text[start:end], start, end, line)
+            position = last + 1
+
+    def scan(self, scene):
+        return list(self.iter_references(scene))
+
+    ###
+    # The first Reference in a scene, or None if there is none.
+    ###
+    def first_reference(self, scene):
+        return next(self.iter_references(scene), None)
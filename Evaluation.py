@@ -0,0 +1,198 @@
+"""
+Evaluates the predictions in t1, t2 and t3 against the Bechdel scores in Bechdel_Data. Both are read from the
+Results_Store when it has them (and the test file has not been changed since they were recorded), and from the text
+files otherwise.
+
+Instead of classifying one prediction at a time, the ground truth and the predictions for a test are loaded into
+arrays, and every prediction is given a cell of the confusion matrix (true/false positive/negative) at once. The
+confusion matrices for the whole test, for every year and for every decade are then all counted with bincount, and
+confidence intervals for every metric come from bootstrap resampling of the same cells.
+
+evaluation_report returns all of this as a dictionary (metrics that have an empty denominator are None rather than a
+division by zero), and write_report_json/write_report_csv save it so that runs can be compared with each other.
+"""
+
+import numpy
+import json
+import csv
+import os
+from Results_Store import STORE_FILE, ResultsStore, read_bechdel_data, read_pairs
+from Title_Index import TitleIndex
+
+
+# The cells of the confusion matrix, indexed by 2 * predicted + actual
+CELLS = ['true_neg', 'false_neg', 'false_pos', 'true_pos']
+
+METRICS = ['accuracy', 'recall_pos', 'precision_pos', 'recall_neg', 'precision_neg']
+
+
+###
+# The Bechdel_Data rows and the (movie, "True"/"False") predictions for a test, from the Results_Store if it has the
+# predictions that are in the test file, or else from the files themselves.
+###
+def read_test(test_num, bechdel_file="Bechdel_Data", test_file=None, store_file=STORE_FILE):
+    test_file = test_file or "t" + str(test_num)
+    if os.path.exists(store_file):
+        store = ResultsStore(store_file)
+        try:
+            if store.is_current(test_file):
+                store.sync_movies(bechdel_file)
+                predictions = store.predictions(test_num)
+                return store.movie_rows(), [(movie, str(passed)) for movie, passed in predictions.items()]
+        finally:
+            store.close()
+    return read_bechdel_data(bechdel_file), read_pairs(test_file)
+
+
+###
+# Loads the predictions for a test alongside the Bechdel score and year of each movie. Like evaluate_test, only the
+# first prediction for a movie counts. A title that is not in Bechdel_Data as it is written is looked up by its
+# Title_Index key instead (e.g. "Matrix, The" finds "The Matrix"). Returns the arrays (predicted, score, year), along
+# with the movies that had more than one prediction and the movies that are not in Bechdel_Data.
+###
+def load_test(test_num, bechdel_file="Bechdel_Data", test_file=None, store_file=STORE_FILE):
+    rows, pairs = read_test(test_num, bechdel_file, test_file, store_file)
+    movies = {title: (year, score) for title, year, score in rows}
+    index = TitleIndex(movies=rows)
+    predicted = []
+    scores = []
+    years = []
+    visited = set()
+    duplicates = []
+    unknown = []
+    for movie, passed in pairs:
+        if movie in visited:
+            duplicates.append(movie)
+            continue
+        visited.add(movie)
+        found = movies.get(movie)
+        if found is None:
+            row = index.movie(movie)
+            if row is None:
+                unknown.append(movie)
+                continue
+            found = row[1:]
+        predicted.append(passed == "True")
+        years.append(found[0])
+        scores.append(found[1])
+    return (numpy.array(predicted, dtype=bool), numpy.array(scores, dtype=numpy.int64),
+            numpy.array(years, dtype=numpy.int64), duplicates, unknown)
+
+
+###
+# Works out every metric from an array of confusion matrices (shape [..., 4], in the order of CELLS). Metrics with an
+# empty denominator are nan.
+###
+def metrics(counts):
+    counts = numpy.asarray(counts, dtype=float)
+    true_neg, false_neg, false_pos, true_pos = [counts[..., cell] for cell in range(4)]
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        return {
+            'accuracy': (true_pos + true_neg) / counts.sum(axis=-1),
+            'recall_pos': true_pos / (true_pos + false_neg),
+            'precision_pos': true_pos / (true_pos + false_pos),
+            'recall_neg': true_neg / (true_neg + false_pos),
+            'precision_neg': true_neg / (true_neg + false_neg)
+        }
+
+
+###
+# Turns a nan into None, so that it comes out as null in JSON
+###
+def number(value):
+    value = float(value)
+    return None if numpy.isnan(value) else value
+
+
+###
+# The confusion matrix and metrics of every group, counted in one bincount. groups is an array of group keys (e.g. the
+# year of each movie) and cells is the confusion matrix cell of each movie.
+###
+def group_breakdown(groups, cells):
+    keys, group_ids = numpy.unique(groups, return_inverse=True)
+    counts = numpy.bincount(group_ids * 4 + cells, minlength=len(keys) * 4).reshape(len(keys), 4)
+    group_metrics = metrics(counts)
+    breakdown = []
+    for group, key in enumerate(keys):
+        row = {'group': int(key)}
+        row.update({cell: int(counts[group, index]) for index, cell in enumerate(CELLS)})
+        row.update({metric: number(group_metrics[metric][group]) for metric in METRICS})
+        breakdown.append(row)
+    return breakdown
+
+
+###
+# Bootstrap confidence intervals for every metric: the movies are resampled with replacement resamples times, and the
+# interval is the middle confidence fraction of the metric over all resamples.
+###
+def bootstrap_intervals(cells, resamples=1000, confidence=0.95, seed=0):
+    if len(cells) == 0 or resamples == 0:
+        return {metric: [None, None] for metric in METRICS}
+    random = numpy.random.default_rng(seed)
+    samples = cells[random.integers(0, len(cells), (resamples, len(cells)))]
+    counts = numpy.bincount((numpy.arange(resamples)[:, None] * 4 + samples).ravel(),
+                            minlength=resamples * 4).reshape(resamples, 4)
+    intervals = {}
+    tail = 100 * (1 - confidence) / 2
+    for metric, values in metrics(counts).items():
+        if numpy.all(numpy.isnan(values)):
+            intervals[metric] = [None, None]
+        else:
+            intervals[metric] = [number(numpy.nanpercentile(values, tail)),
+                                 number(numpy.nanpercentile(values, 100 - tail))]
+    return intervals
+
+
+###
+# Evaluates a single test, and returns its report as a dictionary.
+###
+def evaluate(test_num, bechdel_file="Bechdel_Data", test_file=None, resamples=1000, confidence=0.95, seed=0):
+    predicted, scores, years, duplicates, unknown = load_test(test_num, bechdel_file, test_file)
+    actual = scores >= test_num
+    cells = 2 * predicted.astype(numpy.int64) + actual.astype(numpy.int64)
+    counts = numpy.bincount(cells, minlength=4)
+    overall = metrics(counts)
+    return {
+        'test': test_num,
+        'total': int(len(cells)),
+        'confusion': {cell: int(counts[index]) for index, cell in enumerate(CELLS)},
+        'metrics': {metric: number(overall[metric]) for metric in METRICS},
+        'intervals': bootstrap_intervals(cells, resamples, confidence, seed),
+        'confidence': confidence,
+        'by_year': group_breakdown(years, cells),
+        'by_decade': group_breakdown(years // 10 * 10, cells),
+        'duplicates': duplicates,
+        'unknown': unknown
+    }
+
+
+###
+# Evaluates every test, and returns a report with one entry per test.
+###
+def evaluation_report(tests=(1, 2, 3), bechdel_file="Bechdel_Data", resamples=1000, confidence=0.95, seed=0):
+    return {'tests': [evaluate(test_num, bechdel_file, None, resamples, confidence, seed) for test_num in tests]}
+
+
+def write_report_json(report, filename):
+    with open(filename, 'w') as report_file:
+        json.dump(report, report_file, indent=2)
+
+
+###
+# Writes a report as one CSV row per test, year and decade
+###
+def write_report_csv(report, filename):
+    with open(filename, 'w', newline='') as report_file:
+        writer = csv.writer(report_file)
+        writer.writerow(['test', 'breakdown', 'group'] + CELLS + METRICS)
+        for test in report['tests']:
+            writer.writerow([test['test'], 'all', ''] + [test['confusion'][cell] for cell in CELLS] +
+                            [test['metrics'][metric] for metric in METRICS])
+            for breakdown in ['by_year', 'by_decade']:
+                for row in test[breakdown]:
+                    writer.writerow([test['test'], breakdown, row['group']] + [row[cell] for cell in CELLS] +
+                                    [row[metric] for metric in METRICS])
+
+
+if __name__ == "__main__":
+    write_report_json(evaluation_report(), "Evaluation.json")
@@ -0,0 +1,76 @@
+"""
+A local SQLite store of character genders, so that the gender of a character only has to be looked up on Bing once.
+
+Every entry is keyed by (movie, character) and remembers where its gender came from:
+    "subtitle":   The subtitle of the Bing entity box said "Actor" or "Actress"
+    "snippet":    The snippet about the actor/actress said "actor" or "actress"
+    "actor_name": The name of the actor/actress was run through the name classifier
+    "name":       Bing did not help, so the name of the character itself was run through the name classifier
+    "default":    The character has no name
+    "characters_file": Imported from a file in the Characters directory
+
+Entries expire after TTL seconds. Entries that came from the "name" fallback are negative results (Bing had nothing
+useful to say), and they expire after the shorter NEGATIVE_TTL so that the lookup is eventually tried again.
+"""
+
+import sqlite3
+import time
+import os
+
+
+CACHE_FILE = './Genders.db'
+
+TTL = 180 * 24 * 60 * 60
+NEGATIVE_TTL = 14 * 24 * 60 * 60
+
+
+class GenderCache:
+    def __init__(self, path=CACHE_FILE, ttl=TTL, negative_ttl=NEGATIVE_TTL):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS genders (movie TEXT, character TEXT, gender TEXT, "
+                                "source TEXT, resolved REAL, PRIMARY KEY (movie, character))")
+
+    ###
+    # Returns a dictionary of character -> (gender, source) for every character of the movie that has an entry that
+    # has not expired yet. Characters without a (fresh) entry are simply left out.
+    ###
+    def lookup(self, movie, characters):
+        characters = set(characters)
+        now = time.time()
+        found = {}
+        for character, gender, source, resolved in self.connection.execute(
+                "SELECT character, gender, source, resolved FROM genders WHERE movie = ?", (movie,)):
+            ttl = self.negative_ttl if source == "name" else self.ttl
+            if character in characters and now - resolved < ttl:
+                found[character] = (gender, source)
+        return found
+
+    ###
+    # Stores a dictionary of character -> (gender, source) for a movie.
+    ###
+    def store(self, movie, genders):
+        now = time.time()
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO genders VALUES (?, ?, ?, ?, ?)",
+                                        [(movie, character, gender, source, now)
+                                         for character, (gender, source) in genders.items()])
+
+    def close(self):
+        self.connection.close()
+
+
+###
+# Fills the cache from the files written by make_genders_files, so the genders that were already looked up do not
+# have to be looked up again.
+###
+def import_character_files(cache, character_path='./Characters/'):
+    for movie in os.listdir(character_path):
+        genders = {}
+        with open(os.path.join(character_path, movie)) as character_file:
+            for line in character_file:
+                data = line.rsplit(",", 1)
+                if len(data) == 2:
+                    genders[data[0].strip()] = (data[1].strip(), "characters_file")
+        cache.store(movie, genders)
@@ -0,0 +1,192 @@
+"""
+Opt-in timers and counters for the stages of Script_Tagger, so that a slow corpus run can be broken down into file
+I/O, tagging, Bing round-trips, classification and the tests themselves.
+
+Nothing is recorded until enable() is called (or the BECHDEL_INSTRUMENTATION environment variable is set). While
+disabled, count() returns straight away and timed functions are called directly, so the hooks cost a single check.
+
+Counters have a name and optional labels, e.g. count("lines_tagged", 10, tag="D"). Timers record the number of calls
+and total seconds spent in a stage. Everything recorded can be appended to a structured (JSON lines) log with
+write_log, or written as a Prometheus text file with write_prometheus.
+
+profile_movie runs cProfile and tracemalloc around a single movie on demand. They are only imported when it is
+called, so that importing this module (which Script_Tagger always does) stays cheap.
+"""
+
+import os
+import io
+import time
+import json
+import functools
+
+
+ENABLED = os.environ.get("BECHDEL_INSTRUMENTATION", "") not in ["", "0"]
+
+METRIC_PREFIX = "bechdel_"
+
+# (name, labels) -> value, where labels is a sorted tuple of (label, value) pairs
+_counters = {}
+# stage -> [calls, seconds]
+_timers = {}
+
+
+def enable():
+    global ENABLED
+    ENABLED = True
+
+
+def disable():
+    global ENABLED
+    ENABLED = False
+
+
+def reset():
+    _counters.clear()
+    _timers.clear()
+
+
+def count(name, amount=1, **labels):
+    if not ENABLED:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    _counters[key] = _counters.get(key, 0) + amount
+
+
+def record_time(stage, seconds):
+    timer = _timers.setdefault(stage, [0, 0.0])
+    timer[0] += 1
+    timer[1] += seconds
+
+
+###
+# A context manager that times a block of code as a stage. It does nothing while instrumentation is disabled.
+###
+class timer:
+    def __init__(self, stage):
+        self.stage = stage
+        self.start = None
+
+    def __enter__(self):
+        if ENABLED:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exception):
+        if self.start is not None:
+            record_time(self.stage, time.perf_counter() - self.start)
+            self.start = None
+
+
+###
+# A decorator that times every call of a function as a stage.
+###
+def timed(stage):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record_time(stage, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+###
+# Everything recorded so far, as a dictionary of counters and timers.
+###
+def snapshot():
+    return {
+        "counters": [{"name": name, "labels": dict(labels), "value": value}
+                     for (name, labels), value in sorted(_counters.items())],
+        "timers": [{"stage": stage, "calls": calls, "seconds": seconds}
+                   for stage, (calls, seconds) in sorted(_timers.items())]
+    }
+
+
+###
+# Appends a snapshot to a JSON lines log, along with the time and any extra fields (e.g. the movie or run name).
+###
+def write_log(filename, **fields):
+    entry = {"time": time.time()}
+    entry.update(fields)
+    entry.update(snapshot())
+    with open(filename, 'a') as log:
+        log.write(json.dumps(entry, sort_keys=True) + "\n")
+
+
+def prometheus_labels(labels):
+    if len(labels) == 0:
+        return ""
+    return "{" + ",".join(label + '="' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+                          for label, value in labels) + "}"
+
+
+###
+# Writes everything recorded so far in the Prometheus text format. Counters become <prefix><name>_total, and timers
+# become <prefix>stage_calls_total and <prefix>stage_seconds_total with a stage label. The file is written to a
+# temporary file first, so that a collector never reads half of it.
+###
+def write_prometheus(filename):
+    lines = []
+    names = sorted(set(name for name, labels in _counters))
+    for name in names:
+        lines.append("# TYPE " + METRIC_PREFIX + name + "_total counter")
+        for (counter, labels), value in sorted(_counters.items()):
+            if counter == name:
+                lines.append(METRIC_PREFIX + name + "_total" + prometheus_labels(labels) + " " + str(value))
+    if len(_timers) > 0:
+        lines.append("# TYPE " + METRIC_PREFIX + "stage_calls_total counter")
+        for stage, (calls, seconds) in sorted(_timers.items()):
+            lines.append(METRIC_PREFIX + "stage_calls_total" + prometheus_labels([("stage", stage)]) + " " +
+                         str(calls))
+        lines.append("# TYPE " + METRIC_PREFIX + "stage_seconds_total counter")
+        for stage, (calls, seconds) in sorted(_timers.items()):
+            lines.append(METRIC_PREFIX + "stage_seconds_total" + prometheus_labels([("stage", stage)]) + " " +
+                         repr(seconds))
+    with open(filename + '.tmp', 'w') as metrics:
+        metrics.write("\n".join(lines) + "\n")
+    os.replace(filename + '.tmp', filename)
+
+
+###
+# Runs function(movie) under cProfile and tracemalloc, and returns a dictionary with the result of the function, the
+# profile (the top functions by sort, as text), the peak traced memory in bytes, and the top allocation sites. The
+# function defaults to Script_Tagger.evaluate_movie, and unless cold is False, the parse of the movie is thrown away
+# first so that the tagging shows up in the profile as well.
+###
+def profile_movie(movie, function=None, cold=True, sort="cumulative", top=25, profile_file=None):
+    import pstats
+    import cProfile
+    import tracemalloc
+    import Script_Tagger
+    if function is None:
+        function = Script_Tagger.evaluate_movie
+    if cold:
+        Script_Tagger.forget_parse(movie)
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    profiler = cProfile.Profile()
+    try:
+        result = profiler.runcall(function, movie)
+        current, peak = tracemalloc.get_traced_memory()
+        allocations = tracemalloc.take_snapshot().statistics('lineno')[:top]
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+    if profile_file is not None:
+        profiler.dump_stats(profile_file)
+    profile_text = io.StringIO()
+    pstats.Stats(profiler, stream=profile_text).sort_stats(sort).print_stats(top)
+    return {
+        "movie": movie,
+        "result": result,
+        "profile": profile_text.getvalue(),
+        "peak_memory": peak,
+        "allocations": [str(allocation) for allocation in allocations]
+    }
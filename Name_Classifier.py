@@ -0,0 +1,314 @@
+"""
+The name-gender classifier that backs up the Bing gender lookups in Script_Tagger.
+
+Training the classifier on the NLTK names corpus takes several seconds, and used to be done every time a test was run
+(and would be done again by every worker of a process pool). Instead, the classifier is trained once and saved to a
+versioned directory in MODEL_PATH, then loaded lazily the first time it is needed and kept for the rest of the process.
+Its probability table is memory-mapped, so every process that loads it shares the same read-only pages.
+
+The classifier itself (NameGenderClassifier) is a Naive Bayes classifier over the same features as name_features, but
+instead of building a dictionary of about 60 features for every name, a whole list of names is encoded into a matrix
+with one column per feature, where each entry is the index of that feature's value in a single table of log
+probabilities. Scoring a list of names is then a single lookup-and-sum over that table. It is trained and smoothed
+exactly the way nltk.NaiveBayesClassifier.train does it, so it makes the same predictions as the NLTK classifier
+(train_nltk_classifier) trained on the same names.
+"""
+
+import numpy
+import json
+import os
+import tempfile
+import Instrumentation
+
+
+MODEL_PATH = './Models/'
+
+# Bump this whenever name_features or the training data change, so that the old saved classifier is not used.
+MODEL_VERSION = 2
+
+LETTERS = 'abcdefghijklmnopqrstuvwxyz'
+
+# The features of name_features that have string values, and the length a name needs to have each of them
+STRING_FEATURES = [('last_letter', 1), ('first_letter', 1), ('name', 1), ('last_two', 2), ('first_two', 2),
+                   ('last_three', 3), ('first_three', 3)]
+
+# The classifier loaded by this process
+_classifier = None
+
+
+###
+# This name_features method is used by the gender classifier in order to determine the gender of a name
+# (This is used as a backoff from the bing-powered gender classification
+#
+# Note: This name_features function is a slight augmentation of the one that can be found in the NLTK
+# online book at http://www.nltk.org/book/ch06.html
+###
+def name_features(name):
+    # Slices rather than indexes, so that an empty name (e.g. from a character line with no capital letters) has
+    # empty features instead of raising
+    features = {
+        'last_letter': name[-1:],
+        'first_letter': name[:1],
+        'name': name
+    }
+    for letter in 'abcdefghijklmnopqrstuvwxyz':
+        features["count({})".format(letter)] = name.lower().count(letter)
+        features["has({})".format(letter)] = (letter in name.lower())
+    if len(name) > 1:
+        features['last_two'] = name[-2:]
+        features['first_two'] = name[:2]
+    if len(name) > 2:
+        features['last_three'] = name[-3:]
+        features['first_three'] = name[:3]
+    return features
+
+
+###
+# The value of each of the STRING_FEATURES of a name (or None if the name is too short to have it)
+###
+def string_features(name):
+    if len(name) == 0:
+        return [None] * len(STRING_FEATURES)
+    return [name[-1], name[0], name,
+            name[-2:] if len(name) > 1 else None, name[:2] if len(name) > 1 else None,
+            name[-3:] if len(name) > 2 else None, name[:3] if len(name) > 2 else None]
+
+
+###
+# Counts how many times each letter appears in each (lowercased) name, as a names x 26 matrix. This is the count(x)
+# feature of name_features, and has(x) is just count(x) > 0.
+###
+def letter_counts(names):
+    lowered = [name.lower().encode('utf-8') for name in names]
+    lengths = numpy.array([len(name) for name in lowered], dtype=numpy.int64)
+    characters = numpy.frombuffer(b''.join(lowered), dtype=numpy.uint8).astype(numpy.int64) - ord('a')
+    rows = numpy.repeat(numpy.arange(len(names)), lengths)
+    is_letter = (characters >= 0) & (characters < 26)
+    counts = numpy.bincount(rows[is_letter] * 26 + characters[is_letter], minlength=len(names) * 26)
+    return counts.reshape(len(names), 26)
+
+
+###
+# The Naive Bayes name-gender classifier. Every feature value seen in training has a slot in the log_probs table
+# (labels x slots), every feature also has one slot for values that were never seen in training, and the last slot
+# of the table is all zeros, for features that a name does not have.
+###
+class NameGenderClassifier:
+    def __init__(self, labels, log_priors, log_probs, vocabulary):
+        self.labels = labels
+        self.log_priors = log_priors
+        self.log_probs = log_probs
+        # Maps each string feature's values to their slots
+        self.vocabulary = vocabulary
+        # The slot for an unseen value of each feature, in the order STRING_FEATURES, count(a-z), has(a-z)
+        self.unseen = vocabulary['unseen']
+        # count_slots[letter, count] is the slot of count(letter) == count, and has_slots[letter, 0/1] is the slot of
+        # has(letter) == False/True
+        self.count_slots = numpy.asarray(vocabulary['count_slots'], dtype=numpy.int64)
+        self.has_slots = numpy.asarray(vocabulary['has_slots'], dtype=numpy.int64)
+        self.absent = log_probs.shape[1] - 1
+        # Ties between labels go to the label that compares greatest, just like nltk's DictionaryProbDist.max()
+        self.label_order = sorted(range(len(labels)), key=lambda label: labels[label], reverse=True)
+
+    ###
+    # Encodes a list of names as a names x features matrix of slots in the log_probs table. The string_features of
+    # the names can be passed in if they have already been worked out.
+    ###
+    def encode(self, names, features=None):
+        encoded = numpy.empty((len(names), len(STRING_FEATURES) + 52), dtype=numpy.int64)
+        if features is None:
+            features = [string_features(name) for name in names]
+        for feature, (fname, min_length) in enumerate(STRING_FEATURES):
+            values = self.vocabulary[fname]
+            unseen = self.unseen[feature]
+            encoded[:, feature] = [values.get(name_features[feature], unseen) if len(name) >= min_length
+                                   else self.absent for name, name_features in zip(names, features)]
+        counts = letter_counts(names)
+        max_count = self.count_slots.shape[1] - 1
+        letters = numpy.arange(26)
+        # Counts higher than any count seen in training land on the last column, which holds the unseen slot
+        encoded[:, len(STRING_FEATURES):len(STRING_FEATURES) + 26] = \
+            self.count_slots[letters, numpy.minimum(counts, max_count)]
+        encoded[:, len(STRING_FEATURES) + 26:] = self.has_slots[letters, (counts > 0).astype(numpy.int64)]
+        return encoded
+
+    ###
+    # Returns the gender of every name in a list of names.
+    ###
+    def classify_names(self, names):
+        if len(names) == 0:
+            return []
+        scores = self.log_priors[:, None] + self.log_probs[:, self.encode(names)].sum(axis=2)
+        best = numpy.argmax(scores[self.label_order], axis=0)
+        return [self.labels[self.label_order[label]] for label in best]
+
+    ###
+    # Classifies a single name_features dictionary, so that this can stand in for the NLTK classifier.
+    ###
+    def classify(self, features):
+        return self.classify_names([features['name']])[0]
+
+
+###
+# Trains a NameGenderClassifier on a list of (name, gender) pairs. This mirrors nltk.NaiveBayesClassifier.train with
+# its default ELEProbDist estimator: P(value | label, feature) = (count + 0.5) / (N_label + 0.5 * B_feature), where
+# B_feature is the number of distinct values the feature took in training (plus one if some name did not have the
+# feature at all).
+###
+def train_model(training_names):
+    labels = list(dict.fromkeys(gender for name, gender in training_names))
+    names = [name for name, gender in training_names]
+    label_ids = numpy.array([labels.index(gender) for name, gender in training_names], dtype=numpy.int64)
+    label_counts = numpy.bincount(label_ids, minlength=len(labels))
+
+    # Give every value of every feature a slot, feature by feature
+    vocabulary = {'unseen': []}
+    feature_slots = []
+    slot = 0
+    features = [string_features(name) for name in names]
+    for feature, (fname, min_length) in enumerate(STRING_FEATURES):
+        values = list(dict.fromkeys(name_features[feature] for name_features in features
+                                    if name_features[feature] is not None))
+        vocabulary[fname] = {value: slot + index for index, value in enumerate(values)}
+        feature_slots.append((slot, len(values), any(name_features[feature] is None for name_features in features)))
+        slot += len(values)
+        vocabulary['unseen'].append(slot)
+        slot += 1
+    counts = letter_counts(names)
+    max_count = int(counts.max()) if len(names) > 0 else 0
+    count_slots = numpy.empty((26, max_count + 2), dtype=numpy.int64)
+    for letter in range(26):
+        values = numpy.unique(counts[:, letter])
+        count_slots[letter, :] = slot + len(values)
+        count_slots[letter, values] = slot + numpy.arange(len(values))
+        feature_slots.append((slot, len(values), False))
+        slot += len(values)
+        vocabulary['unseen'].append(slot)
+        slot += 1
+    has_slots = numpy.empty((26, 2), dtype=numpy.int64)
+    for letter in range(26):
+        values = numpy.unique(counts[:, letter] > 0)
+        has_slots[letter, :] = slot + len(values)
+        has_slots[letter, values.astype(numpy.int64)] = slot + numpy.arange(len(values))
+        feature_slots.append((slot, len(values), False))
+        slot += len(values)
+        vocabulary['unseen'].append(slot)
+        slot += 1
+    vocabulary['count_slots'] = count_slots.tolist()
+    vocabulary['has_slots'] = has_slots.tolist()
+    absent = slot
+    # NLTK ignores features that never showed up in training at all
+    for feature, (first_slot, num_values, has_missing) in enumerate(feature_slots[:len(STRING_FEATURES)]):
+        if num_values == 0:
+            vocabulary['unseen'][feature] = absent
+
+    # Count how often each slot was used for each label. The absent slot soaks up the features names did not have.
+    model = NameGenderClassifier(labels, None, numpy.zeros((len(labels), absent + 1)), vocabulary)
+    encoded = model.encode(names, features)
+    slot_counts = numpy.zeros((len(labels), absent + 1))
+    for label in range(len(labels)):
+        slot_counts[label] = numpy.bincount(encoded[label_ids == label].ravel(), minlength=absent + 1)
+
+    log_probs = numpy.zeros((len(labels), absent + 1))
+    for first_slot, num_values, has_missing in feature_slots:
+        bins = num_values + (1 if has_missing else 0)
+        denominators = label_counts[:, None] + 0.5 * bins
+        log_probs[:, first_slot:first_slot + num_values + 1] = \
+            numpy.log2((slot_counts[:, first_slot:first_slot + num_values + 1] + 0.5) / denominators)
+    log_probs[:, absent] = 0
+    log_priors = numpy.log2((label_counts + 0.5) / (label_counts.sum() + 0.5 * len(labels)))
+    return NameGenderClassifier(labels, log_priors, log_probs, vocabulary)
+
+
+###
+# The NLTK corpus of male and female names, as (name, gender) pairs
+###
+def training_names():
+    from nltk.corpus import names
+
+    return [(name, 'male') for name in names.words('male.txt')] + \
+           [(name, 'female') for name in names.words('female.txt')]
+
+
+###
+# Trains the name classifier on the NLTK corpus of male and female names.
+###
+def train_classifier():
+    return train_model(training_names())
+
+
+###
+# The original NLTK classifier, which train_classifier replaces. Kept around to check that the two agree.
+###
+def train_nltk_classifier():
+    import nltk
+    feature_sets = [(name_features(name), gender) for (name, gender) in training_names()]
+    return nltk.NaiveBayesClassifier.train(feature_sets)
+
+
+def model_directory():
+    return MODEL_PATH + "name_classifier-v" + str(MODEL_VERSION) + "/"
+
+
+###
+# Writes an array to a temporary file next to filename and then moves it into place, since load_classifier
+# memory-maps the saved arrays and another process could otherwise map one that is only half written.
+###
+def save_array(filename, array):
+    descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(filename), suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as array_file:
+            numpy.save(array_file, array)
+        os.replace(temporary, filename)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+
+###
+# Saves a classifier as .npy arrays (so the probability table can be memory-mapped) plus a JSON vocabulary.
+###
+def save_classifier(classifier):
+    directory = model_directory()
+    os.makedirs(directory, exist_ok=True)
+    save_array(directory + 'log_priors.npy', classifier.log_priors)
+    save_array(directory + 'log_probs.npy', classifier.log_probs)
+    # The vocabulary is written last, so a half-saved classifier is never loaded
+    with open(directory + 'vocabulary.json.tmp', 'w') as vocabulary:
+        json.dump({'labels': classifier.labels, 'vocabulary': classifier.vocabulary}, vocabulary)
+    os.replace(directory + 'vocabulary.json.tmp', directory + 'vocabulary.json')
+
+
+###
+# Returns the classifier, loading it from its saved files (or training and saving it, if there is no saved classifier
+# for the current MODEL_VERSION) the first time it is asked for.
+###
+def load_classifier():
+    global _classifier
+    if _classifier is None:
+        directory = model_directory()
+        if os.path.exists(directory + 'vocabulary.json'):
+            with open(directory + 'vocabulary.json', 'r') as vocabulary:
+                saved = json.load(vocabulary)
+            _classifier = NameGenderClassifier(saved['labels'], numpy.load(directory + 'log_priors.npy'),
+                                               numpy.load(directory + 'log_probs.npy', mmap_mode='r'),
+                                               saved['vocabulary'])
+        else:
+            _classifier = train_classifier()
+            save_classifier(_classifier)
+    return _classifier
+
+
+###
+# Classifies a whole list of names in one call, and returns their genders in the same order. This works with both a
+# NameGenderClassifier and an NLTK classifier; for the NLTK one, names that show up more than once only have their
+# features built and classified once.
+###
+def classify_many(classifier, names):
+    Instrumentation.count("classifier_calls")
+    Instrumentation.count("names_classified", len(names))
+    if hasattr(classifier, 'classify_names'):
+        return classifier.classify_names(names)
+    unique_names = list(dict.fromkeys(names))
+    genders = dict(zip(unique_names, classifier.classify_many([name_features(name) for name in unique_names])))
+    return [genders[name] for name in names]
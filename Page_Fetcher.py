@@ -0,0 +1,283 @@
+"""
+This is the fetch layer shared by Result_Data_Scraper and Script_Data_Scraper. Instead of making one blocking
+request.urlopen call after another, pages are fetched concurrently from an asyncio event loop:
+
+    - Connections are kept alive and reused (one pool of http.client connections per host)
+    - The number of requests in flight, and the time between two requests to the same host, are both limited so that
+      we do not hammer bechdeltest.com or IMSDb
+    - 5xx responses and refused connections are retried with a jittered exponential backoff
+    - Progress is recorded to a file as each page is handled, so a crashed scrape picks up where it left off instead
+      of starting over from the first page
+
+serve_canned_pages starts a local HTTP server that serves a dictionary of canned pages, so that the scrapers can be
+pointed at it and run without touching the network.
+"""
+
+import asyncio
+import http.client
+import http.server
+import concurrent.futures
+import threading
+import random
+import json
+import time
+import os
+from urllib import parse
+
+
+# The maximum number of requests in flight at once
+CONCURRENCY = 8
+
+# The minimum number of seconds between the start of two requests to the same host
+HOST_INTERVAL = 0.1
+
+# How many times a request is retried after a 5xx response or a refused connection, and the base backoff in seconds
+RETRIES = 4
+BACKOFF = 0.5
+
+TIMEOUT = 30
+MAX_REDIRECTS = 5
+USER_AGENT = "Bechdel-Scraper"
+
+
+###
+# A fetched page. headers is a dictionary with lowercased header names.
+###
+class Response:
+    def __init__(self, url, status, headers, body):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def text(self, encoding='iso-8859-1'):
+        return self.body.decode(encoding)
+
+
+###
+# Keeps idle keep-alive connections around so that they can be reused by the next request to the same host. The
+# blocking requests are made from a thread pool, so the pool itself is guarded by a lock.
+###
+class ConnectionPool:
+    def __init__(self, timeout=TIMEOUT):
+        self.timeout = timeout
+        self.idle = {}
+        self.lock = threading.Lock()
+
+    def get(self, scheme, host):
+        with self.lock:
+            connections = self.idle.get((scheme, host))
+            if connections:
+                return connections.pop(), True
+        if scheme == 'https':
+            return http.client.HTTPSConnection(host, timeout=self.timeout), False
+        return http.client.HTTPConnection(host, timeout=self.timeout), False
+
+    def release(self, scheme, host, connection):
+        with self.lock:
+            self.idle.setdefault((scheme, host), []).append(connection)
+
+    def close(self):
+        with self.lock:
+            for connections in self.idle.values():
+                for connection in connections:
+                    connection.close()
+            self.idle = {}
+
+
+###
+# The fetcher itself. fetch() is a coroutine that returns a Response for any status code, except that 5xx responses
+# and refused connections are retried first. It only raises once it has run out of retries.
+###
+class PageFetcher:
+    def __init__(self, concurrency=CONCURRENCY, host_interval=HOST_INTERVAL, retries=RETRIES, backoff=BACKOFF,
+                 timeout=TIMEOUT):
+        self.concurrency = concurrency
+        self.host_interval = host_interval
+        self.retries = retries
+        self.backoff = backoff
+        self.pool = ConnectionPool(timeout)
+        self.executor = concurrent.futures.ThreadPoolExecutor(concurrency)
+        self.semaphore = None
+        self.host_locks = {}
+        self.next_request = {}
+
+    async def fetch(self, url, headers=None):
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.retries + 1):
+            # Waiting for the host and backing off happen outside the semaphore, so that a request that is waiting
+            # does not keep another one from using its slot
+            await self.wait_for_host(parse.urlsplit(url).netloc)
+            async with self.semaphore:
+                try:
+                    response = await loop.run_in_executor(self.executor, self.request, url, headers or {})
+                except ConnectionRefusedError:
+                    if attempt == self.retries:
+                        raise
+                    print("Connection Refused: " + url)
+                else:
+                    if response.status < 500 or attempt == self.retries:
+                        return response
+            await asyncio.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+
+    ###
+    # Waits until the host is allowed another request, so that requests to one host are spaced out by host_interval
+    ###
+    async def wait_for_host(self, host):
+        lock = self.host_locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            delay = self.next_request.get(host, 0) - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.next_request[host] = time.monotonic() + self.host_interval
+
+    ###
+    # Makes a blocking GET request on a pooled connection, following redirects. This runs on the thread pool.
+    ###
+    def request(self, url, headers):
+        headers = dict(headers)
+        headers.setdefault('User-Agent', USER_AGENT)
+        for redirect in range(MAX_REDIRECTS + 1):
+            split_url = parse.urlsplit(url)
+            path = split_url.path or '/'
+            if split_url.query:
+                path += '?' + split_url.query
+            status, response_headers, body = self.send(split_url.scheme, split_url.netloc, path, headers)
+            if status in (301, 302, 303, 307, 308) and 'location' in response_headers:
+                url = parse.urljoin(url, response_headers['location'])
+                continue
+            break
+        return Response(url, status, response_headers, body)
+
+    def send(self, scheme, host, path, headers):
+        connection, reused = self.pool.get(scheme, host)
+        try:
+            connection.request('GET', path, headers=headers)
+            response = connection.getresponse()
+            body = response.read()
+        except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+            connection.close()
+            # The server hung up on a connection that had been sitting idle, so try again on a new one.
+            if reused:
+                return self.send(scheme, host, path, headers)
+            raise
+        except Exception:
+            connection.close()
+            raise
+        if response.will_close:
+            connection.close()
+        else:
+            self.pool.release(scheme, host, connection)
+        response_headers = {name.lower(): value for name, value in response.getheaders()}
+        return response.status, response_headers, body
+
+    def close(self):
+        self.pool.close()
+        self.executor.shutdown()
+
+
+###
+# Records the outcome of every handled page in a file of JSON lines, so that a scrape can be resumed after a crash.
+# Each record is written and flushed as soon as its page is handled.
+###
+class Progress:
+    def __init__(self, filename):
+        self.filename = filename
+        self.done = {}
+        if os.path.exists(filename):
+            with open(filename, 'r') as progress_file:
+                for line in progress_file:
+                    try:
+                        record = json.loads(line)
+                    # A line that was only partly written when the scraper died
+                    except ValueError:
+                        continue
+                    self.done[record['key']] = record['value']
+        self.progress_file = open(filename, 'a')
+
+    def record(self, key, value):
+        self.done[key] = value
+        self.progress_file.write(json.dumps({'key': key, 'value': value}) + "\n")
+        self.progress_file.flush()
+
+    def close(self):
+        self.progress_file.close()
+
+
+###
+# Fetches every (key, url) job that is not already recorded in progress, and calls handler(key, response) on each
+# response as it comes in. Whatever the handler returns is recorded in progress. If a page cannot be fetched or the
+# handler raises, the error is printed and the job is left unrecorded so that the next run tries it again.
+#
+# headers is either a dictionary of headers for every request, or a function that returns the headers for a url.
+#
+# Returns the dictionary of every recorded key -> value (including the ones from earlier runs).
+###
+async def fetch_all(fetcher, jobs, handler, progress, headers=None):
+    async def fetch_one(key, url):
+        try:
+            response = await fetcher.fetch(url, headers(url) if callable(headers) else headers)
+            progress.record(key, handler(key, response))
+        except Exception as er:
+            print("{} failed: {}: {}".format(url, type(er).__name__, er))
+
+    await asyncio.gather(*[fetch_one(key, url) for key, url in jobs if key not in progress.done])
+    return progress.done
+
+
+###
+# Synchronous wrapper around fetch_all for the scrapers. A fetcher is created (and closed) if one is not passed in.
+# Once every job has been recorded there is nothing left to resume, so the progress file is removed.
+###
+def scrape(jobs, handler, progress_filename, fetcher=None, headers=None):
+    jobs = list(jobs)
+    progress = Progress(progress_filename)
+    own_fetcher = fetcher is None
+    if own_fetcher:
+        fetcher = PageFetcher()
+    try:
+        done = asyncio.run(fetch_all(fetcher, jobs, handler, progress, headers))
+    finally:
+        progress.close()
+        if own_fetcher:
+            fetcher.close()
+    if all(key in done for key, url in jobs):
+        os.remove(progress_filename)
+    return done
+
+
+###
+# Starts a local HTTP server on a background thread that serves canned pages, for running the scrapers offline.
+# pages maps a path (e.g. "/view/1/") to either a body, a (status, body) tuple or a (status, body, headers) tuple.
+# Any other path is a 404. If a page has an ETag header, a request with a matching If-None-Match gets a 304.
+#
+# Returns the server (call server.shutdown() when done) and its base url, e.g. "http://127.0.0.1:54321".
+###
+def serve_canned_pages(pages):
+    class CannedPageHandler(http.server.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            page = pages.get(self.path, (404, 'No such page'))
+            if not isinstance(page, tuple):
+                page = (200, page)
+            status, body, headers = page if len(page) == 3 else page + ({},)
+            if isinstance(body, str):
+                body = body.encode('iso-8859-1')
+            if 'ETag' in headers and self.headers.get('If-None-Match') == headers['ETag']:
+                status, body = 304, b''
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), CannedPageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, "http://127.0.0.1:{}".format(server.server_address[1])
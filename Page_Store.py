@@ -0,0 +1,127 @@
+"""
+A local store of the raw pages fetched by the scrapers, so that refreshing the data does not mean downloading every
+page again.
+
+Page bodies are stored zlib-compressed under the SHA-1 hash of their contents (so a page that comes back unchanged is
+never stored twice), and an index maps each url to the hash of its latest body, along with the ETag and Last-Modified
+headers that came with it and the last time it was checked. Those headers are sent back as a conditional GET the next
+time the page is fetched, so a page that has not changed costs a "304 Not Modified" instead of a full download.
+"""
+
+import hashlib
+import codecs
+import json
+import time
+import zlib
+import os
+
+
+STORE_PATH = './Page_Store/'
+
+# A page is not fetched again until it is at least this many seconds old. Each page's real refresh age is spread out
+# between REFRESH_AGE and twice that (see is_fresh), so that the pages of one big scrape do not all expire on the same
+# night.
+REFRESH_AGE = 30 * 24 * 60 * 60
+
+# The size of the pieces that stream() reads stored pages in
+CHUNK_SIZE = 64 * 1024
+
+
+class PageStore:
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        self.index_file = os.path.join(path, 'index.json')
+        self.index = {}
+        if os.path.exists(self.index_file):
+            with open(self.index_file, 'r') as index_file:
+                self.index = json.load(index_file)
+
+    ###
+    # The headers for a conditional GET of url, based on the last time it was fetched.
+    ###
+    def conditional_headers(self, url):
+        entry = self.index.get(url, {})
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    ###
+    # Whether url was checked recently enough that it does not need to be fetched again
+    ###
+    def is_fresh(self, url, refresh_age=REFRESH_AGE):
+        entry = self.index.get(url)
+        if entry is None:
+            return False
+        spread = int(hashlib.sha1(url.encode('utf-8')).hexdigest()[:8], 16) / 0x100000000
+        return time.time() - entry['checked'] < refresh_age * (1 + spread)
+
+    ###
+    # Records a response for url, and returns whether the page changed since it was last stored. A 304 response (or a
+    # 200 response with the same body as before) is not a change.
+    ###
+    def update(self, url, response):
+        entry = self.index.setdefault(url, {})
+        entry['checked'] = time.time()
+        if response.status == 304:
+            return False
+        changed = entry.get('status') != response.status
+        entry['status'] = response.status
+        if response.status != 200:
+            entry.pop('hash', None)
+            return changed
+        content_hash = hashlib.sha1(response.body).hexdigest()
+        changed = changed or entry.get('hash') != content_hash
+        object_file = self.object_file(content_hash)
+        if not os.path.exists(object_file):
+            os.makedirs(os.path.dirname(object_file), exist_ok=True)
+            with open(object_file + '.tmp', 'wb') as page_file:
+                page_file.write(zlib.compress(response.body))
+            os.replace(object_file + '.tmp', object_file)
+        entry['hash'] = content_hash
+        entry['etag'] = response.headers.get('etag')
+        entry['last_modified'] = response.headers.get('last-modified')
+        return changed
+
+    ###
+    # Returns the body stored for url, or None if there is none.
+    ###
+    def read(self, url):
+        entry = self.index.get(url)
+        if entry is None or 'hash' not in entry:
+            return None
+        with open(self.object_file(entry['hash']), 'rb') as page_file:
+            return zlib.decompress(page_file.read())
+
+    ###
+    # Yields the body stored for url a piece at a time, decompressing it as it goes, so that a big page never has to
+    # be held in memory whole. If an encoding is given, the pieces are decoded to strings. Yields nothing if there is
+    # no body stored for url.
+    ###
+    def stream(self, url, encoding=None, chunk_size=CHUNK_SIZE):
+        entry = self.index.get(url)
+        if entry is None or 'hash' not in entry:
+            return
+        decompressor = zlib.decompressobj()
+        decoder = codecs.getincrementaldecoder(encoding)() if encoding is not None else None
+        with open(self.object_file(entry['hash']), 'rb') as page_file:
+            while True:
+                compressed = page_file.read(chunk_size)
+                chunk = decompressor.decompress(compressed) if compressed else decompressor.flush()
+                if decoder is not None:
+                    chunk = decoder.decode(chunk, final=not compressed)
+                if chunk:
+                    yield chunk
+                if not compressed:
+                    break
+
+    def object_file(self, content_hash):
+        return os.path.join(self.path, 'objects', content_hash[:2], content_hash)
+
+    def save(self):
+        os.makedirs(self.path, exist_ok=True)
+        with open(self.index_file + '.tmp', 'w') as index_file:
+            json.dump(self.index, index_file)
+        os.replace(self.index_file + '.tmp', self.index_file)
@@ -3,38 +3,179 @@ This script goes to the bechdeltest.com website, pulls html data from every movi
 and then pulls from that html data the movie title, and Bechdel rank from the page for the movie the page
 corresponds with. It then writes that data into a text file for training the Bechdel test classification
 algorithm.
+
+The pages are fetched concurrently through Page_Fetcher, and every page that has been handled is recorded in
+PROGRESS_FILE, so if the scraper dies halfway through, running it again only fetches the pages that are left.
+
+Pages are kept in a Page_Store and re-checked with conditional requests, and the parsed rows are kept in ROWS_FILE.
+In incremental mode (the default), only movie ids that have never been scraped or whose page has not been checked
+for a while are requested at all, and the output file is only rewritten if one of the rows actually changed.
+
+The title, year and score are picked out of a page by MoviePageParser in a single pass, which stops reading the page
+as soon as it has all three.
 """
 
-from urllib import request, error
+from Page_Fetcher import scrape
+from Page_Store import PageStore
+import html.parser
+import json
+import os
 import re
 
 
-outfile = open('Bechdel_Data2','w')
-datalines = []
-datalines.append(("{:50}{:7}{}\n\n".format("TITLE",'YEAR','SCORE')))
+BECHDEL_URL = "http://www.bechdeltest.com"
+OUTPUT_FILE = 'Bechdel_Data2'
+PROGRESS_FILE = 'Bechdel_Data2.progress'
+ROWS_FILE = 'Bechdel_Data2.rows'
+
+# The movie ids to scrape (the last one is not included)
+FIRST_ID = 1
+LAST_ID = 6830
+
+
+TITLE_SUFFIX = ' - Bechdel Test Movie List'
+YEAR = re.compile(r'\((\d{4})\)$')
+SCORE = re.compile(r'^\[\[(\d)\]\]$')
+
+
+###
+# An html.parser handler that picks the fields of a movie page out as the page is fed to it:
+#   title: The text of the <title> tag, without TITLE_SUFFIX
+#   year:  The first <span> whose text ends with the year in brackets, e.g. "(2008)"
+#   score: The first tag with an alt text like "[[3]]"
+# missing is set if the page says there is no such movie.
+###
+class MoviePageParser(html.parser.HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = None
+        self.year = None
+        self.score = None
+        self.missing = False
+        self.in_title = False
+        self.title_text = []
+        # The text since the last tag, which is what a year is looked for in when a span closes
+        self.text = []
+
+    def handle_starttag(self, tag, attrs):
+        self.text = []
+        if tag == 'title' and self.title is None:
+            self.in_title = True
+        if self.score is None:
+            for name, value in attrs:
+                score = SCORE.match(value or '') if name == 'alt' else None
+                if score is not None:
+                    self.score = score.group(1)
+                    break
+
+    def handle_endtag(self, tag):
+        if tag == 'title' and self.in_title:
+            self.in_title = False
+            title = ''.join(self.title_text)
+            if title.endswith(TITLE_SUFFIX):
+                self.title = title[:-len(TITLE_SUFFIX)]
+        elif tag == 'span' and self.year is None:
+            year = YEAR.search(''.join(self.text))
+            if year is not None:
+                self.year = year.group(1)
+        self.text = []
+
+    def handle_data(self, data):
+        if 'No such movie!' in data:
+            self.missing = True
+        if self.in_title:
+            self.title_text.append(data)
+        self.text.append(data)
+
+    def done(self):
+        return self.missing or None not in (self.title, self.year, self.score)
+
+
+###
+# Pulls the title, year and Bechdel score out of a movie page (given whole, or as an iterable of pieces), or returns
+# None if there is no movie on the page. Raises a ValueError if the page has a movie, but not all three fields.
+###
+def parse_movie_page(raw_text):
+    parser = MoviePageParser()
+    for chunk in ([raw_text] if isinstance(raw_text, str) else raw_text):
+        parser.feed(chunk)
+        if parser.done():
+            break
+    else:
+        parser.close()
+    if parser.missing:
+        return None
+    if not parser.done():
+        raise ValueError("The movie page is missing its title, year or score")
+    return [parser.title, parser.year, parser.score]
+
+
+###
+# Reads the rows from the last scrape, as a dictionary of movie id -> [title, year, score] (or None for ids that
+# have no movie).
+###
+def read_rows(rows_file=ROWS_FILE):
+    if not os.path.exists(rows_file):
+        return {}
+    with open(rows_file, 'r') as rows:
+        return json.load(rows)
+
+
+def write_rows(rows, rows_file=ROWS_FILE):
+    with open(rows_file + '.tmp', 'w') as rows_out:
+        json.dump(rows, rows_out)
+    os.replace(rows_file + '.tmp', rows_file)
+
+
+###
+# Writes every scraped row to the output file, in movie id order.
+###
+def write_data(rows, output_file=OUTPUT_FILE):
+    datalines = []
+    datalines.append(("{:50}{:7}{}\n\n".format("TITLE", 'YEAR', 'SCORE')))
+    for movie_id in sorted(rows, key=int):
+        if rows[movie_id] is not None:
+            movie_title, movie_year, bechdel_score = rows[movie_id]
+            datalines.append("{:100}{:7}{}\n".format(movie_title, movie_year, bechdel_score))
+    outfile = open(output_file, 'w')
+    outfile.writelines(datalines)
+    outfile.close()
+
+
+###
+# Scrapes the movie pages and rewrites the output file if anything changed. With incremental=False every page is
+# requested again, although unchanged pages still only cost a 304.
+###
+def main(base_url=BECHDEL_URL, first_id=FIRST_ID, last_id=LAST_ID, fetcher=None, incremental=True):
+    store = PageStore()
+    rows = read_rows()
+    urls = {str(x): base_url + "/view/" + str(x) + "/" for x in range(first_id, last_id)}
+    jobs = [(movie_id, url) for movie_id, url in urls.items()
+            if not (incremental and movie_id in rows and store.is_fresh(url))]
+
+    # Only pages that changed (or that we somehow have no row for) get parsed again.
+    def handle_page(movie_id, response):
+        if response.status >= 500:
+            raise IOError("HTTP " + str(response.status))
+        changed = store.update(urls[movie_id], response)
+        if not changed and movie_id in rows:
+            return rows[movie_id]
+        if store.index[urls[movie_id]]['status'] != 200:
+            print(str(response.status) + ' error at ' + urls[movie_id])
+            return None
+        return parse_movie_page(store.stream(urls[movie_id], "iso-8859-1"))
 
-for x in range(1,6830):
-    url = "http://www.bechdeltest.com/view/"+str(x)+"/"
     try:
-        raw_text = request.urlopen(url).read().decode("iso-8859-1")
-        error_check = re.search(r'No such movie!',raw_text)
-        if not error_check:
-            movie_title = re.search(r'<title>(.*?) - Bechdel Test Movie List</title>', raw_text).group(1)
-            movie_year = re.search(r'\((\d{4})\)</span>', raw_text).group(1)
-            bechdel_score = re.search(r'alt="\[\[(\d)\]\]"', raw_text).group(1)
-            datalines.append("{:100}{:7}{}\n".format(movie_title
-                                                    .replace('&#39;',"'")
-                                                    .replace('&amp;','&'), movie_year, bechdel_score))
-    except error.HTTPError as er:
-        if er.code == 404:
-            print('404 error at http://www.bechdeltest.com/view/'+str(x))
-            continue
-        else:
-            continue
-    except error.URLError as er:
-        if er.errno == 111:
-            print("Connection Refused")
-        else:
-            continue
-
-outfile.writelines(datalines)
\ No newline at end of file
+        scraped = scrape(jobs, handle_page, PROGRESS_FILE, fetcher, store.conditional_headers)
+    finally:
+        store.save()
+    changed_rows = {movie_id: row for movie_id, row in scraped.items() if rows.get(movie_id, False) != row}
+    print(str(len(jobs)) + " pages requested, " + str(len(changed_rows)) + " rows changed")
+    if changed_rows or not os.path.exists(OUTPUT_FILE):
+        rows.update(changed_rows)
+        write_rows(rows)
+        write_data(rows)
+
+
+if __name__ == "__main__":
+    main()
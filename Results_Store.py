@@ -0,0 +1,281 @@
+"""
+A single SQLite store for the data that is otherwise spread over Bechdel_Data, Parseable, the Characters directory
+and the t1/t2/t3 files.
+
+Tables:
+    movies:         title, year, score            (from Bechdel_Data, keyed by title and year)
+    parse_verdicts: title, well_formatted, sane, parseable
+    characters:     title, character, gender, rank (rank is the character's position in their characters file)
+    predictions:    title, test, passed           (from t1, t2 and t3)
+
+Every table is indexed on title, so joins like "every parseable movie that passed test one" (parseable_passing) are
+index lookups instead of scans of the text files. import_legacy loads everything from the old text files, which are
+parsed from the right so that titles with commas in them survive.
+
+The stages that write Parseable and t1/t2/t3 (Script_Tagger, Corpus_Runner, Shard_Runner and Build_Graph) record the
+same results in the store through save_parseable and save_predictions, and Evaluation reads the predictions and the
+Bechdel scores from the store. The movies table is reloaded from Bechdel_Data whenever the file changes (sync_movies).
+The text files are still written, for anything that reads them, and the store notes the modification time and size of
+each one it was written with, so a test file that has been edited (or written by something else) since is read instead.
+"""
+
+import sqlite3
+import os
+
+
+STORE_FILE = './Results.db'
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS movies (title TEXT, year INTEGER, score INTEGER, PRIMARY KEY (title, year))",
+    "CREATE TABLE IF NOT EXISTS parse_verdicts (title TEXT PRIMARY KEY, well_formatted INTEGER, sane INTEGER, "
+    "parseable INTEGER)",
+    "CREATE TABLE IF NOT EXISTS characters (title TEXT, character TEXT, gender TEXT, rank INTEGER, "
+    "PRIMARY KEY (title, character))",
+    "CREATE TABLE IF NOT EXISTS predictions (title TEXT, test INTEGER, passed INTEGER, PRIMARY KEY (title, test))",
+    "CREATE TABLE IF NOT EXISTS sources (filename TEXT PRIMARY KEY, mtime INTEGER, size INTEGER)",
+    "CREATE INDEX IF NOT EXISTS predictions_by_test ON predictions (test, passed)",
+    "CREATE INDEX IF NOT EXISTS parseable_movies ON parse_verdicts (parseable)"
+]
+
+
+###
+# The modification time and size of a file, or (None, None) if it does not exist
+###
+def file_stamp(filename):
+    try:
+        stat = os.stat(filename)
+    except FileNotFoundError:
+        return None, None
+    return stat.st_mtime_ns, stat.st_size
+
+
+###
+# Reads the fixed-width Bechdel_Data file into a list of (title, year, score) tuples. Lines that are not movies (the
+# header and blank lines) are skipped.
+###
+def read_bechdel_data(filename="Bechdel_Data"):
+    movies = []
+    with open(filename, 'r') as moviesfile:
+        for line in moviesfile:
+            data = line.rsplit(',', 2)
+            if len(data) == 3 and data[1].strip().isdigit() and data[2].strip().isdigit():
+                movies.append((data[0].strip(), int(data[1]), int(data[2])))
+    return movies
+
+
+###
+# Reads a "movie,value" file (t1/t2/t3 or a characters file) into a list of (movie, value) tuples
+###
+def read_pairs(filename):
+    pairs = []
+    with open(filename, 'r') as pairsfile:
+        for line in pairsfile:
+            data = line.rsplit(',', 1)
+            if len(data) == 2:
+                pairs.append((data[0].strip(), data[1].strip()))
+    return pairs
+
+
+class ResultsStore:
+    def __init__(self, path=STORE_FILE):
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            for statement in SCHEMA:
+                self.connection.execute(statement)
+
+    def add_movies(self, movies):
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO movies VALUES (?, ?, ?)", movies)
+
+    ###
+    # Records a list of (title, well_formatted, sane) parse verdicts. With replace=True, they replace every verdict in
+    # the store (in the same transaction, so nobody sees the table half filled).
+    ###
+    def record_parses(self, verdicts, replace=False):
+        with self.connection:
+            if replace:
+                self.connection.execute("DELETE FROM parse_verdicts")
+            self.connection.executemany("INSERT OR REPLACE INTO parse_verdicts VALUES (?, ?, ?, ?)",
+                                        [(title, bool(well_formatted), bool(sane), bool(well_formatted and sane))
+                                         for title, well_formatted, sane in verdicts])
+
+    ###
+    # Marks a list of movies as parseable, for when only the verdict (and not the reasons for it) is known
+    ###
+    def mark_parseable(self, titles):
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO parse_verdicts VALUES (?, NULL, NULL, 1)",
+                                        [(title,) for title in titles])
+
+    ###
+    # Reloads the movies table from Bechdel_Data if the file has changed since it was last loaded
+    ###
+    def sync_movies(self, bechdel_file="Bechdel_Data"):
+        if self.is_current(bechdel_file):
+            return
+        movies = read_bechdel_data(bechdel_file)
+        with self.connection:
+            self.connection.execute("DELETE FROM movies")
+            self.connection.executemany("INSERT OR REPLACE INTO movies VALUES (?, ?, ?)", movies)
+        self.record_source(bechdel_file)
+
+    ###
+    # Notes the modification time and size of a file that the store holds the contents of (Bechdel_Data, or a test
+    # file that was written alongside its predictions), so that is_current can tell if it has been changed since
+    ###
+    def record_source(self, filename):
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?)",
+                                    (filename,) + file_stamp(filename))
+
+    def is_current(self, filename):
+        known = self.connection.execute("SELECT mtime, size FROM sources WHERE filename = ?", (filename,)).fetchone()
+        return known is not None and known == file_stamp(filename)
+
+    ###
+    # Every movie as (title, year, score) tuples, in the order they were added
+    ###
+    def movie_rows(self):
+        return self.connection.execute("SELECT title, year, score FROM movies ORDER BY rowid").fetchall()
+
+    ###
+    # Replaces the characters of a movie with a list of (character, gender) tuples, in order of importance
+    ###
+    def record_characters(self, title, characters):
+        with self.connection:
+            self.connection.execute("DELETE FROM characters WHERE title = ?", (title,))
+            self.connection.executemany("INSERT OR REPLACE INTO characters VALUES (?, ?, ?, ?)",
+                                        [(title, character, gender, rank)
+                                         for rank, (character, gender) in enumerate(characters)])
+
+    ###
+    # Records a list of (title, passed) results for a test, over any earlier predictions for the same titles. Like the
+    # test files, only the first result for a title in the list counts.
+    ###
+    def record_predictions(self, test, results):
+        first = {}
+        for title, passed in results:
+            first.setdefault(title, passed)
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO predictions VALUES (?, ?, ?)",
+                                        [(title, test, bool(passed)) for title, passed in first.items()])
+
+    ###
+    # Replaces every prediction for a test with a list of (title, passed) results. Like the test files, only the first
+    # result for a title counts.
+    ###
+    def replace_predictions(self, test, results):
+        with self.connection:
+            self.connection.execute("DELETE FROM predictions WHERE test = ?", (test,))
+            self.connection.executemany("INSERT OR IGNORE INTO predictions VALUES (?, ?, ?)",
+                                        [(title, test, bool(passed)) for title, passed in results])
+
+    ###
+    # The Bechdel score of every movie, as a dictionary of title -> score. If a title is in Bechdel_Data more than
+    # once, the last one in the file wins (just like in evaluate_test).
+    ###
+    def scores(self):
+        return {title: score for title, score in
+                self.connection.execute("SELECT title, score FROM movies ORDER BY rowid")}
+
+    def parseable_movies(self):
+        return [title for title, in
+                self.connection.execute("SELECT title FROM parse_verdicts WHERE parseable = 1 ORDER BY title")]
+
+    ###
+    # The characters of a movie and a dictionary of their genders, like Script_Tagger.read_characters
+    ###
+    def characters(self, title):
+        rows = self.connection.execute("SELECT character, gender FROM characters WHERE title = ? ORDER BY rank",
+                                       (title,)).fetchall()
+        return [character for character, gender in rows], dict(rows)
+
+    ###
+    # The predictions for a test, as a dictionary of title -> passed, in the order they were recorded
+    ###
+    def predictions(self, test):
+        return {title: bool(passed) for title, passed in
+                self.connection.execute("SELECT title, passed FROM predictions WHERE test = ? ORDER BY rowid",
+                                        (test,))}
+
+    ###
+    # Every parseable movie that passed a test
+    ###
+    def parseable_passing(self, test):
+        return [title for title, in self.connection.execute(
+                "SELECT predictions.title FROM predictions JOIN parse_verdicts "
+                "ON predictions.title = parse_verdicts.title "
+                "WHERE predictions.test = ? AND predictions.passed = 1 AND parse_verdicts.parseable = 1 "
+                "ORDER BY predictions.title", (test,))]
+
+    ###
+    # Every prediction for a test joined with the Bechdel score of the movie, as (title, year, passed, score) tuples.
+    # Predictions for movies that are not in Bechdel_Data are left out, and titles that are in Bechdel_Data more than
+    # once get the last one in the file.
+    ###
+    def scored_predictions(self, test):
+        return self.connection.execute(
+                "SELECT predictions.title, movies.year, predictions.passed, movies.score FROM predictions "
+                "JOIN movies ON movies.rowid = (SELECT MAX(rowid) FROM movies AS latest "
+                "WHERE latest.title = predictions.title) "
+                "WHERE predictions.test = ?", (test,)).fetchall()
+
+    ###
+    # Writes the predictions for a test back out in the old "movie,True" format
+    ###
+    def export_test_file(self, test, filename):
+        with open(filename, 'w') as testfile:
+            for title, passed in self.predictions(test).items():
+                testfile.write(title + "," + str(passed) + "\n")
+
+    def close(self):
+        self.connection.close()
+
+
+###
+# Records the results of a stage in the store at store_file, replacing the ones from the last time it was run.
+# results are (title, passed) tuples for save_predictions, and (title, well_formatted, sane) tuples for
+# save_parseable. filename is the text file that was written with the same results, if any.
+###
+def save_predictions(test, results, filename=None, store_file=STORE_FILE):
+    store = ResultsStore(store_file)
+    try:
+        store.replace_predictions(test, results)
+        if filename is not None:
+            store.record_source(filename)
+    finally:
+        store.close()
+
+
+def save_parseable(results, filename=None, store_file=STORE_FILE):
+    store = ResultsStore(store_file)
+    try:
+        store.record_parses(results, replace=True)
+        if filename is not None:
+            store.record_source(filename)
+    finally:
+        store.close()
+
+
+###
+# Loads everything from the old text files (whichever of them exist) into a store.
+###
+def import_legacy(store, bechdel_file="Bechdel_Data", parseable_file="Parseable", character_path="./Characters/",
+                  test_files=("t1", "t2", "t3")):
+    if os.path.exists(bechdel_file):
+        store.add_movies(read_bechdel_data(bechdel_file))
+    if os.path.exists(parseable_file):
+        with open(parseable_file, 'r') as parseable:
+            store.mark_parseable([movie.strip() for movie in parseable if len(movie.strip()) > 0])
+    if os.path.isdir(character_path):
+        for movie in os.listdir(character_path):
+            store.record_characters(movie, read_pairs(os.path.join(character_path, movie)))
+    for test, test_file in enumerate(test_files, 1):
+        if os.path.exists(test_file):
+            store.replace_predictions(test, [(movie, passed == "True") for movie, passed in read_pairs(test_file)])
+
+
+if __name__ == "__main__":
+    results_store = ResultsStore()
+    import_legacy(results_store)
+    results_store.close()
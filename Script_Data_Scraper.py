@@ -2,11 +2,32 @@
 This script runs through every title in the Bechdel_Data list, and checks if there is a script for it
 on the Internet Movie Script Database. If there is, then it extracts the script from the HTML, and
 writes it to a file in the SCRIPT_PATH for use in the solver algorithm.
+
+The pages are fetched concurrently through Page_Fetcher, and every title that has been handled is recorded in
+PROGRESS_FILE, so if the scraper dies halfway through, running it again only looks up the titles that are left.
+
+Pages are kept in a Page_Store and re-checked with conditional requests. In incremental mode (the default), only
+titles that have not been checked for a while are requested at all, and a script is only extracted and rewritten if
+its page actually changed.
+
+Scripts are pulled out of the pages by ScriptExtractor, which reads the stored page a piece at a time and writes the
+text inside the <pre> tag straight to the script file as it goes, rather than building the whole page in memory.
+
+If a copy of the IMSDb listing has been saved (Title_Index.save_listing), every title is resolved to the script it
+is listed under before anything is fetched, and titles that are not listed are not requested at all. Titles that only
+have a fuzzy match are written to Title_Index.REVIEW_FILE to be checked instead of being fetched.
+
+With a pack_file, the scripts are added to the end of a Script_Pack instead of being written as loose files.
 """
 
-from urllib import request, error
-from bs4 import BeautifulSoup
-import re
+from Page_Fetcher import scrape
+from Page_Store import PageStore
+from Script_Pack import ScriptPack
+from Title_Index import TitleIndex, LISTING_FILE, REVIEW_FILE, MATCHES_FILE
+from Title_Index import read_listing, read_matches, write_matches, script_url
+import html.parser
+import io
+import os
 
 
 __author__ = "Mitch Powell"
@@ -14,11 +35,8 @@ __author__ = "Mitch Powell"
 # The path for the script files to be put into
 SCRIPT_PATH = '/home/mitch/Misc_Programming/NLP/Bechdel/Scripts/'
 
-# Open the Bechdel_Data file, instantiate a title array, skip the first two lines.
-ResultFile = open('Bechdel_Data','r')
-titles = []
-ResultFile.readline()
-ResultFile.readline()
+IMSDB_URL = 'http://www.imsdb.com'
+PROGRESS_FILE = 'Scripts.progress'
 
 
 def write_script(script, title):
@@ -26,30 +44,160 @@ def write_script(script, title):
     scriptfile.write(script)
     scriptfile.close()
 
-# Take every title out of the Bechdel_Data file and put it in the titles list
-for line in ResultFile.readlines():
-    if len(line) > 0:
-        title = line.split(',')[0].strip()
-        titles.append(title)
 
-# Try to find a
-for title in titles:
-    mod_title = '-'.join(title.split())
-    url = 'http://www.imsdb.com/scripts/'+mod_title+'.html'
+###
+# Take every title out of the Bechdel_Data file (skipping the first two lines) and return them as a list
+###
+def read_titles():
+    ResultFile = open('Bechdel_Data','r')
+    titles = []
+    ResultFile.readline()
+    ResultFile.readline()
+    for line in ResultFile.readlines():
+        if len(line) > 0:
+            title = line.rsplit(',', 2)[0].strip()
+            titles.append(title)
+    ResultFile.close()
+    return titles
+
+
+###
+# An html.parser handler that writes the text of the first <pre> tag on a page (including the text of any tags inside
+# of it, with the character references decoded) to output as the page is fed to it.
+###
+class ScriptExtractor(html.parser.HTMLParser):
+    def __init__(self, output):
+        super().__init__(convert_charrefs=True)
+        self.output = output
+        self.depth = 0
+        self.finished = False
+        self.written = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'pre' and not self.finished:
+            self.depth += 1
+
+    def handle_endtag(self, tag):
+        if tag == 'pre' and self.depth > 0:
+            self.depth -= 1
+            self.finished = self.depth == 0
+
+    def handle_data(self, data):
+        if self.depth > 0:
+            self.output.write(data)
+            self.written += len(data)
+
+
+###
+# Feeds the pieces of a page to a ScriptExtractor until the <pre> tag is closed, and returns whether there was a script
+# (i.e. the page had a <pre> tag with something in it).
+###
+def stream_script(chunks, output):
+    extractor = ScriptExtractor(output)
+    for chunk in chunks:
+        extractor.feed(chunk)
+        if extractor.finished:
+            break
+    else:
+        extractor.close()
+    return extractor.written > 0
+
+
+###
+# Pulls the text of the script out of an IMSDb script page, or returns None if the page has an empty script (or none).
+###
+def extract_script(raw_html):
+    output = io.StringIO()
+    if not stream_script([raw_html], output):
+        return None
+    return output.getvalue()
+
+
+###
+# Streams the script out of the pieces of a page into its script file. The script is written to a temporary file
+# first, which only replaces the script file if the page had a script. If a writable Script_Pack is given, the script
+# is added to the end of it instead.
+###
+def save_script(chunks, title, pack=None):
+    if pack is not None:
+        output = io.StringIO()
+        found = stream_script(chunks, output)
+        if found:
+            pack.add(title, output.getvalue())
+        return found
+    script_file = SCRIPT_PATH + title + '.script'
+    with open(script_file + '.tmp', 'w') as output:
+        found = stream_script(chunks, output)
+    if found:
+        os.replace(script_file + '.tmp', script_file)
+    else:
+        os.remove(script_file + '.tmp')
+    return found
+
+
+###
+# The script page of every title. With a saved IMSDb listing, titles are resolved through a Title_Index, and titles
+# that are not in the listing are left out rather than guessed at. Titles that only have a fuzzy match are not fetched
+# either: the matches are written to review_file to be checked, and the ones copied into matches_file are used from
+# then on. Without a listing, the address is guessed from the title.
+###
+def script_urls(titles, base_url=IMSDB_URL, listing_file=LISTING_FILE, review_file=REVIEW_FILE,
+                matches_file=MATCHES_FILE):
+    listing = read_listing(listing_file)
+    if len(listing) == 0:
+        return {title: script_url(title, base_url) for title in titles}
+    index = TitleIndex(listing)
+    confirmed = read_matches(matches_file)
+    urls = {}
+    suggestions = {}
+    for title in titles:
+        if title in confirmed:
+            urls[title] = script_url(confirmed[title], base_url)
+            continue
+        url = index.script_url(title, base_url=base_url)
+        if url is not None:
+            urls[title] = url
+            continue
+        suggestion = index.suggest(title)
+        if suggestion is None:
+            print("Not on IMSDb", title)
+        else:
+            print("Needs review", title, "->", suggestion)
+            suggestions[title] = suggestion
+    if len(suggestions) > 0:
+        write_matches(suggestions, review_file)
+    return urls
+
+
+def main(base_url=IMSDB_URL, fetcher=None, incremental=True, listing_file=LISTING_FILE, pack_file=None):
+    store = PageStore()
+    pack = ScriptPack(pack_file, writable=True) if pack_file is not None else None
+    urls = script_urls(read_titles(), base_url, listing_file)
+    jobs = [(title, url) for title, url in urls.items() if not (incremental and store.is_fresh(url))]
+
+    # What gets recorded in the progress file is whether there is a script for the title, or the HTTP status code if
+    # the page could not be found.
+    def handle_page(title, response):
+        if response.status >= 500:
+            raise IOError("HTTP " + str(response.status))
+        changed = store.update(urls[title], response)
+        status = store.index[urls[title]]['status']
+        # Seems as though internet movie script database specifically removes the movies for which a 404 error occurs
+        if status != 200:
+            print(status, title)
+            return status
+        if not changed and (pack.contains(title) if pack is not None else
+                            os.path.exists(SCRIPT_PATH + title + '.script')):
+            return True
+        return save_script(store.stream(urls[title], 'iso-8859-1'), title, pack)
 
-    # Catches HTTP and URL Errors
     try:
-        script = request.urlopen(url).read().decode('iso-8859-1')
-        if not re.search(r'<pre></pre>',script):
-            soup = BeautifulSoup(''.join(script))
-            raw_script = str(soup.find('pre'))
-            script_text = BeautifulSoup(raw_script).get_text()
-            write_script(script_text,title)
-    # Seems as though internet movie script database specifically removes the movies for which a 404 error occurs
-    except error.HTTPError as er:
-        print(er.code,title)
-        continue
-    except error.URLError as er:
-        print(er.errno,title)
-        continue
+        scrape(jobs, handle_page, PROGRESS_FILE, fetcher, store.conditional_headers)
+    finally:
+        store.save()
+        if pack is not None:
+            pack.close()
+
 
+if __name__ == "__main__":
+    main()
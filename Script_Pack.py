@@ -0,0 +1,315 @@
+"""
+A packed corpus: every script (and characters file) in a single file, instead of thousands of loose files in
+./Scripts/ and ./Characters/. Shipping a corpus to another machine is one sequential copy, and reading a script is
+one seek and one read of an already open file.
+
+The pack is a run of records followed by an index:
+    MAGIC
+    record, record, ...   each one a RECORD header (kind, length of the name, compressed length, size, sha1 of the
+                          contents), the name (utf-8), and the zlib-compressed contents
+    index                 zlib-compressed JSON: kind -> name -> [offset of the contents, compressed length, size, sha1]
+    FOOTER                the offset of the index and INDEX_MAGIC
+
+Kinds are SCRIPT ("S") and CHARACTERS ("C"). Appending a record writes it over the old index and then writes a new
+index after it, so the scrapers can add to a pack as they go. A record with the same kind and name as an older one
+replaces it in the index (compact throws the old ones away). If a pack is left without its index (e.g. a crash in the
+middle of an append), the index is rebuilt by reading through the records.
+
+Contents are stored as the raw bytes of the files, and read_text decodes them just like open() would, so that
+Script_Tagger gets the same text from a pack as from the loose files. Script_Tagger falls back to PACK_FILE (through
+default_pack) for every script and characters file that is not in SCRIPT_PATH or CHARACTER_PATH.
+
+Usage:
+    python Script_Pack.py import [--scripts DIR] [--characters DIR] [--pack FILE]
+    python Script_Pack.py export [--scripts DIR] [--characters DIR] [--pack FILE]
+    python Script_Pack.py list [--pack FILE]
+    python Script_Pack.py compact [--pack FILE]
+"""
+
+import io
+import os
+import sys
+import zlib
+import json
+import struct
+import threading
+import locale
+import hashlib
+import argparse
+
+
+PACK_FILE = './Corpus.pack'
+
+SCRIPT = "S"
+CHARACTERS = "C"
+
+MAGIC = b'BDPACK1\n'
+INDEX_MAGIC = b'BDINDEX\n'
+
+# kind, length of the name, compressed length, size, sha1 of the contents
+RECORD = struct.Struct('<1sHII20s')
+# offset of the index, INDEX_MAGIC
+FOOTER = struct.Struct('<Q8s')
+
+COMPRESSION_LEVEL = 6
+
+# Packs opened by default_pack, keyed by path: (mtime, size, pack)
+_open_packs = {}
+
+
+class ScriptPack:
+    ###
+    # Opens a pack. With writable=True, the pack can be added to, and it is created if it does not exist yet.
+    ###
+    def __init__(self, path=PACK_FILE, writable=False):
+        self.path = path
+        self.writable = writable
+        if writable and not os.path.exists(path):
+            with open(path, 'wb') as pack_file:
+                pack_file.write(MAGIC)
+                pack_file.write(FOOTER.pack(len(MAGIC), INDEX_MAGIC))
+        self.file = open(path, 'r+b' if writable else 'rb')
+        self.lock = threading.Lock()
+        if self.file.read(len(MAGIC)) != MAGIC:
+            self.file.close()
+            raise ValueError(path + " is not a script pack")
+        # Where the records end (and so where the index is, or the next record goes)
+        self.end = len(MAGIC)
+        self.index = {SCRIPT: {}, CHARACTERS: {}}
+        self.dirty = False
+        if not self.read_index():
+            self.recover_index()
+
+    ###
+    # Reads the index at the end of the pack. Returns False if there is no intact index to read.
+    ###
+    def read_index(self):
+        self.file.seek(0, os.SEEK_END)
+        size = self.file.tell()
+        if size < len(MAGIC) + FOOTER.size:
+            return False
+        self.file.seek(size - FOOTER.size)
+        offset, magic = FOOTER.unpack(self.file.read(FOOTER.size))
+        if magic != INDEX_MAGIC or not len(MAGIC) <= offset <= size - FOOTER.size:
+            return False
+        self.file.seek(offset)
+        compressed = self.file.read(size - FOOTER.size - offset)
+        if offset == len(MAGIC) and len(compressed) == 0:
+            return True
+        try:
+            index = json.loads(zlib.decompress(compressed).decode('utf-8'))
+        except (zlib.error, ValueError):
+            return False
+        for kind in index:
+            self.index.setdefault(kind, {}).update(index[kind])
+        self.end = offset
+        return True
+
+    ###
+    # Rebuilds the index by reading through the records, up to the first one that is cut off.
+    ###
+    def recover_index(self):
+        self.file.seek(len(MAGIC))
+        offset = len(MAGIC)
+        while True:
+            header = self.file.read(RECORD.size)
+            if len(header) < RECORD.size:
+                break
+            kind, name_length, length, size, digest = RECORD.unpack(header)
+            name = self.file.read(name_length)
+            contents = offset + RECORD.size + name_length
+            self.file.seek(contents + length)
+            if len(name) < name_length or self.file.tell() > os.fstat(self.file.fileno()).st_size:
+                break
+            self.index.setdefault(kind.decode('ascii'), {})[name.decode('utf-8')] = [contents, length, size,
+                                                                                    digest.hex()]
+            offset = contents + length
+        self.end = offset
+        self.dirty = True
+
+    def names(self, kind=SCRIPT):
+        return sorted(self.index.get(kind, {}))
+
+    def contains(self, name, kind=SCRIPT):
+        return name in self.index.get(kind, {})
+
+    ###
+    # The sha1 of the contents of an entry (the same as the sha1 of the file it came from), or None if it is not there.
+    ###
+    def content_hash(self, name, kind=SCRIPT):
+        entry = self.index.get(kind, {}).get(name)
+        return entry[3] if entry is not None else None
+
+    ###
+    # The contents of an entry, as bytes. Raises KeyError if it is not in the pack. The entry is read at its offset
+    # without moving the position of the file, which is shared by the threads of Tagger_Service and by the worker
+    # processes that inherit the pack from default_pack.
+    ###
+    def read(self, name, kind=SCRIPT):
+        offset, length, size, digest = self.index[kind][name]
+        if self.writable:
+            # Records that were just added may still be in the buffer of the file object
+            self.file.flush()
+        if hasattr(os, 'pread'):
+            data = os.pread(self.file.fileno(), length, offset)
+        else:
+            # Windows has no pread, so the seek and the read have to happen together
+            with self.lock:
+                self.file.seek(offset)
+                data = self.file.read(length)
+        data = zlib.decompress(data)
+        if len(data) != size or hashlib.sha1(data).hexdigest() != digest:
+            raise ValueError("The " + kind + " entry for " + name + " in " + self.path + " is corrupt")
+        return data
+
+    ###
+    # The contents of an entry decoded as text, with the newlines translated, the same as reading the file it came from
+    # with open() would give.
+    ###
+    def read_text(self, name, kind=SCRIPT, encoding=None):
+        return io.TextIOWrapper(io.BytesIO(self.read(name, kind)), encoding=encoding).read()
+
+    ###
+    # Adds an entry to the end of the pack (contents can be bytes, or text to be encoded like open() would). An entry
+    # with the same contents as the one already in the pack is not written again. Returns whether anything was written.
+    ###
+    def add(self, name, contents, kind=SCRIPT, encoding=None):
+        if not self.writable:
+            raise IOError(self.path + " was not opened for writing")
+        if isinstance(contents, str):
+            contents = contents.encode(encoding or locale.getpreferredencoding(False))
+        digest = hashlib.sha1(contents).digest()
+        if self.content_hash(name, kind) == digest.hex():
+            return False
+        compressed = zlib.compress(contents, COMPRESSION_LEVEL)
+        encoded_name = name.encode('utf-8')
+        self.file.seek(self.end)
+        # Cut off the old index first, so that a crash halfway through leaves a pack that recover_index can read
+        self.file.truncate()
+        self.file.write(RECORD.pack(kind.encode('ascii'), len(encoded_name), len(compressed), len(contents), digest))
+        self.file.write(encoded_name)
+        offset = self.file.tell()
+        self.file.write(compressed)
+        self.end = self.file.tell()
+        self.index.setdefault(kind, {})[name] = [offset, len(compressed), len(contents), digest.hex()]
+        self.dirty = True
+        return True
+
+    ###
+    # Writes the index and footer after the records.
+    ###
+    def flush(self):
+        if not self.writable or not self.dirty:
+            return
+        index = zlib.compress(json.dumps(self.index, sort_keys=True).encode('utf-8'), COMPRESSION_LEVEL)
+        self.file.seek(self.end)
+        self.file.truncate()
+        self.file.write(index)
+        self.file.write(FOOTER.pack(self.end, INDEX_MAGIC))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.dirty = False
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+
+###
+# The pack at path, kept open between calls and opened again once the file changes, or None if there is no pack.
+###
+def default_pack(path=PACK_FILE):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    opened = _open_packs.get(path)
+    if opened is not None and opened[:2] == (stat.st_mtime_ns, stat.st_size):
+        return opened[2]
+    if opened is not None:
+        opened[2].close()
+    pack = ScriptPack(path)
+    _open_packs[path] = (stat.st_mtime_ns, stat.st_size, pack)
+    return pack
+
+
+###
+# Rewrites a pack without the entries that have been replaced since, through a temporary file.
+###
+def compact(path=PACK_FILE):
+    with ScriptPack(path) as old:
+        if os.path.exists(path + '.tmp'):
+            os.remove(path + '.tmp')
+        with ScriptPack(path + '.tmp', writable=True) as new:
+            for kind in sorted(old.index):
+                for name in old.names(kind):
+                    new.add(name, old.read(name, kind), kind)
+    os.replace(path + '.tmp', path)
+
+
+###
+# Adds every script in script_path and characters file in character_path to a pack. Returns the number of entries
+# written.
+###
+def import_directories(path=PACK_FILE, script_path='./Scripts/', character_path='./Characters/'):
+    written = 0
+    with ScriptPack(path, writable=True) as pack:
+        for directory, kind, suffix in [(script_path, SCRIPT, '.script'), (character_path, CHARACTERS, '')]:
+            if directory is None or not os.path.isdir(directory):
+                continue
+            for filename in sorted(os.listdir(directory)):
+                if not filename.endswith(suffix) or not os.path.isfile(os.path.join(directory, filename)):
+                    continue
+                with open(os.path.join(directory, filename), 'rb') as entry_file:
+                    name = filename[:len(filename) - len(suffix)]
+                    written += pack.add(name, entry_file.read(), kind)
+    return written
+
+
+###
+# Writes every entry of a pack back out as loose files, in the layout that import_directories reads.
+###
+def export_directories(path=PACK_FILE, script_path='./Scripts/', character_path='./Characters/'):
+    exported = 0
+    with ScriptPack(path) as pack:
+        for directory, kind, suffix in [(script_path, SCRIPT, '.script'), (character_path, CHARACTERS, '')]:
+            if directory is None:
+                continue
+            os.makedirs(directory, exist_ok=True)
+            for name in pack.names(kind):
+                with open(os.path.join(directory, name + suffix), 'wb') as entry_file:
+                    entry_file.write(pack.read(name, kind))
+                exported += 1
+    return exported
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Packs the scripts and characters files into a single file.")
+    parser.add_argument("command", choices=["import", "export", "list", "compact"])
+    parser.add_argument("--pack", default=PACK_FILE)
+    parser.add_argument("--scripts", default='./Scripts/')
+    parser.add_argument("--characters", default='./Characters/')
+    args = parser.parse_args(argv)
+    if args.command == "import":
+        print("Added " + str(import_directories(args.pack, args.scripts, args.characters)) + " entries")
+    elif args.command == "export":
+        print("Wrote " + str(export_directories(args.pack, args.scripts, args.characters)) + " files")
+    elif args.command == "list":
+        with ScriptPack(args.pack) as pack:
+            for kind in sorted(pack.index):
+                for name in pack.names(kind):
+                    offset, length, size, digest = pack.index[kind][name]
+                    print(kind + " " + name + " " + str(size) + " " + str(length) + " " + digest)
+    else:
+        compact(args.pack)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+"""
+A memory-mapped reader for .script files.
+
+ScriptReader maps a script into memory and makes one scan over it to build an index of its non-empty lines: the
+offset where each line starts and ends, and the width of its indentation, kept in compact arrays. The indentation
+histogram and the format check only need the indentation array, so they never allocate a string per line, and the
+tagger decodes each line once (straight from the map) when it asks for it.
+
+The index is meant to match reading the file in text mode and splitting it on newlines:
+    - "\n", "\r\n" and "\r" all end a line (as with universal newlines)
+    - Lines are decoded with the locale's preferred encoding, just like open() does, unless another one is given
+    - A line whose indentation has whitespace in it other than spaces, tabs, vertical tabs and form feeds (e.g. a
+      no-break space) has its indentation measured from the decoded line instead, so that it agrees with str.lstrip()
+    - Encodings that are not ASCII-compatible (e.g. UTF-16) cannot be scanned byte by byte, so for those the whole
+      file is decoded and the same index is built over the text instead.
+"""
+
+import re
+import mmap
+import array
+import locale
+import codecs
+import numpy
+
+
+# One line of decoded text: its indentation, the rest of it, and the newline that ends it (or the end of the text)
+TEXT_LINE = re.compile(r'([ \t\x0b\x0c]*)([^\r\n]*)(?:\r\n|\r|\n|\Z)')
+
+# Bytes that can be the start of whitespace that the byte scan does not know about: anything outside of ASCII, and
+# the ASCII separators that str.isspace counts as whitespace.
+UNKNOWN_WHITESPACE = numpy.zeros(256, dtype=bool)
+UNKNOWN_WHITESPACE[0x1c:0x20] = True
+UNKNOWN_WHITESPACE[0x80:] = True
+
+
+###
+# Checks if an encoding keeps the ASCII characters as their own single bytes, so that newlines and indentation can be
+# found without decoding.
+###
+def ascii_compatible(encoding):
+    sample = bytes(range(128))
+    try:
+        return sample.decode(encoding) == sample.decode('ascii')
+    except UnicodeDecodeError:
+        return False
+
+
+class ScriptReader:
+    def __init__(self, path, encoding=None):
+        self.path = path
+        self.encoding = codecs.lookup(encoding or locale.getpreferredencoding(False)).name
+        self.file = open(path, 'rb')
+        try:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped
+            self.data = b''
+        self.size = len(self.data)
+        self.text = None
+        # Whether starts and ends are offsets into the bytes of the file (or only into the decoded text)
+        self.byte_offsets = ascii_compatible(self.encoding)
+        self.starts = array.array('q')
+        self.ends = array.array('q')
+        self.indents = array.array('q')
+        if self.byte_offsets:
+            self.scan_bytes()
+        else:
+            self.text = codecs.decode(self.data, self.encoding)
+            self.scan_text()
+
+    ###
+    # Builds the index straight from the mapped bytes, with numpy doing the scan so that no line strings are made,
+    # except for the lines that might start with whitespace other than spaces, tabs, vertical tabs and form feeds.
+    ###
+    def scan_bytes(self):
+        data = numpy.frombuffer(self.data, dtype=numpy.uint8) if self.size > 0 else numpy.zeros(0, numpy.uint8)
+        carriage_returns = data == 13
+        line_feeds = data == 10
+        # "\r\n" ends a line at the "\r", and a "\r" on its own ends a line as well
+        crlf = numpy.zeros(len(data), dtype=bool)
+        crlf[:-1] = carriage_returns[:-1] & line_feeds[1:]
+        lone_line_feeds = line_feeds.copy()
+        lone_line_feeds[1:] &= ~crlf[:-1]
+        line_ends = numpy.flatnonzero(carriage_returns | lone_line_feeds)
+        next_starts = line_ends + 1 + crlf[line_ends]
+        starts = numpy.concatenate(([0], next_starts))
+        ends = numpy.concatenate((line_ends, [len(data)]))
+        # The first character of each line that is not indentation (a space, or bytes 9 to 13, which are the tab, the
+        # newlines, the vertical tab and the form feed) decides if the line is empty. Only the characters that follow
+        # indentation or a newline can be the first one of a line, so only those are searched (the end of the data is
+        # added on the end, so that every line has one to find).
+        content = ~((data == 32) | ((data >= 9) & (data <= 13)))
+        content[1:] &= ~content[:-1]
+        content = numpy.append(numpy.flatnonzero(content), len(data))
+        firsts = content[numpy.searchsorted(content, starts)]
+        non_empty = firsts < ends
+        starts, ends, firsts = starts[non_empty], ends[non_empty], firsts[non_empty]
+        indents = firsts - starts
+        for line in numpy.flatnonzero(UNKNOWN_WHITESPACE[data[firsts]]):
+            decoded = self.data[starts[line]:ends[line]].decode(self.encoding)
+            indents[line] = len(decoded) - len(decoded.lstrip())
+            if indents[line] == len(decoded):
+                # Nothing but whitespace, so the line is empty after all
+                indents[line] = -1
+        keep = indents >= 0
+        self.starts = array.array('q', starts[keep].astype(numpy.int64).tobytes())
+        self.ends = array.array('q', ends[keep].astype(numpy.int64).tobytes())
+        self.indents = array.array('q', indents[keep].astype(numpy.int64).tobytes())
+        # When every byte is ASCII, the byte offsets are also character offsets, so the lines can be sliced out of one
+        # decoded copy of the script, which is much cheaper than decoding them one at a time.
+        if len(data) == 0 or data.max() < 0x80:
+            self.text = codecs.decode(self.data, 'ascii')
+
+    ###
+    # Builds the index over the decoded text, for encodings that cannot be scanned as bytes.
+    ###
+    def scan_text(self):
+        text = self.text
+        for line in TEXT_LINE.finditer(text):
+            start, indent_end = line.span(1)
+            end = line.end(2)
+            stripped = text[indent_end:end].lstrip()
+            if len(stripped) == 0:
+                continue
+            self.starts.append(start)
+            self.ends.append(end)
+            self.indents.append(end - start - len(stripped))
+
+    ###
+    # The number of lines on each indentation level, as a dictionary in the order that the levels first show up in
+    # the script (the same order that counting them one line at a time would give).
+    ###
+    def indentation_histogram(self):
+        indents = numpy.frombuffer(self.indents, dtype=numpy.int64) if len(self.indents) > 0 else numpy.zeros(0, int)
+        levels, firsts, counts = numpy.unique(indents, return_index=True, return_counts=True)
+        order = numpy.argsort(firsts)
+        return dict(zip(levels[order].tolist(), counts[order].tolist()))
+
+    def __len__(self):
+        return len(self.starts)
+
+    ###
+    # The decoded text of a non-empty line
+    ###
+    def __getitem__(self, index):
+        if self.text is not None:
+            return self.text[self.starts[index]:self.ends[index]]
+        return self.data[self.starts[index]:self.ends[index]].decode(self.encoding)
+
+    def __iter__(self):
+        if self.text is not None:
+            text = self.text
+            return (text[start:end] for start, end in zip(self.starts, self.ends))
+        data = self.data
+        encoding = self.encoding
+        return (data[start:end].decode(encoding) for start, end in zip(self.starts, self.ends))
+
+    ###
+    # A zero-copy view of the raw bytes of a line. Views have to be released before the reader is closed.
+    ###
+    def view(self, index):
+        if not self.byte_offsets:
+            return memoryview(self[index].encode(self.encoding))
+        return memoryview(self.data)[self.starts[index]:self.ends[index]]
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
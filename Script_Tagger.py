@@ -24,10 +24,64 @@ Parsing Screenplays for Extracting social networks in movies
 """
 
 
-import nltk
 import re
-from urllib import request
-from bs4 import BeautifulSoup
+import os
+import io
+import sys
+import itertools
+import bisect
+import zlib
+import pickle
+import hashlib
+import tempfile
+import argparse
+import collections
+import Instrumentation
+from Dialogue_Scanner import DialogueScanner
+
+# The heavier modules (bs4, numpy, the page fetcher and the name classifier) are only imported by the functions that
+# need them, so that using the parsed scripts and test files does not have to wait for them to load.
+
+
+# Where the movie scripts live, and where their parses get cached.
+SCRIPT_PATH = './Scripts/'
+CACHE_PATH = './Parse_Cache/'
+CHARACTER_PATH = './Characters/'
+# Scripts and characters files that are not in SCRIPT_PATH or CHARACTER_PATH are looked for in this pack (see
+# Script_Pack)
+PACK_PATH = './Corpus.pack'
+
+BING_URL = "http://www.bing.com"
+
+# Bump this whenever the tagging rules change so that every cached parse gets thrown away.
+TAGGER_VERSION = 4
+
+# Bump this whenever what tests two and three decide from a parse changes, so that their stored results are redone.
+TEST_VERSION = 2
+
+# The patterns used when tagging lines, compiled once up front
+SCENE_HEADING = re.compile(r'^([\d\.]{2,})?\s*(EXT\.?.*|INT\.?.*)$')
+PARENTHETICAL = re.compile(r'^\(.+\)| .+\) | \(.+$')
+CHARACTER_WITH_NOTE = re.compile(r'[A-Za-z\.\-]+.*\(.+\)?.*')
+CHARACTER_NAME = re.compile(r'([A-Z\-\.\s]+)(\s*\(.*\))?')
+# Voice-over, off-screen and continued markers that are left on the end of a character name when they are not in
+# parentheses, e.g. "NICKY V.O." or "NICKY CONT'D"
+CHARACTER_SUFFIX = re.compile(r"(?:\s+|\s*\()(?:V\.?\s?O\.?|O\.?\s?S\.?|O\.?\s?C\.?|CONT'?D\.?|CONTINUED|"
+                              r"CONTINUING)\)?\s*$")
+
+# The tags given to the five most common indentation levels, from least to most indented. Lines on the least
+# indented level are "S" if they look like a scene heading, and lines on the fourth level are "M" if they look like a
+# parenthetical.
+LEVEL_TAGS = "NDMCM"
+
+# The words (besides the names of male characters) that count as a mention of a man in test three. Terms can be more
+# than one word long.
+MALE_TERMS = ["he", "him", "his", "man"]
+
+# Parses that have already been loaded by this process, keyed by script path, least recently used first. Only the
+# last PARSE_MEMORY_SIZE are kept, since the rest can be read back from CACHE_PATH.
+PARSE_MEMORY_SIZE = 64
+_parsed_scripts = collections.OrderedDict()
 
 
 ###
@@ -35,7 +89,7 @@ from bs4 import BeautifulSoup
 # if the movie script is not formatted well, however.
 ###
 def get_popular_characters(character_list):
-    character_freqs = nltk.FreqDist(character_list)
+    character_freqs = collections.Counter(character_list)
     top_characters = [character for character, freq in character_freqs.most_common(20)]
     return top_characters
 
@@ -43,28 +97,66 @@ def get_popular_characters(character_list):
 ###
 # Defined this because I found myself doing it a lot. Was attempting not to reuse too much code.
 ###
+@Instrumentation.timed("open_script")
 def open_script(movie):
-    script = open('./Scripts/' + movie + ".script").read()
+    with open_script_file(movie) as scriptfile:
+        script = scriptfile.read()
+    Instrumentation.count("characters_read", len(script))
     return script
 
 
+###
+# The pack that scripts and characters files are read from when they are not loose files, or None if there is none.
+###
+def corpus_pack():
+    from Script_Pack import default_pack
+    return default_pack(PACK_PATH)
+
+
+###
+# Opens the script of a movie as a text file, from SCRIPT_PATH if it is there and from the pack otherwise.
+###
+def open_script_file(movie):
+    try:
+        return open(SCRIPT_PATH + movie + ".script")
+    except FileNotFoundError:
+        pack = corpus_pack()
+        if pack is None or not pack.contains(movie):
+            raise
+        return io.StringIO(pack.read_text(movie))
+
+
+###
+# Opens the characters file of a movie as a text file, from CHARACTER_PATH if it is there and from the pack otherwise.
+###
+def open_characters_file(movie):
+    try:
+        return open(CHARACTER_PATH + movie)
+    except FileNotFoundError:
+        from Script_Pack import CHARACTERS
+        pack = corpus_pack()
+        if pack is None or not pack.contains(movie, CHARACTERS):
+            raise
+        return io.StringIO(pack.read_text(movie, CHARACTERS))
+
+
 ###
 # This function checks the indentation of a script to determine if it is "well-formatted".
 # here, we consider a movie to be well formatted if over 90% of the lines in the script fall into one of
 # the three most common indentation levels.
 ###
 def is_well_formatted(movie):
-    script = open_script(movie)
-    scriptlines = [line for line in script.split('\n') if len(line.strip()) > 0]
-    indentations = [len(line) - len(line.lstrip()) for line in scriptlines]
-    indentation_frequencies = nltk.FreqDist(indentations)
+    return parse_script(movie)['well_formatted']
+
+
+###
+# Does the actual work for is_well_formatted on a script that has already been split into its non-empty lines.
+###
+def check_formatting(scriptlines, indentations, indentation_frequencies):
     most_common = [key for key, value in indentation_frequencies.most_common(3)]
     if len(most_common) < 3:
         return False
-    formatted_lines = 0
-    for line in scriptlines:
-        if len(line) - len(line.lstrip()) in most_common:
-            formatted_lines += 1
+    formatted_lines = sum(indentation_frequencies[indentation] for indentation in most_common)
     percentage = formatted_lines / len(scriptlines)
     # print(percentage)
     # Reject any movies whose percentage of lines on common indentation levels does not fall between 90 and 99.5 percent
@@ -75,31 +167,50 @@ def is_well_formatted(movie):
 # Sanity check: Checks if the character names, scene boundaries and dialog line up as you would expect in a typical
 # script. E.g. Scene descriptions after scene boundaries, dialog after character names, character names occur between
 # scene boundaries
+#
+# A script passes if less than 10% of its lines are strange. Unless stop_early is False, the check stops as soon as
+# enough strange lines have been seen for the script to fail, which is usually early on for a script that cannot be
+# parsed. Empty scripts do not pass.
+###
+def sanity_check(tagged_lines, stop_early=True):
+    if len(tagged_lines) == 0:
+        return False
+    # print("Strange Tag Ratio:", round(strange_tag_ratio(tagged_lines), 2))
+    return strange_tag_ratio(tagged_lines, 10 if stop_early else None) < 10
+
+
 ###
-def sanity_check(tagged_lines):
-    tags = []
+# Works out the percentage of strange tags for sanity_check in a single pass over the tagged lines.
+#
+# Every dialog line counts each of the lines between it and the closest character name before it that is not
+# meta-information, a scene description or dialog (i.e. every scene boundary or untagged line) as strange. Rather than
+# walking backwards from every dialog line, we keep count of those lines since the last character name as we go.
+#
+# If a threshold (percentage) is given, this returns as soon as the ratio is certain to reach it, with the strange tags
+# seen so far over all of the lines (which is at least the threshold, but may be less than the full ratio).
+###
+def strange_tag_ratio(tagged_lines, threshold=None):
+    total = len(tagged_lines)
+    limit = threshold * total / 100 if threshold is not None else None
     strange_tags = 0
-    for x in range(len(tagged_lines)):
-        tags.append(tagged_lines[x][1])
-        # Scene boundaries should be followed by either a scene description or a character name
-        if tagged_lines[x][1] == "S":
-            if tagged_lines[x + 1][1] not in ["N", "C"]:
-                strange_tags += 1
+    strange_since_character = 0
+    for x in range(total):
+        tag = tagged_lines[x][1]
+        if tag == "C":
+            strange_since_character = 0
         # Dialog lines should occur after Character names, and the only lines in between should be
         # meta-information, scene descriptions, or other dialog lines.
-        if tagged_lines[x][1] == "D":
-            character_name_found = False
-            start_node = x - 1
-            while start_node >= 0 and not character_name_found:
-                if tagged_lines[start_node][1] == "C":
-                    character_name_found = True
-                else:
-                    if tagged_lines[start_node][1] not in "MND":
-                        strange_tags += 1
-                    start_node -= 1
-    # print("Strange Tags:",strange_tags)
-    # print("Strange Tag Ratio:", round(100*(strange_tags/len(tagged_lines)), 2))
-    return 100 * (strange_tags / len(tagged_lines)) < 10
+        elif tag == "D":
+            strange_tags += strange_since_character
+        elif tag not in "MN":
+            strange_since_character += 1
+            # Scene boundaries should be followed by either a scene description or a character name (so a scene
+            # boundary on the last line is strange as well)
+            if tag == "S" and (x + 1 == total or tagged_lines[x + 1][1] not in ["N", "C"]):
+                strange_tags += 1
+        if limit is not None and strange_tags >= limit:
+            break
+    return 100 * (strange_tags / total) if total > 0 else 0.0
 
 
 ###
@@ -114,40 +225,435 @@ def sanity_check(tagged_lines):
 #   "D": Dialog
 ###
 def tag_lines(movie):
-    script = open_script(movie)
-    scriptlines = [line for line in script.split('\n') if len(line.strip()) > 0]
-    indentations = [len(line) - len(line.lstrip()) for line in scriptlines]
-    indentation_frequencies = nltk.FreqDist(indentations)
+    return parse_script(movie)['tagged_lines']
+
+
+###
+# Tags lines one at a time as they are pulled from the lines iterable, using the indentation histogram of the script
+# to decide which indentation level corresponds with which tag. This is the generator that tag_lines is built on, and
+# it never holds more than a single line of the script itself.
+###
+def iter_tagged_lines(lines, indentation_frequencies):
+    for line, tag, character in classify_lines(lines, indentation_frequencies):
+        yield line, tag
+
+
+###
+# Does the work for iter_tagged_lines. The tag of each line is looked up from its indentation level in a table, and
+# only scene description and character lines are matched against a pattern. This yields (line, tag, character)
+# tuples, where character is the name of the character for "C" lines (as extract_character_names would find it), and
+# None for every other line, so that character lines never have to be parsed again.
+#
+# If the indentation of every line is already known (e.g. from a ScriptReader), it can be passed in as indentations
+# so that it does not have to be measured again.
+###
+def classify_lines(lines, indentation_frequencies, indentations=None):
     important_levels = sorted([key for key, value, in indentation_frequencies.most_common(5)])
-    tagged_lines = []
-    for line in range(len(scriptlines)):
-        if indentations[line] == important_levels[0]:
-            if re.match(r'^([\d\.]{2,})?\s*(EXT\.?.*|INT\.?.*)$', scriptlines[line].strip()):
-                tagged_lines.append((scriptlines[line], "S"))
+    level_tags = dict(zip(important_levels, LEVEL_TAGS))
+    if indentations is None:
+        measured = ((line, len(line) - len(line.lstrip())) for line in lines)
+    else:
+        measured = zip(lines, indentations)
+    for line, indentation in measured:
+        tag = level_tags.get(indentation, "U")
+        if tag == "N":
+            if SCENE_HEADING.match(line[indentation:].rstrip()):
+                tag = "S"
+        elif tag == "C":
+            stripped = line[indentation:].rstrip()
+            if PARENTHETICAL.match(stripped):
+                tag = "M"
             else:
-                tagged_lines.append((scriptlines[line], "N"))
-        elif indentations[line] == important_levels[1]:
-            tagged_lines.append((scriptlines[line], "D"))
-        elif indentations[line] == important_levels[2]:
-            tagged_lines.append((scriptlines[line], "M"))
-        elif indentations[line] == important_levels[3]:
-            if re.match(r'^\(.+\)| .+\) | \(.+$', scriptlines[line].strip()):
-                tagged_lines.append((scriptlines[line], "M"))
+                yield line, tag, extract_character_names(stripped)
+                continue
+        yield line, tag, None
+
+
+###
+# Yields the non-empty lines of a script straight from the file handle, without ever reading the whole script.
+###
+def iter_script_lines(movie):
+    with open_script_file(movie) as script:
+        for line in script:
+            if line.endswith('\n'):
+                line = line[:-1]
+            if len(line.strip()) > 0:
+                yield line
+
+
+###
+# The pre-pass of the streaming tagger: builds the indentation histogram of a stream of lines. If sample_size is given,
+# only the first sample_size lines are looked at, which is plenty to find the indentation levels of a huge script.
+###
+def indentation_levels(lines, sample_size=None):
+    return collections.Counter(len(line) - len(line.lstrip()) for line in itertools.islice(lines, sample_size))
+
+
+###
+# Streaming versions of tag_lines and get_scenes. These read the script twice (once to find the indentation levels,
+# and once to tag it) rather than keeping it in memory, so the memory they use is bounded by the largest scene
+# instead of the size of the script. They are meant for very large scripts that should not go through the parse cache.
+###
+def stream_tagged_lines(movie, sample_size=None):
+    indentation_frequencies = indentation_levels(iter_script_lines(movie), sample_size)
+    return iter_tagged_lines(iter_script_lines(movie), indentation_frequencies)
+
+
+def stream_scenes(movie, sample_size=None):
+    return iter_scenes(stream_tagged_lines(movie, sample_size))
+
+
+###
+# Every stage of the pipeline used to re-read and re-tag the same script, so this function parses a script once and
+# returns everything the rest of this file needs to know about it as a dictionary:
+#   "indentations": The indentation histogram, as a dictionary of indentation level -> number of lines
+#   "tagged_lines": The output of tag_lines
+#   "scene_starts": The indices of the "S" lines in tagged_lines
+#   "character_lines": The indices of the "C" lines in tagged_lines
+#   "character_names": The character name on each of those "C" lines
+#   "character_index": Who speaks, how often, in which scenes and right after whom (see build_character_index)
+#   "well_formatted": The verdict of is_well_formatted
+#   "sane": The verdict of sanity_check on the tagged lines
+#
+# Parses are kept as compressed pickles in CACHE_PATH. A cached parse is reused as long as the script's modification
+# time and size have not changed, or if they have, as long as the contents still hash the same. This means that a
+# full corpus run only parses each script once, and that a rerun with no changes does not tag anything at all.
+###
+def parse_script(movie):
+    path = SCRIPT_PATH + movie + ".script"
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        pack = corpus_pack()
+        if pack is None or not pack.contains(movie):
+            raise
+        return parse_packed_script(pack, movie)
+    parsed = remembered_parse(path)
+    if parsed is not None and (parsed['mtime'], parsed['size']) == (stat.st_mtime_ns, stat.st_size):
+        Instrumentation.count("parse_cache", result="memory")
+        return parsed
+    cache_file = parse_cache_file(path)
+    parsed = read_cached_parse(cache_file)
+    if parsed is None or (parsed['mtime'], parsed['size']) != (stat.st_mtime_ns, stat.st_size):
+        from Script_Reader import ScriptReader
+        with ScriptReader(path) as reader:
+            Instrumentation.count("bytes_read", reader.size)
+            content_hash = hashlib.sha1(reader.data).hexdigest()
+            # The file was touched but not changed, so the old parse only needs its timestamp updated.
+            if parsed is None or parsed['hash'] != content_hash:
+                Instrumentation.count("parse_cache", result="miss")
+                parsed = tag_script(reader, reader.indents, reader.indentation_histogram())
+                parsed['hash'] = content_hash
             else:
-                tagged_lines.append((scriptlines[line], "C"))
-        elif indentations[line] == important_levels[4]:
-            tagged_lines.append((scriptlines[line], "M"))
-        else:
-            tagged_lines.append((scriptlines[line], "U"))
-    sanity_check(tagged_lines)
-    return tagged_lines
+                Instrumentation.count("parse_cache", result="touched")
+        parsed['mtime'] = stat.st_mtime_ns
+        parsed['size'] = stat.st_size
+        write_cached_parse(cache_file, parsed)
+    else:
+        Instrumentation.count("parse_cache", result="disk")
+    remember_parse(path, parsed)
+    return parsed
+
+
+###
+# parse_script for a script that is only in the pack. Its parse is cached the same way, but it is checked against the
+# hash of the script that the pack keeps rather than a modification time.
+###
+def parse_packed_script(pack, movie):
+    path = pack.path + "#" + movie
+    content_hash = pack.content_hash(movie)
+    parsed = remembered_parse(path)
+    if parsed is not None and parsed['hash'] == content_hash:
+        Instrumentation.count("parse_cache", result="memory")
+        return parsed
+    cache_file = parse_cache_file(path)
+    parsed = read_cached_parse(cache_file)
+    if parsed is None or parsed['hash'] != content_hash:
+        Instrumentation.count("parse_cache", result="miss")
+        script = pack.read_text(movie)
+        Instrumentation.count("characters_read", len(script))
+        parsed = build_parse(script)
+        parsed['hash'] = content_hash
+        parsed['mtime'] = None
+        parsed['size'] = None
+        write_cached_parse(cache_file, parsed)
+    else:
+        Instrumentation.count("parse_cache", result="disk")
+    remember_parse(path, parsed)
+    return parsed
+
+
+###
+# The parse of a script path that this process has in memory (or None), and keeping a parse in memory. Once there are
+# more than PARSE_MEMORY_SIZE of them, the least recently used one is dropped.
+###
+def remembered_parse(path):
+    parsed = _parsed_scripts.get(path)
+    if parsed is not None:
+        _parsed_scripts.move_to_end(path)
+    return parsed
+
+
+def remember_parse(path, parsed):
+    _parsed_scripts[path] = parsed
+    _parsed_scripts.move_to_end(path)
+    if len(_parsed_scripts) > PARSE_MEMORY_SIZE:
+        _parsed_scripts.popitem(last=False)
+
+
+def parse_cache_file(path):
+    return CACHE_PATH + hashlib.sha1(path.encode('utf-8')).hexdigest()
+
+
+###
+# Throws away the parse of a movie, both in memory and in the cache, so that the next parse_script tags it again.
+###
+def forget_parse(movie):
+    for path in [SCRIPT_PATH + movie + ".script", PACK_PATH + "#" + movie]:
+        _parsed_scripts.pop(path, None)
+        try:
+            os.remove(parse_cache_file(path))
+        except FileNotFoundError:
+            pass
+
+
+###
+# Splits, tags and checks a script (given as one string) the same way parse_script does with a script file.
+###
+def build_parse(script):
+    scriptlines = [line for line in script.split('\n') if len(line.strip()) > 0]
+    return tag_script(scriptlines, [len(line) - len(line.lstrip()) for line in scriptlines])
+
+
+###
+# Tags and checks the non-empty lines of a script for parse_script, given the indentation of every line (and their
+# histogram, if it has already been counted). scriptlines can be a list of lines or a ScriptReader, in which case the
+# indentation histogram and format check come straight from the reader's index and each line is only decoded once,
+# when it is tagged.
+###
+@Instrumentation.timed("tagging")
+def tag_script(scriptlines, indentations, histogram=None):
+    indentation_frequencies = collections.Counter(histogram if histogram is not None else indentations)
+    tagged_lines = []
+    character_lines = []
+    character_names = []
+    for line, tag, character in classify_lines(scriptlines, indentation_frequencies, indentations):
+        if character is not None:
+            character_lines.append(len(tagged_lines))
+            character_names.append(character)
+        tagged_lines.append((line, tag))
+    if Instrumentation.ENABLED:
+        for tag, lines in collections.Counter(tag for line, tag in tagged_lines).items():
+            Instrumentation.count("lines_tagged", lines, tag=tag)
+    scene_starts = [index for index, (line, tag) in enumerate(tagged_lines) if tag == "S"]
+    return {
+        'version': TAGGER_VERSION,
+        'indentations': dict(indentation_frequencies),
+        'tagged_lines': tagged_lines,
+        'scene_starts': scene_starts,
+        'character_lines': character_lines,
+        'character_names': character_names,
+        'character_index': build_character_index(character_lines, character_names, scene_starts),
+        'well_formatted': check_formatting(scriptlines, indentations, indentation_frequencies),
+        'sane': sanity_check(tagged_lines)
+    }
+
+
+###
+# Loads a parse from the cache, returning None if it is missing, unreadable, or was made by an older tagger.
+###
+def read_cached_parse(cache_file):
+    try:
+        with open(cache_file, 'rb') as cached:
+            parsed = pickle.loads(zlib.decompress(cached.read()))
+    except (OSError, zlib.error, pickle.UnpicklingError, EOFError):
+        return None
+    if parsed.get('version') != TAGGER_VERSION:
+        return None
+    return parsed
+
+
+###
+# Writes a parse to the cache. The parse is written to a temporary file of its own first, so that a crash halfway
+# through never leaves a corrupt cache entry behind, and so that processes writing the same entry at once (in a pool or
+# on shard workers) never write into the same file.
+###
+def write_cached_parse(cache_file, parsed):
+    os.makedirs(CACHE_PATH, exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(cache_file), suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as cached:
+            cached.write(zlib.compress(pickle.dumps(parsed, pickle.HIGHEST_PROTOCOL)))
+        os.replace(temporary, cache_file)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+
+###
+# Returns the same scenes as split_by_scene(tag_lines(movie)), but from the scene boundaries stored with the parse.
+# If stream is True, the scenes are instead tagged lazily from the script file by stream_scenes.
+###
+def get_scenes(movie, stream=False):
+    if stream:
+        return stream_scenes(movie)
+    return parse_scenes(parse_script(movie))
+
+
+###
+# Splits a parse (from parse_script or build_parse) into its scenes, the same way split_by_scene does.
+###
+def parse_scenes(parsed):
+    tagged_lines = parsed['tagged_lines']
+    scenes = []
+    previous_start = 0
+    for start in parsed['scene_starts']:
+        scenes.append(tagged_lines[previous_start:start])
+        previous_start = start
+    return scenes
+
+
+###
+# Returns the names of the characters on every "C" line of a movie, in order, as they were extracted while tagging.
+###
+def get_character_names(movie):
+    return parse_script(movie)['character_names']
+
+
+###
+# Returns the character names on the "C" lines of each of the scenes that get_scenes returns.
+###
+def get_scene_characters(movie):
+    return parse_scene_characters(parse_script(movie))
+
+
+def parse_scene_characters(parsed):
+    scene_characters = []
+    previous_start = 0
+    for start in parsed['scene_starts']:
+        first = bisect.bisect_left(parsed['character_lines'], previous_start)
+        last = bisect.bisect_left(parsed['character_lines'], start)
+        scene_characters.append(parsed['character_names'][first:last])
+        previous_start = start
+    return scene_characters
+
+
+###
+# The name that every spelling of a character is merged under: upper case, with its whitespace collapsed and any
+# voice-over, off-screen or continued markers taken off the end (e.g. "Nicky  (V.O.)" and "NICKY CONT'D" are NICKY).
+###
+def canonical_name(name):
+    canonical = " ".join(name.split()).upper()
+    while True:
+        stripped = CHARACTER_SUFFIX.sub("", canonical).rstrip(" :")
+        if stripped == canonical or len(stripped) == 0:
+            break
+        canonical = stripped
+    return canonical if len(canonical) > 0 else name
+
+
+###
+# Builds the character index of a parse from the "C" lines found while tagging, so that questions about who speaks
+# and who speaks to whom do not have to rescan the script. Characters are numbered in the order they first speak,
+# and the index holds:
+#     names:       the canonical name of every character
+#     aliases:     every name as it was extracted from the script -> the number of its character
+#     cues:        how many "C" lines every character has
+#     scenes:      the scenes every character speaks in, where scene k is the one that get_scenes returns at k, and
+#                  scene scene_count is the one after the last scene heading (which get_scenes leaves out)
+#     edges:       (a, b, weight, first scene) for every pair of characters a < b that speak one right after the other
+#                  in a scene, where weight is how many times they do
+#     scene_count: the number of scenes that get_scenes returns
+###
+def build_character_index(character_lines, character_names, scene_starts):
+    aliases = {}
+    ids = {}
+    names = []
+    cues = []
+    scenes = []
+    edges = {}
+    previous = None
+    previous_scene = None
+    for line, name in zip(character_lines, character_names):
+        character = aliases.get(name)
+        if character is None:
+            canonical = canonical_name(name)
+            character = ids.get(canonical)
+            if character is None:
+                character = ids[canonical] = len(names)
+                names.append(canonical)
+                cues.append(0)
+                scenes.append([])
+            aliases[name] = character
+        scene = bisect.bisect_right(scene_starts, line)
+        cues[character] += 1
+        if len(scenes[character]) == 0 or scenes[character][-1] != scene:
+            scenes[character].append(scene)
+        if previous is not None and previous_scene == scene and previous != character:
+            pair = (min(previous, character), max(previous, character))
+            edge = edges.get(pair)
+            if edge is None:
+                edges[pair] = [1, scene]
+            else:
+                edge[0] += 1
+        previous = character
+        previous_scene = scene
+    return {
+        'names': names,
+        'aliases': aliases,
+        'cues': cues,
+        'scenes': scenes,
+        'edges': [pair + tuple(edge) for pair, edge in sorted(edges.items())],
+        'scene_count': len(scene_starts)
+    }
+
+
+def get_character_index(movie):
+    return parse_script(movie)['character_index']
+
+
+###
+# The count characters of a character index with the most "C" lines, after their aliases have been merged. Like
+# get_popular_characters, ties go to the character that spoke first.
+###
+def ranked_characters(character_index, count=20):
+    order = sorted(range(len(character_index['names'])), key=lambda character: -character_index['cues'][character])
+    return [character_index['names'][character] for character in order[:count]]
+
+
+###
+# Looks up the scenes a character speaks in by any of its names. Returns an empty list for a character that never
+# speaks.
+###
+def character_scenes(character_index, name):
+    character = character_index['aliases'].get(name)
+    if character is None:
+        try:
+            character = character_index['names'].index(canonical_name(name))
+        except ValueError:
+            return []
+    return character_index['scenes'][character]
+
+
+###
+# The pairs of different female characters that speak one right after the other in a scene, as (name, name, weight,
+# first scene) tuples, with the genders given by name (e.g. from read_characters). Just like test two, only the scenes
+# that get_scenes returns count, unless include_last_scene is True.
+###
+def female_interactions(character_index, gender, include_last_scene=False):
+    female = set(canonical_name(character) for character, character_gender in gender.items()
+                 if character_gender == "female")
+    names = character_index['names']
+    last_scene = character_index['scene_count'] + (1 if include_last_scene else 0)
+    return [(names[a], names[b], weight, first_scene) for a, b, weight, first_scene in character_index['edges']
+            if names[a] in female and names[b] in female and first_scene < last_scene]
 
 
 ###
 # This function extracts a list of character names from a well-ordered movie script
 ###
 def get_chars(movie):
-    script = open("./Scripts/" + movie + ".script").read()
+    script = open_script(movie)
     chars = set(re.findall(r'^[A-z\.\-]+$|\n\s*[A-Z\.\-]+\s*[A-Za-z]+\n', script))
     for char in chars:
         if "INT." not in char and "EXT." not in char:
@@ -157,40 +663,12 @@ def get_chars(movie):
 ###
 # This creates and returns a Naive bayes classifier that is trained on a corpus of names and is then
 # used as a backoff if finding the actor/actress who played a character on bing does not work.
+#
+# The classifier is only trained once, and then saved and reused (see Name_Classifier).
 ###
 def make_classifier():
-    from nltk.corpus import names
-
-    training_names = [(name, 'male') for name in names.words('male.txt')] + \
-                     [(name, 'female') for name in names.words('female.txt')]
-    feature_sets = [(name_features(name), gender) for (name, gender) in training_names]
-    classifier = nltk.NaiveBayesClassifier.train(feature_sets)
-    return classifier
-
-
-###
-# This name_features method is used by the gender classifier in order to determine the gender of a name
-# (This is used as a backoff from the bing-powered gender classification
-#
-# Note: This name_features function is a slight augmentation of the one that can be found in the NLTK
-# online book at http://www.nltk.org/book/ch06.html
-###
-def name_features(name):
-    features = {
-        'last_letter': name[-1],
-        'first_letter': name[0],
-        'name': name
-    }
-    for letter in 'abcdefghijklmnopqrstuvwxyz':
-        features["count({})".format(letter)] = name.lower().count(letter)
-        features["has({})".format(letter)] = (letter in name.lower())
-    if len(name) > 1:
-        features['last_two'] = name[-2:]
-        features['first_two'] = name[:2]
-    if len(name) > 2:
-        features['last_three'] = name[-3:]
-        features['first_three'] = name[:3]
-    return features
+    from Name_Classifier import load_classifier
+    return load_classifier()
 
 
 ###
@@ -199,54 +677,139 @@ def name_features(name):
 #
 # Accepts a movie name, a trained name classifier, and a list of characters as input
 # Returns a dictionary of characters to their classified genders.
+#
+# Genders are kept in a GenderCache, so only the characters that have not been looked up before (or whose entries have
+# expired) actually go out to Bing, and those lookups are made concurrently.
 ###
-def classify_genders_bing(movie, backupclassifier, characterlist):
-    char_gends = {}
-    for character in characterlist:
+@Instrumentation.timed("classify_genders")
+def classify_genders_bing(movie, backupclassifier, characterlist, cache=None):
+    import asyncio
+    from Gender_Cache import GenderCache
+    own_cache = cache is None
+    if own_cache:
+        cache = GenderCache()
+    try:
+        resolved = cache.lookup(movie, characterlist)
+        misses = [character for character in set(characterlist) if character not in resolved]
+        Instrumentation.count("gender_cache", len(resolved), result="hit")
+        Instrumentation.count("gender_cache", len(misses), result="miss")
+        if len(misses) > 0:
+            looked_up = asyncio.run(lookup_genders_bing(movie, backupclassifier, misses))
+            # Lookups where we could not reach Bing at all are not worth remembering
+            cache.store(movie, {character: result for character, result in looked_up.items()
+                                if result[1] != "unreachable"})
+            resolved.update(looked_up)
+    finally:
+        if own_cache:
+            cache.close()
+    return {character: resolved[character][0] for character in characterlist}
+
+
+###
+# Looks up the genders of a list of characters on Bing concurrently. Returns a dictionary of characters to
+# (gender, source) tuples, where source says how the gender was found (see Gender_Cache).
+###
+async def lookup_genders_bing(movie, backupclassifier, characterlist):
+    import asyncio
+    from Page_Fetcher import PageFetcher
+    from Name_Classifier import classify_many
+    fetcher = PageFetcher()
+
+    # Returns the gender and its source, where the gender is '' if Bing did not settle it
+    async def lookup(character):
+        url = BING_URL + "/search?q=who+plays+" + '+'.join(character.split(' ')) + "+in+" + "+".join(
+                movie.replace("'", "").split(' '))
         try:
-            url = "http://www.bing.com/search?q=who+plays+" + '+'.join(character.split(' ')) + "+in+" + "+".join(
-                    movie.replace("'", "").split(' '))
-            raw_html = request.urlopen(url).read().decode('utf-8')
-            soup = BeautifulSoup(raw_html)
-            gender = ''
-            if len(character) == 0:
-                gender = "male"
-            # The subtitle on the bing results b_content box often contains "Actor or Actress"
-            subtitle = soup.find('div', {'class': 'b_entitySubTitle'})
-            actor_snippet = soup.find('div', {'class': 'b_lBottom'})
-            # If the subtitle exists
-            if subtitle is not None:
-                sub_text = subtitle.get_text()
-                if 'Actor' in sub_text:
-                    gender = 'male'
-                elif 'Actress' in sub_text:
-                    gender = 'female'
-            # If there is no subtitle
-            else:
-                title = soup.find('h2', {'class': 'b_entityTitle'})
-                # The b_context box often contains a little tidbit about the life of the actor/actress
-                # (This is useful if they are listed as a "comedian" or "singer" or something along those lines
-                if actor_snippet is not None:
-                    snip = actor_snippet.get_text()
-                    if 'actress' in snip.lower():
-                        gender = "female"
-                    elif 'actor' in snip.lower():
-                        gender = 'male'
-                # The names of the actors/actresses are often more useful in the classification of the gender than the
-                # names of the characters, so we classify their names if we can find them.
-                elif title is not None:
-                    if len(title.get_text().split()) == 2:
-                        gender = backupclassifier.classify(name_features(title.get_text().split()[0].lower()))
-            # If we have come all this way without assigning a gender to the character,
-            # we go ahead and try to classify the character by their name.
-            # This is often not a great means of gender classification, but it is presumably
-            # better than nothing.
-            if gender == '':
-                gender = backupclassifier.classify(name_features(character.title()))
-            char_gends[character] = gender
+            url.encode('ascii')
         except UnicodeEncodeError:
-            char_gends[character] = backupclassifier.classify(name_features(character.title()))
-    return char_gends
+            return '', "name"
+        Instrumentation.count("network_calls")
+        try:
+            with Instrumentation.timer("bing"):
+                response = await fetcher.fetch(url)
+        except OSError:
+            response = None
+        if response is None or response.status != 200:
+            Instrumentation.count("network_errors")
+            return '', "unreachable"
+        return bing_gender(character, response.text('utf-8'), backupclassifier)
+
+    try:
+        genders = dict(zip(characterlist, await asyncio.gather(*[lookup(character) for character in characterlist])))
+    finally:
+        fetcher.close()
+    # The characters that Bing could not help with are classified by their own names, all at once. Characters with
+    # no name at all are assumed to be male, just like gender_from_bing does.
+    unresolved = [character for character in characterlist if genders[character][0] == '' and len(character) > 0]
+    for character, gender in zip(unresolved, classify_many(backupclassifier,
+                                                           [character.title() for character in unresolved])):
+        genders[character] = gender, genders[character][1] or "name"
+    for character in characterlist:
+        if genders[character][0] == '':
+            genders[character] = "male", genders[character][1]
+    return genders
+
+
+###
+# Determines the gender of a character from the html of a Bing search for who played them.
+# Returns the gender and where it came from. name_gender is the gender of the character's name according to the
+# classifier, if it has already been worked out.
+###
+def gender_from_bing(character, raw_html, backupclassifier, name_gender=None):
+    from Name_Classifier import classify_many
+    gender, source = bing_gender(character, raw_html, backupclassifier)
+    # If we have come all this way without assigning a gender to the character,
+    # we go ahead and try to classify the character by their name.
+    # This is often not a great means of gender classification, but it is presumably
+    # better than nothing.
+    if gender == '':
+        if name_gender is None:
+            name_gender = classify_many(backupclassifier, [character.title()])[0]
+        gender = name_gender
+        source = "name"
+    return gender, source
+
+
+###
+# The part of gender_from_bing that only looks at the Bing results. Returns '' as the gender if they do not settle it.
+###
+def bing_gender(character, raw_html, backupclassifier):
+    from bs4 import BeautifulSoup
+    from Name_Classifier import classify_many
+    soup = BeautifulSoup(raw_html)
+    gender = ''
+    source = ''
+    if len(character) == 0:
+        gender = "male"
+        source = "default"
+    # The subtitle on the bing results b_content box often contains "Actor or Actress"
+    subtitle = soup.find('div', {'class': 'b_entitySubTitle'})
+    actor_snippet = soup.find('div', {'class': 'b_lBottom'})
+    # If the subtitle exists
+    if subtitle is not None:
+        sub_text = subtitle.get_text()
+        if 'Actor' in sub_text:
+            gender, source = 'male', "subtitle"
+        elif 'Actress' in sub_text:
+            gender, source = 'female', "subtitle"
+    # If there is no subtitle
+    else:
+        title = soup.find('h2', {'class': 'b_entityTitle'})
+        # The b_context box often contains a little tidbit about the life of the actor/actress
+        # (This is useful if they are listed as a "comedian" or "singer" or something along those lines
+        if actor_snippet is not None:
+            snip = actor_snippet.get_text()
+            if 'actress' in snip.lower():
+                gender, source = "female", "snippet"
+            elif 'actor' in snip.lower():
+                gender, source = 'male', "snippet"
+        # The names of the actors/actresses are often more useful in the classification of the gender than the
+        # names of the characters, so we classify their names if we can find them.
+        elif title is not None:
+            if len(title.get_text().split()) == 2:
+                gender = classify_many(backupclassifier, [title.get_text().split()[0].lower()])[0]
+                source = "actor_name"
+    return gender, source
 
 
 ###
@@ -266,9 +829,12 @@ def passes_test_one(characters, gender_map):
 # movie scripts have some meta data associated with them, and that's pretty uncool
 ###
 def extract_character_names(character_line):
-    if re.match(r'[A-Za-z\.\-]+.*\(.+\)?.*', character_line):
-        character = re.findall(r'([A-Z\-\.\s]+)(\s*\(.*\))?', character_line)[0][0].strip()
-    else:
+    character = None
+    if CHARACTER_WITH_NOTE.match(character_line):
+        name = CHARACTER_NAME.search(character_line)
+        if name is not None:
+            character = name.group(1).strip()
+    if character is None:
         character = character_line.strip()
     return character
 
@@ -277,14 +843,19 @@ def extract_character_names(character_line):
 # This function takes a list of tagged lines as input, and returns a list of scenes
 ###
 def split_by_scene(tagged_lines):
+    return list(iter_scenes(tagged_lines))
+
+
+###
+# Generator version of split_by_scene, which yields each scene as soon as the next scene boundary is reached.
+###
+def iter_scenes(tagged_lines):
     scene = []
-    scenes = []
     for line, tag in tagged_lines:
         if tag == "S":
-            scenes.append(scene)
+            yield scene
             scene = []
         scene.append((line, tag))
-    return scenes
 
 
 ###
@@ -292,15 +863,21 @@ def split_by_scene(tagged_lines):
 # the sanity check.
 ###
 def get_parseable_movies():
+    import Results_Store
     bechdel_list = open("Bechdel_Data", "r")
     parseable_scripts = open("Parseable", "w")
-    movies = [line.split(',')[0].strip() for line in bechdel_list.readlines()]
+    movies = [line.rsplit(',', 2)[0].strip() for line in bechdel_list.readlines()]
+    verdicts = []
     for movie in movies:
         try:
-            if is_well_formatted(movie) and sanity_check(tag_lines(movie)):
+            parsed = parse_script(movie)
+            verdicts.append((movie, parsed['well_formatted'], parsed['sane']))
+            if parsed['well_formatted'] and parsed['sane']:
                 parseable_scripts.write(movie + "\n")
         except FileNotFoundError:
             continue
+    parseable_scripts.close()
+    Results_Store.save_parseable(verdicts, "Parseable")
 
 
 ###
@@ -309,61 +886,27 @@ def get_parseable_movies():
 # The test_num input variable corresponds with which test you are checking for the performance of.
 ###
 def evaluate_test(test_num):
-    moviesfile = open("Bechdel_Data", 'r')
-    testfile = open("t"+str(test_num), 'r')
-    moviesfile.readline()
-    bechdel_scores = {}
-    visited = {}
-    total = 0
-    true_pos = 0
-    false_pos = 0
-    true_neg = 0
-    false_neg = 0
-    for line in moviesfile:
-        if len(line.split(',')) == 3:
-            data = line.split(',')
-            movie = data[0].strip()
-            score = data[2].strip()
-            bechdel_scores[movie] = score
-    for line in testfile:
-        data = line.split(',')
-        movie = data[0].strip()
-        if not visited.get(movie):
-            visited[movie] = True
-            total += 1
-            passes_test = data[1].strip() == "True"
-            # print(movie, passes_test)
-            # If the classifier evaluates that the movie passes the test
-            if passes_test:
-                # Check if the data agrees
-                # True Positive:
-                if int(bechdel_scores[movie]) >= test_num:
-                    true_pos += 1
-                # False positive
-                else:
-                    false_pos += 1
-            # If the classifier evaluates that the movie failed the test
-            else:
-                # True Negative:
-                if int(bechdel_scores[movie]) < test_num:
-                    true_neg += 1
-                # False Negative:
-                else:
-                    false_neg += 1
-        else:
-            print(movie)
+    import Evaluation
+    report = Evaluation.evaluate(test_num)
+    for movie in report['duplicates']:
+        print(movie)
+    for movie in report['unknown']:
+        print("Not in Bechdel_Data: " + movie)
+    confusion = report['confusion']
+    metrics = report['metrics']
     print("Test: "+str(test_num))
-    print("Total: " + str(total))
-    print("True Positives: " + str(true_pos))
-    print("True Negatives: " + str(true_neg))
-    print("False Positives: " + str(false_pos))
-    print("False Negatives: " + str(false_neg))
-    print("Total Accuracy: " + str((true_pos + true_neg) / total))
-    print("Recall (positive)" + str(true_pos/(true_pos+false_neg)))
-    print("Precision (positive)" + str(true_pos/(true_pos+false_pos)))
-    print("Recall (negative)" + str(true_neg/(true_neg+false_pos)))
-    print("Precision (negative)" + str(true_neg/(true_neg + false_neg)))
+    print("Total: " + str(report['total']))
+    print("True Positives: " + str(confusion['true_pos']))
+    print("True Negatives: " + str(confusion['true_neg']))
+    print("False Positives: " + str(confusion['false_pos']))
+    print("False Negatives: " + str(confusion['false_neg']))
+    print("Total Accuracy: " + str(metrics['accuracy']))
+    print("Recall (positive)" + str(metrics['recall_pos']))
+    print("Precision (positive)" + str(metrics['precision_pos']))
+    print("Recall (negative)" + str(metrics['recall_neg']))
+    print("Precision (negative)" + str(metrics['precision_neg']))
     print()
+    return report
 
 
 ###
@@ -376,9 +919,7 @@ def perform_test_one():
     gender_classifier = make_classifier()
     testoneresults = open("Test_One_Results", 'w')
     for movie in movies:
-        tagged_lines = tag_lines(movie)
-        char_lines = [line.strip() for line, tag in tagged_lines if tag == "C"]
-        chars = get_popular_characters([extract_character_names(char) for char in char_lines])
+        chars = get_popular_characters(get_character_names(movie))
         genders = classify_genders_bing(movie, gender_classifier, chars)
         print(movie + " passes test one: " + str(passes_test_one(chars, genders)))
         testoneresults.write(movie + ", " + str(passes_test_one(chars, genders)) + "\n")
@@ -395,156 +936,327 @@ def make_genders_files():
     movies = [movie.strip() for movie in moviesfile.readlines()]
     gender_classifier = make_classifier()
     for movie in movies:
-        charfile = open("./Characters/" + movie, "w")
-        tagged_lines = tag_lines(movie)
-        char_lines = [line.strip() for line, tag in tagged_lines if tag == "C"]
-        chars = get_popular_characters([extract_character_names(char) for char in char_lines])
-        genders = classify_genders_bing(movie, gender_classifier, chars)
-        for character in chars:
-            charfile.write(character + "," + genders[character] + "\n")
+        write_genders_file(movie, gender_classifier)
 
 
 ###
-# This function takes the name of a movie as input, and checks if the movie passes the second part of the Bechdel test
-# by examining the lines tagged "C" and seeing if any two consecutive lines are both marked "female" and do not
-# correspond with the same character.
+# Looks up the genders of the popular characters of a movie and writes its characters file. The file is written to a
+# temporary file first, so that a run that dies halfway through (or two workers on the same movie) never leaves half
+# of one behind. Returns the number of characters written.
+###
+def write_genders_file(movie, gender_classifier):
+    chars = get_popular_characters(get_character_names(movie))
+    genders = classify_genders_bing(movie, gender_classifier, chars)
+    os.makedirs(CHARACTER_PATH, exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(dir=CHARACTER_PATH, suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, "w") as charfile:
+            for character in chars:
+                charfile.write(character + "," + genders[character] + "\n")
+        os.replace(temporary, CHARACTER_PATH + movie)
+    except BaseException:
+        os.remove(temporary)
+        raise
+    return len(chars)
+
+
+###
+# Reads the characters file of a movie, and returns the list of characters in it and a dictionary that maps them all
+# to their genders.
 ###
-def passes_test_two(movie):
-    # Tag the lines in the movie
-    tagged_lines = tag_lines(movie)
-    # Split the movie up into scenes
-    scenes = split_by_scene(tagged_lines)
-    # Get a list of characters from the corresponding characters file
-    character_file = open('./Characters/' + movie)
+def read_characters(movie):
+    character_file = open_characters_file(movie)
     characters = []
     gender = {}
-    # Default pass status of False
-    passes_t2 = False
-    # Create a list of character names, and map them all to their genders
     for line in character_file.readlines():
-        data = line.split(",")
+        data = line.rsplit(",", 1)
         if len(data) == 2:
             char = data[0].strip()
             characters.append(char)
             gender[char] = data[1].strip()
-    # Iterate through every scene
+    character_file.close()
+    return characters, gender
+
+
+###
+# Checks if any two consecutive character names in a scene are both marked "female" and are not the same character.
+# If a character does not appear often enough to have landed in the common character list, it is safe enough to
+# assume that they have no name or are a male anyway.
+###
+def has_female_pair(scene_characters, gender):
+    for char in range(len(scene_characters) - 1):
+        c1 = scene_characters[char]
+        c2 = scene_characters[char + 1]
+        if gender.get(c1) == "female" and gender.get(c2) == "female" and c1 != c2:
+            return True
+    return False
+
+
+###
+# The scanner for the terms that count as mentioning a man in test three: the names of the male characters, and
+# terms (MALE_TERMS unless another lexicon is given). It is built once per movie, and finds names of more than one
+# word and terms with punctuation stuck to them (see Dialogue_Scanner).
+###
+def male_scanner(characters, gender, terms=None):
+    male_characters = [character for character in characters if gender[character] == "male"]
+    return DialogueScanner(male_characters + list(MALE_TERMS if terms is None else terms))
+
+
+###
+# Checks if the dialog of a scene mentions any of the terms of a male_scanner.
+###
+def mentions_men(scene, scanner):
+    return scanner.first_reference(scene) is not None
+
+
+###
+# This function takes the name of a movie as input, and checks if the movie passes the second part of the Bechdel test
+# by examining the lines tagged "C" and seeing if any two consecutive lines are both marked "female" and do not
+# correspond with the same character.
+#
+# Very large scripts can be passed with stream=True to avoid tagging the whole script into memory.
+###
+@Instrumentation.timed("test_two")
+def passes_test_two(movie, stream=False):
+    # Get the names of the characters on the "C" lines of each scene
+    if stream:
+        scenes = ([extract_character_names(line.strip()) for line, tag in scene if tag == "C"]
+                  for scene in stream_scenes(movie))
+    else:
+        scenes = get_scene_characters(movie)
+    # Get a list of characters from the corresponding characters file, and map them all to their genders
+    characters, gender = read_characters(movie)
+    # Iterate through every scene, until one of them has two female characters talking to each other
     for scene in scenes:
-        # Gather all of the Character name lines
-        char_lines = [line.strip() for line, tag in scene if tag == "C"]
-        # If the scene is not a character monologue
-        if len(char_lines) > 1:
-            # look through all of the characters in the scene
-            for char in range(len(char_lines) -1):
-                c1 = extract_character_names(char_lines[char])
-                c2 = extract_character_names(char_lines[char+1])
-                try:
-                    # see if the characters are both female, and make sure that they are not the same character
-                    if gender[c1] == "female" and gender[c2] == "female" and c1 != c2:
-                        # the movie passes test 2
-                        passes_t2 = True
-                # if the character does not appear often enough to have landed in the common character list,
-                # it is safe enough to assume that they have no name or are a male anyway.
-                except KeyError:
-                    continue
-    return passes_t2
+        Instrumentation.count("scenes_scanned", test="two")
+        if has_female_pair(scene, gender):
+            return True
+    return False
 
 
 ###
 # A test to see if a movie passes test three. Iterates through the scenes until it finds a scene with two female
 # characters mentioned in consecutive order. When such a scene is found, it looks through all of the dialog lines
-# in that scene (split by spaces) if the dialog does not contain a male pronoun, or the name
+# in that scene (with a male_scanner) if the dialog does not contain a male pronoun, or the name
 # of another character in the movie who has been marked as a male, the function marks it as a dialog
 # act that does not mention a man, and we say that the movie passes the third test.
 #
-# Accepts a movie name as an argument.
+# Accepts a movie name as an argument. Very large scripts can be passed with stream=True to avoid tagging the whole
+# script into memory.
 ###
-def passes_test_three(movie):
-    tagged_lines = tag_lines(movie)
-    scenes = split_by_scene(tagged_lines)
-    character_file = open('./Characters/'+movie)
-    characters = []
-    gender = {}
+@Instrumentation.timed("test_three")
+def passes_test_three(movie, stream=False, terms=None):
+    characters, gender = read_characters(movie)
+    male_terms = male_scanner(characters, gender, terms)
+    for scene in get_scenes(movie, stream):
+        Instrumentation.count("scenes_scanned", test="three")
+        # Note that the character lines are not stripped here, unlike in test two
+        char_lines = [extract_character_names(line) for line, tag in scene if tag == "C"]
+        if has_female_pair(char_lines, gender) and not mentions_men(scene, male_terms):
+            return True
+    return False
+
+
+###
+# The evidence behind the verdict of test three: for every scene with two female characters talking to each other,
+# the index of the scene and the References (see Dialogue_Scanner) of every mention of a man in its dialog. The movie
+# passes test three if any of the scenes has no references.
+###
+def test_three_evidence(movie, terms=None):
+    characters, gender = read_characters(movie)
+    scanner = male_scanner(characters, gender, terms)
+    evidence = []
+    for number, scene in enumerate(get_scenes(movie)):
+        char_lines = [extract_character_names(line) for line, tag in scene if tag == "C"]
+        if has_female_pair(char_lines, gender):
+            evidence.append((number, scanner.scan(scene)))
+    return evidence
+
+
+###
+# Runs all three tests on a movie in a single pass over its scenes, and returns whether it passes tests one, two and
+# three (in that order). The results are the same as passes_test_one (with the genders from the characters file),
+# passes_test_two and passes_test_three, but the movie is only read and split up once, and the pass stops as soon as
+# both test two and test three have passed.
+###
+@Instrumentation.timed("evaluate_movie")
+def evaluate_movie(movie):
+    characters, gender = read_characters(movie)
+    return evaluate_parse(parse_script(movie), characters, gender)
+
+
+###
+# Does the work for evaluate_movie on a parse (from parse_script or build_parse), given the characters of the movie
+# and their genders, so that scripts that are not in SCRIPT_PATH can be evaluated as well.
+###
+def evaluate_parse(parsed, characters, gender, terms=None):
+    passes_t1 = passes_test_one(characters, gender)
+    male_terms = male_scanner(characters, gender, terms)
+    passes_t2 = False
     passes_t3 = False
-    male_characters = []
-    for line in character_file.readlines():
-        data = line.split(",")
-        if len(data) == 2:
-            char = data[0].strip()
-            characters.append(char)
-            gender[char] = data[1].strip()
-    for character in characters:
-        if gender[character] == "male":
-            male_characters.append(character.lower())
-    for scene in scenes:
-        candidate_scene = False
-        char_lines = [line for line,tag in scene if tag == "C"]
-        if len(char_lines) > 1:
-            # look through all of the characters in the scene
-            for char in range(len(char_lines) -1):
-                c1 = extract_character_names(char_lines[char])
-                c2 = extract_character_names(char_lines[char+1])
-                try:
-                    # see if the characters are both female, and make sure that they are not the same character
-                    if gender[c1] == "female" and gender[c2] == "female" and c1 != c2:
-                        # the movie passes test 2
-                        candidate_scene = True
-                # if the character does not appear often enough to have landed in the common character list,
-                # it is safe enough to assume that they have no name or are a male anyway.
-                except KeyError:
-                    continue
-        if candidate_scene:
-            mentions_men = False
-            dialog_lines = [line for line,tag in scene if tag == "D"]
-            for line in dialog_lines:
-                for item in line.split():
-                    if item.lower() in male_characters+["he","him","his","man"]:
-                        mentions_men = True
-            if not mentions_men:
-                passes_t3 = True
-    return passes_t3
-
-
-###
-# Iterates through all parseable movies, and if they pass test two
+    for scene, scene_characters in zip(parse_scenes(parsed), parse_scene_characters(parsed)):
+        Instrumentation.count("scenes_scanned", test="all")
+        if not passes_t2:
+            passes_t2 = has_female_pair(scene_characters, gender)
+        if not passes_t3:
+            char_lines = [extract_character_names(line) for line, tag in scene if tag == "C"]
+            passes_t3 = has_female_pair(char_lines, gender) and not mentions_men(scene, male_terms)
+        if passes_t2 and passes_t3:
+            break
+    return passes_t1, passes_t2, passes_t3
+
+
+###
+# Iterates through all parseable movies, and if they pass test two. The titles in Parseable and t1 are matched up by
+# their Title_Index keys, so that a title written slightly differently in one of them is not lost.
 ###
 def perform_test_two():
+    import Results_Store
+    from Title_Index import title_key
     test_one_results = open('t1', 'r')
     passed_t1 = {}
     for line in test_one_results:
-        data = line.split(',')
-        passed_t1[data[0].strip()] = data[1].strip() == "True"
+        data = line.rsplit(',', 1)
+        passed_t1[title_key(data[0].strip())] = data[1].strip() == "True"
     moviesfile = open("Parseable", 'r')
     test_two_results = open('t2', 'w')
     movies = [movie.strip() for movie in moviesfile.readlines()]
+    results = []
     for movie in movies:
-        if passed_t1[movie]:
-            test_two_results.write(movie+","+str(passes_test_two(movie))+"\n")
+        if passed_t1.get(title_key(movie), False):
+            results.append((movie, passes_test_two(movie)))
+            test_two_results.write(movie+","+str(results[-1][1])+"\n")
+    test_two_results.close()
+    Results_Store.save_predictions(2, results, 't2')
 
 
 ###
 # Iterates through all of the movies that passed test two, And then sees if they pass test three
 ###
 def perform_test_three():
+    import Results_Store
+    from Title_Index import title_key
     test_two_results = open("t2", "r")
     passed_t2 = {}
     for line in test_two_results:
-        data = line.split(',')
-        passed_t2[data[0].strip()] = data[1].strip() == "True"
+        data = line.rsplit(',', 1)
+        passed_t2[title_key(data[0].strip())] = data[1].strip() == "True"
     moviesfile = open("Parseable", 'r')
     test_three_results = open('t3', 'w')
     movies = [movie.strip() for movie in moviesfile.readlines()]
+    results = []
     for movie in movies:
-        try:
-            if passed_t2[movie]:
-                test_three_results.write(movie+","+str(passes_test_three(movie))+"\n")
-        except KeyError:
-            continue
+        if passed_t2.get(title_key(movie), False):
+            results.append((movie, passes_test_three(movie)))
+            test_three_results.write(movie+","+str(results[-1][1])+"\n")
+    test_three_results.close()
+    Results_Store.save_predictions(3, results, 't3')
+
+
+###
+# Runs all three tests on every parseable movie with evaluate_movie, and writes the results to t1, t2 and t3 (and the
+# Results_Store). Just like with the separate perform_test_* functions, only the movies that passed test one are
+# written to t2, and only the movies that passed test two are written to t3.
+###
+def perform_tests():
+    import Results_Store
+    moviesfile = open("Parseable", 'r')
+    movies = [movie.strip() for movie in moviesfile.readlines()]
+    test_one_results = open('t1', 'w')
+    test_two_results = open('t2', 'w')
+    test_three_results = open('t3', 'w')
+    results = {1: [], 2: [], 3: []}
+    for movie in movies:
+        passes_t1, passes_t2, passes_t3 = evaluate_movie(movie)
+        test_one_results.write(movie + "," + str(passes_t1) + "\n")
+        results[1].append((movie, passes_t1))
+        if passes_t1:
+            test_two_results.write(movie + "," + str(passes_t2) + "\n")
+            results[2].append((movie, passes_t2))
+            if passes_t2:
+                test_three_results.write(movie + "," + str(passes_t3) + "\n")
+                results[3].append((movie, passes_t3))
+    test_one_results.close()
+    test_two_results.close()
+    test_three_results.close()
+    for test, filename in [(1, 't1'), (2, 't2'), (3, 't3')]:
+        Results_Store.save_predictions(test, results[test], filename)
 
 
-def main():
-    evaluate_test(1)
-    evaluate_test(2)
-    evaluate_test(3)
+###
+# The command line interface. Run without a command, this evaluates all three tests, just like it always has.
+#
+#   parse [movie ...]      Parses the given movies and prints their verdicts, or writes Parseable if none are given
+#   classify-genders       Writes the characters files of every parseable movie
+#   test1, test2, test3    Performs a test on every parseable movie and writes its results file
+#   evaluate [test ...]    Evaluates the results files of the tests against Bechdel_Data (optionally to JSON/CSV)
+#   build [movie ...]      Brings Parseable, t1, t2 and t3 up to date, only recomputing what changed (see Build_Graph)
+#   scrape results|scripts Scrapes the Bechdel test results or the IMSDb scripts
+###
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tools for the automated Bechdel test.")
+    commands = parser.add_subparsers(dest="command")
+    parse_command = commands.add_parser("parse", help="parse scripts and check if they are parseable")
+    parse_command.add_argument("movies", nargs="*")
+    commands.add_parser("classify-genders", help="write the characters files of every parseable movie")
+    commands.add_parser("test1", help="perform test one on every parseable movie")
+    commands.add_parser("test2", help="perform test two on every movie that passed test one")
+    commands.add_parser("test3", help="perform test three on every movie that passed test two")
+    evaluate_command = commands.add_parser("evaluate", help="evaluate the test results against Bechdel_Data")
+    # The tests are checked after parsing, since older versions of argparse check an empty list against choices
+    evaluate_command.add_argument("tests", nargs="*", type=int, help="the tests to evaluate (1, 2 and/or 3)")
+    evaluate_command.add_argument("--json", help="also write the full report to this JSON file")
+    evaluate_command.add_argument("--csv", help="also write the full report to this CSV file")
+    build_command = commands.add_parser("build", help="recompute the stale results in Parseable, t1, t2 and t3")
+    build_command.add_argument("movies", nargs="*")
+    build_command.add_argument("--genders", choices=["bing", "characters"], default="bing",
+                               help="where test one gets the genders of the characters from")
+    build_command.add_argument("--force", action="store_true", help="recompute everything")
+    scrape_command = commands.add_parser("scrape", help="scrape the Bechdel test results or the IMSDb scripts")
+    scrape_command.add_argument("source", choices=["results", "scripts"])
+    scrape_command.add_argument("--full", action="store_true", help="refetch pages that are still fresh")
+    arguments = parser.parse_args(sys.argv[1:] if argv is None else argv)
+    for test_num in getattr(arguments, "tests", None) or []:
+        if test_num not in [1, 2, 3]:
+            evaluate_command.error("argument tests: invalid choice: " + str(test_num) + " (choose from 1, 2, 3)")
+
+    if arguments.command == "parse":
+        if len(arguments.movies) == 0:
+            get_parseable_movies()
+        for movie in arguments.movies:
+            parsed = parse_script(movie)
+            print(movie + ": well formatted: " + str(parsed['well_formatted']) + ", sane: " + str(parsed['sane']) +
+                  ", lines: " + str(len(parsed['tagged_lines'])) + ", scenes: " + str(len(parsed['scene_starts'])))
+    elif arguments.command == "classify-genders":
+        make_genders_files()
+    elif arguments.command == "test1":
+        perform_test_one()
+    elif arguments.command == "test2":
+        perform_test_two()
+    elif arguments.command == "test3":
+        perform_test_three()
+    elif arguments.command == "build":
+        import Build_Graph
+        summary = Build_Graph.build(arguments.movies or None, arguments.genders, arguments.force)
+        for node in Build_Graph.NODES:
+            print(node + ": " + str(summary["recomputed"][node]) + " recomputed, " + str(summary["reused"][node]) +
+                  " reused, " + str(summary["dropped"][node]) + " dropped")
+    elif arguments.command == "scrape":
+        if arguments.source == "results":
+            import Result_Data_Scraper
+            Result_Data_Scraper.main(incremental=not arguments.full)
+        else:
+            import Script_Data_Scraper
+            Script_Data_Scraper.main(incremental=not arguments.full)
+    else:
+        tests = getattr(arguments, "tests", None) or [1, 2, 3]
+        report = {'tests': [evaluate_test(test_num) for test_num in tests]}
+        if getattr(arguments, "json", None) or getattr(arguments, "csv", None):
+            import Evaluation
+            if arguments.json:
+                Evaluation.write_report_json(report, arguments.json)
+            if arguments.csv:
+                Evaluation.write_report_csv(report, arguments.csv)
 
 
 # I want to be able to import these functions as a module in a separate .py file without running the main method.
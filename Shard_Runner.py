@@ -0,0 +1,396 @@
+"""
+Runs a stage of Script_Tagger over a corpus on several machines at once, when all they share is a filesystem.
+
+A run lives in a directory on the shared filesystem:
+    manifest.json        The stage, and the movies split into shards of shard_size movies (made by plan)
+    leases/<shard>       Whoever is working on a shard: the worker and the time its lease expires
+    results/<shard>.json The (movie, result, error) of every movie in a shard, once the shard is finished
+
+Workers (work) take the first unfinished shard they can get a lease on, and keep the lease alive with a heartbeat
+while they work on it. A lease is taken by creating its file exclusively, so two workers never get the same shard.
+If a worker dies, its heartbeat stops and its lease expires after LEASE_TIME, at which point another worker takes the
+lease over (by renaming the expired lease out of the way first, which only one of them can do) and does the shard
+again. A worker whose heartbeat finds that its lease has been taken over gives up on the shard without writing its
+results. A worker stops once every shard has results.
+
+merge then writes the outputs of the stage from the results, in the order of the manifest, just like Corpus_Runner:
+    parseable  Parseable, from the movies in Bechdel_Data
+    genders    the characters files of the movies in Parseable (written by the workers, so merge only reports them)
+    test1      t1, from the movies in Parseable
+    test2      t2, from the movies in Parseable that passed test one
+    test3      t3, from the movies in Parseable that passed test two
+    tests      t1, t2 and t3 in one pass with evaluate_movie, from the movies in Parseable
+
+Every worker has to run from a directory with the same Bechdel_Data, Scripts, Characters (or Corpus.pack) as the
+others. run_local starts a few worker processes on this machine, which is handy for trying a run out.
+
+Usage:
+    python Shard_Runner.py plan RUN_DIR STAGE [--shard-size N]
+    python Shard_Runner.py work RUN_DIR [--worker NAME]
+    python Shard_Runner.py merge RUN_DIR
+    python Shard_Runner.py local RUN_DIR STAGE [--workers N] [--shard-size N]
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import threading
+import multiprocessing
+import Script_Tagger
+import Corpus_Runner
+
+
+SHARD_SIZE = 16
+
+# How long a lease lasts without a heartbeat, and how often a worker renews its lease
+LEASE_TIME = 60.0
+HEARTBEAT = 15.0
+
+# How long a worker waits before looking again when every unfinished shard is leased by someone else
+POLL_INTERVAL = 5.0
+
+STAGES = ["parseable", "genders", "test1", "test2", "test3", "tests"]
+
+
+###
+# The per-movie work of make_genders_files, with the classifier that the worker loaded
+###
+def write_genders_file(movie):
+    return Script_Tagger.write_genders_file(movie, Corpus_Runner._classifier)
+
+
+# stage -> (the per-movie function, whether the workers need the name classifier)
+STAGE_FUNCTIONS = {
+    "parseable": (Corpus_Runner.parse_verdict, False),
+    "genders": (write_genders_file, True),
+    "test1": (Corpus_Runner.passes_test_one, True),
+    "test2": (Script_Tagger.passes_test_two, False),
+    "test3": (Script_Tagger.passes_test_three, False),
+    "tests": (Script_Tagger.evaluate_movie, False)
+}
+
+
+###
+# The movies that a stage runs on, read the same way as the perform_test_* functions and Corpus_Runner read them.
+###
+def stage_movies(stage):
+    if stage == "parseable":
+        with open("Bechdel_Data", "r") as bechdel_list:
+            return [line.rsplit(',', 2)[0].strip() for line in bechdel_list.readlines()]
+    movies = Corpus_Runner.read_movies("Parseable")
+    if stage == "test2":
+        passed_t1 = Corpus_Runner.read_test_results("t1")
+        movies = [movie for movie in movies if passed_t1.get(movie)]
+    elif stage == "test3":
+        passed_t2 = Corpus_Runner.read_test_results("t2")
+        movies = [movie for movie in movies if passed_t2.get(movie)]
+    return movies
+
+
+def write_json(filename, data):
+    with open(filename + ".tmp", "w") as json_file:
+        json.dump(data, json_file)
+    os.replace(filename + ".tmp", filename)
+
+
+def read_json(filename):
+    with open(filename, "r") as json_file:
+        return json.load(json_file)
+
+
+def lease_file(run_dir, shard):
+    return os.path.join(run_dir, "leases", str(shard))
+
+
+def result_file(run_dir, shard):
+    return os.path.join(run_dir, "results", str(shard) + ".json")
+
+
+###
+# Starts a run of a stage: splits its movies into shards and writes the manifest. Returns the manifest.
+###
+def plan(run_dir, stage, shard_size=SHARD_SIZE, movies=None):
+    if stage not in STAGE_FUNCTIONS:
+        raise ValueError("Unknown stage: " + stage)
+    if movies is None:
+        movies = stage_movies(stage)
+    os.makedirs(os.path.join(run_dir, "leases"), exist_ok=True)
+    os.makedirs(os.path.join(run_dir, "results"), exist_ok=True)
+    manifest = {
+        "stage": stage,
+        "created": time.time(),
+        "shards": [movies[start:start + shard_size] for start in range(0, len(movies), shard_size)]
+    }
+    write_json(os.path.join(run_dir, "manifest.json"), manifest)
+    return manifest
+
+
+###
+# A lease on one shard of a run, kept alive by a heartbeat thread for as long as it is held.
+#
+# A renewal never removes the lease file: it checks that the lease still names this worker, writes the renewed lease to
+# a file of its own and moves it over the old one with os.replace, then reads it back. A take-over or a release first
+# renames the lease to a name of their own, which only one of them can do, and then looks at what they moved: if it is
+# not what they expected (e.g. it was renewed after it looked expired), they put it back with os.link, which (like
+# creating it with O_EXCL) fails if there is a lease there again. If a heartbeat finds that the lease names someone
+# else, it sets lost, and the worker gives up on the shard. (A holder that stalls past its lease and then renews it
+# between a take-over and the new holder's next heartbeat keeps the lease, and the new holder is the one that gives up.)
+###
+class Lease:
+    def __init__(self, run_dir, shard, worker, lease_time=LEASE_TIME, heartbeat=HEARTBEAT):
+        self.path = lease_file(run_dir, shard)
+        self.worker = worker
+        self.lease_time = lease_time
+        self.heartbeat = heartbeat
+        self.stopped = threading.Event()
+        self.lost = threading.Event()
+        self.thread = None
+
+    def contents(self):
+        return json.dumps({"worker": self.worker, "expires": time.time() + self.lease_time})
+
+    ###
+    # Tries to take the lease, taking it over if its holder has let it expire. Returns whether it was taken.
+    ###
+    def acquire(self):
+        try:
+            descriptor = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if not self.expired():
+                return False
+            # Only one of the workers trying to take over the lease gets to move it out of the way, and it may have
+            # been renewed since it was looked at
+            moved = self.take_out(".expired.")
+            if moved is None:
+                return False
+            if not lease_expired(moved, self.lease_time):
+                self.put_back(moved)
+                return False
+            os.remove(moved)
+            try:
+                descriptor = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                return False
+        with os.fdopen(descriptor, "w") as lease:
+            lease.write(self.contents())
+        self.thread = threading.Thread(target=self.beat, daemon=True)
+        self.thread.start()
+        return True
+
+    def expired(self):
+        return lease_expired(self.path, self.lease_time)
+
+    def held(self):
+        return lease_worker(self.path) == self.worker
+
+    ###
+    # Moves the lease file to a name of this worker's, so that no one else can change it. Returns where it was moved
+    # to, or None if there was no lease to move.
+    ###
+    def take_out(self, suffix):
+        moved = self.path + suffix + self.worker
+        try:
+            os.rename(self.path, moved)
+        except FileNotFoundError:
+            return None
+        return moved
+
+    ###
+    # Puts a lease that was taken out back where it was, unless there is a new lease there already.
+    ###
+    def put_back(self, moved):
+        try:
+            os.link(moved, self.path)
+        except FileExistsError:
+            pass
+        os.remove(moved)
+
+    ###
+    # Renews the lease if it is still this worker's, without the lease file ever going missing. Returns whether the
+    # lease is still held afterwards.
+    ###
+    def renew(self):
+        if not self.held():
+            return False
+        renewed = self.path + "." + self.worker
+        with open(renewed, "w") as lease:
+            lease.write(self.contents())
+        os.replace(renewed, self.path)
+        return self.held()
+
+    ###
+    # Renews the lease every heartbeat until it is released, or until it turns out that someone else has taken it.
+    ###
+    def beat(self):
+        while not self.stopped.wait(self.heartbeat):
+            if not self.renew():
+                self.lost.set()
+                return
+
+    def release(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        if self.lost.is_set():
+            return
+        moved = self.take_out(".released.")
+        if moved is None:
+            return
+        if lease_worker(moved) == self.worker:
+            os.remove(moved)
+        else:
+            self.put_back(moved)
+
+
+###
+# Whether the lease in a file has expired. A lease that is being written (or was cut off by a crash) counts as expired
+# once it is old enough.
+###
+def lease_expired(filename, lease_time):
+    try:
+        return read_json(filename)["expires"] < time.time()
+    except FileNotFoundError:
+        return False
+    except ValueError:
+        try:
+            return os.path.getmtime(filename) + lease_time < time.time()
+        except FileNotFoundError:
+            return False
+
+
+###
+# The worker named in a lease file, or None if it cannot be read
+###
+def lease_worker(filename):
+    try:
+        return read_json(filename)["worker"]
+    except (OSError, ValueError):
+        return None
+
+
+###
+# Works on the shards of a run until every shard has results, and returns the number of shards this worker finished.
+###
+def work(run_dir, worker=None, lease_time=LEASE_TIME, heartbeat=HEARTBEAT, poll_interval=POLL_INTERVAL):
+    if worker is None:
+        worker = socket.gethostname() + "-" + str(os.getpid())
+    manifest = read_json(os.path.join(run_dir, "manifest.json"))
+    function, needs_classifier = STAGE_FUNCTIONS[manifest["stage"]]
+    finished = 0
+    while True:
+        remaining = [shard for shard in range(len(manifest["shards"]))
+                     if not os.path.exists(result_file(run_dir, shard))]
+        if len(remaining) == 0:
+            return finished
+        for shard in remaining:
+            lease = Lease(run_dir, shard, worker, lease_time, heartbeat)
+            if not lease.acquire():
+                continue
+            try:
+                # Another worker may have finished the shard between looking and taking the lease
+                if not os.path.exists(result_file(run_dir, shard)):
+                    if needs_classifier and Corpus_Runner._classifier is None:
+                        Corpus_Runner.load_classifier()
+                    results = []
+                    for movie in manifest["shards"][shard]:
+                        # A worker that has lost its lease leaves the shard to whoever took it over
+                        if lease.lost.is_set():
+                            break
+                        results.append(Corpus_Runner.run_job((function, movie)))
+                    for movie, result, error in results:
+                        if error is not None:
+                            print("Failed on " + movie + ": " + error)
+                    if lease.lost.is_set():
+                        print("Lost the lease on shard " + str(shard))
+                    else:
+                        write_json(result_file(run_dir, shard), {"worker": worker, "results": results})
+                        finished += 1
+            finally:
+                lease.release()
+            break
+        else:
+            time.sleep(poll_interval)
+
+
+###
+# The (movie, result, error) of every movie in a run, in the order of the manifest. Raises an error if any shard is
+# still unfinished.
+###
+def read_results(run_dir):
+    manifest = read_json(os.path.join(run_dir, "manifest.json"))
+    results = []
+    for shard in range(len(manifest["shards"])):
+        try:
+            results.extend(tuple(result) for result in read_json(result_file(run_dir, shard))["results"])
+        except FileNotFoundError:
+            raise RuntimeError("Shard " + str(shard) + " of " + run_dir + " has not finished yet")
+    return manifest["stage"], results
+
+
+###
+# Writes the outputs of a finished run, and returns the number of movies that failed.
+###
+def merge(run_dir):
+    stage, results = read_results(run_dir)
+    if stage == "parseable":
+        Corpus_Runner.write_parseable(results)
+    elif stage in ["test1", "test2", "test3"]:
+        Corpus_Runner.write_test_results("t" + stage[-1], results, int(stage[-1]))
+    elif stage == "tests":
+        Corpus_Runner.write_tests_results(results)
+    else:
+        print("Wrote the characters files of " + str(sum(1 for result in results if result[2] is None)) + " movies")
+    return sum(1 for result in results if result[2] is not None)
+
+
+###
+# Runs a stage with a few worker processes on this machine, and merges the results.
+###
+def run_local(run_dir, stage, workers=4, shard_size=SHARD_SIZE, movies=None, lease_time=LEASE_TIME,
+              heartbeat=HEARTBEAT, poll_interval=POLL_INTERVAL):
+    plan(run_dir, stage, shard_size, movies)
+    processes = [multiprocessing.Process(target=work, args=(run_dir, "local-" + str(number), lease_time, heartbeat,
+                                                            poll_interval))
+                 for number in range(workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    return merge(run_dir)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Runs a stage of Script_Tagger in shards over a shared directory.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    plan_command = commands.add_parser("plan", help="split the movies of a stage into shards")
+    plan_command.add_argument("run_dir")
+    plan_command.add_argument("stage", choices=STAGES)
+    plan_command.add_argument("--shard-size", type=int, default=SHARD_SIZE)
+    work_command = commands.add_parser("work", help="work on the shards of a run until they are all finished")
+    work_command.add_argument("run_dir")
+    work_command.add_argument("--worker")
+    merge_command = commands.add_parser("merge", help="write the outputs of a finished run")
+    merge_command.add_argument("run_dir")
+    local_command = commands.add_parser("local", help="plan, work and merge a run with local worker processes")
+    local_command.add_argument("run_dir")
+    local_command.add_argument("stage", choices=STAGES)
+    local_command.add_argument("--workers", type=int, default=4)
+    local_command.add_argument("--shard-size", type=int, default=SHARD_SIZE)
+    args = parser.parse_args(argv)
+    if args.command == "plan":
+        manifest = plan(args.run_dir, args.stage, args.shard_size)
+        print(str(len(manifest["shards"])) + " shards")
+    elif args.command == "work":
+        print(str(work(args.run_dir, args.worker)) + " shards finished")
+    elif args.command == "merge":
+        return 1 if merge(args.run_dir) > 0 else 0
+    else:
+        return 1 if run_local(args.run_dir, args.stage, args.workers, args.shard_size) > 0 else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
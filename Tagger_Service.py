@@ -0,0 +1,233 @@
+"""
+A long-running local HTTP service for scoring scripts without paying for a cold start every time.
+
+The service loads the name classifier once when it starts, and keeps the characters files it has read, the parses of
+the movies in SCRIPT_PATH (through parse_script) and the parses of the scripts it has been sent (PARSE_CACHE_SIZE of
+them, most recently used first) in memory between requests.
+
+Requests (JSON bodies, JSON responses):
+    GET  /health          {"status": "ok", "tagger_version": ...}
+    POST /evaluate        One script, either {"movie": name} for a movie in SCRIPT_PATH (with its characters file), or
+                          {"script": text, "title": title} for a script sent along with the request. Scripts sent
+                          along can have their characters and genders given as "characters": [[name, gender], ...];
+                          otherwise the most common characters in the script are classified by their names.
+                          Add "tagged": true to get the tagged lines back as well.
+    POST /evaluate_batch  {"scripts": [request, ...]}, and returns {"results": [...]} in the same order. A script that
+                          fails gets {"error": message} as its result instead of failing the whole batch.
+
+Every evaluation returns the title, the verdicts of the format and sanity checks, the characters and genders that were
+used (and where the genders came from), and the verdicts of the three tests.
+"""
+
+import os
+import json
+import hashlib
+import threading
+import collections
+import http.server
+import urllib.request
+import urllib.error
+import Script_Tagger
+from Script_Pack import CHARACTERS
+from Name_Classifier import load_classifier, classify_many
+
+
+HOST = '127.0.0.1'
+PORT = 8475
+
+PARSE_CACHE_SIZE = 256
+
+# Requests bigger than this are turned away
+MAX_REQUEST_SIZE = 64 * 1024 * 1024
+
+
+class TaggerService:
+    def __init__(self, classifier=None):
+        self.classifier = classifier if classifier is not None else load_classifier()
+        self.lock = threading.Lock()
+        # movie -> ((mtime, size) or the hash in the pack, characters, gender)
+        self.character_maps = {}
+        # sha1 of a script -> parse
+        self.parses = collections.OrderedDict()
+
+    ###
+    # The characters of a movie from its characters file, which is only read again once it has changed.
+    ###
+    def read_characters(self, movie):
+        try:
+            stat = os.stat(Script_Tagger.CHARACTER_PATH + movie)
+            version = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            # Characters files that are only in the pack are known by the hash that the pack keeps
+            pack = Script_Tagger.corpus_pack()
+            version = pack.content_hash(movie, CHARACTERS) if pack is not None else None
+            if version is None:
+                raise
+        cached = self.character_maps.get(movie)
+        if cached is None or cached[0] != version:
+            cached = (version,) + Script_Tagger.read_characters(movie)
+            self.character_maps[movie] = cached
+        return cached[1], cached[2]
+
+    def parse_text(self, script):
+        key = hashlib.sha1(script.encode('utf-8', 'surrogatepass')).hexdigest()
+        parsed = self.parses.get(key)
+        if parsed is None:
+            parsed = Script_Tagger.build_parse(script)
+            self.parses[key] = parsed
+            if len(self.parses) > PARSE_CACHE_SIZE:
+                self.parses.popitem(last=False)
+        else:
+            self.parses.move_to_end(key)
+        return parsed
+
+    ###
+    # Classifies the most common characters of a parse by their names, for scripts that come without genders.
+    ###
+    def classify_characters(self, parsed):
+        characters = Script_Tagger.get_popular_characters(parsed['character_names'])
+        genders = classify_many(self.classifier, [character.title() for character in characters])
+        return characters, dict(zip(characters, genders))
+
+    ###
+    # Evaluates one script request, and returns its result as a dictionary. Raises ValueError for a bad request.
+    ###
+    def evaluate(self, request):
+        if not isinstance(request, dict):
+            raise ValueError("A script request has to be a JSON object")
+        with self.lock:
+            if "movie" in request:
+                title = request["movie"]
+                parsed = Script_Tagger.parse_script(title)
+                characters, gender = self.read_characters(title)
+                source = "characters_file"
+            elif "script" in request:
+                title = request.get("title")
+                parsed = self.parse_text(request["script"])
+                if "characters" in request:
+                    characters = [character for character, character_gender in request["characters"]]
+                    gender = dict((character, character_gender)
+                                  for character, character_gender in request["characters"])
+                    source = "request"
+                else:
+                    characters, gender = self.classify_characters(parsed)
+                    source = "name_classifier"
+            else:
+                raise ValueError("A script request needs either a \"movie\" or a \"script\"")
+            passes_t1, passes_t2, passes_t3 = Script_Tagger.evaluate_parse(parsed, characters, gender)
+        result = {
+            "title": title,
+            "well_formatted": parsed['well_formatted'],
+            "sane": parsed['sane'],
+            "characters": [[character, gender[character]] for character in characters],
+            "gender_source": source,
+            "tests": {"one": passes_t1, "two": passes_t2, "three": passes_t3}
+        }
+        if request.get("tagged"):
+            result["tagged_lines"] = [[line, tag] for line, tag in parsed['tagged_lines']]
+        return result
+
+    def evaluate_batch(self, requests):
+        results = []
+        for request in requests:
+            try:
+                results.append(self.evaluate(request))
+            except (OSError, ValueError, KeyError, TypeError) as error:
+                results.append({"error": str(error)})
+        return results
+
+
+def make_handler(service):
+    class TaggerRequestHandler(http.server.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def send_json(self, status, body):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == '/health':
+                self.send_json(200, {"status": "ok", "tagger_version": Script_Tagger.TAGGER_VERSION})
+            else:
+                self.send_json(404, {"error": "No such endpoint"})
+
+        def do_POST(self):
+            # The body is only read once its length is known to be sane, since reading a negative length would wait for
+            # the client to close the connection
+            length = self.headers.get('Content-Length', '0').strip()
+            if not length.isdigit():
+                self.send_json(400, {"error": "The request needs a valid Content-Length"})
+                self.close_connection = True
+                return
+            length = int(length)
+            if length > MAX_REQUEST_SIZE:
+                self.send_json(413, {"error": "Request too large"})
+                self.close_connection = True
+                return
+            try:
+                request = json.loads(self.rfile.read(length).decode('utf-8'))
+            except (UnicodeDecodeError, ValueError):
+                self.send_json(400, {"error": "The request body has to be JSON"})
+                return
+            try:
+                if self.path == '/evaluate':
+                    self.send_json(200, service.evaluate(request))
+                elif self.path == '/evaluate_batch':
+                    if not isinstance(request, dict) or not isinstance(request.get("scripts"), list):
+                        raise ValueError("A batch request needs a list of \"scripts\"")
+                    self.send_json(200, {"results": service.evaluate_batch(request["scripts"])})
+                else:
+                    self.send_json(404, {"error": "No such endpoint"})
+            except FileNotFoundError as error:
+                self.send_json(404, {"error": str(error)})
+            except (ValueError, KeyError, TypeError) as error:
+                self.send_json(400, {"error": str(error)})
+
+        def log_message(self, format, *args):
+            pass
+
+    return TaggerRequestHandler
+
+
+###
+# Starts the service on a background thread, and returns the server and its URL. Passing port 0 picks a free port.
+###
+def start_service(host=HOST, port=PORT, service=None):
+    server = http.server.ThreadingHTTPServer((host, port), make_handler(service or TaggerService()))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, "http://{}:{}".format(host, server.server_address[1])
+
+
+###
+# Runs the service in the foreground until it is interrupted.
+###
+def serve(host=HOST, port=PORT):
+    server = http.server.ThreadingHTTPServer((host, port), make_handler(TaggerService()))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+###
+# Sends a request to a running service, and returns its response. Error responses are returned as well, as long as
+# they are JSON.
+###
+def request_service(url, path, body=None, timeout=60):
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    request = urllib.request.Request(url + path, data=data, headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read().decode('utf-8'))
+    except urllib.error.HTTPError as error:
+        return json.loads(error.read().decode('utf-8'))
+
+
+if __name__ == "__main__":
+    serve()
@@ -0,0 +1,264 @@
+"""
+Resolves movie titles between Bechdel_Data, the IMSDb script listing and the Parseable/t1/t2/t3 files, so that the
+script scraper does not spend a request on every guessed URL that 404s, and so that joins between the files do not
+break on "The Matrix" versus "Matrix, The".
+
+Titles are compared by their normalized key (see normalize_title): case, accents, punctuation, "&" versus "and" and a
+leading or trailing article ("The Matrix", "Matrix, The") all make no difference, and a year in brackets on the end
+is taken off and used to tell movies with the same title apart.
+
+A TitleIndex is built once from a local copy of the IMSDb listing (LISTING_FILE, saved by save_listing) and the
+movies in Bechdel_Data. Looking up a key is a dictionary lookup. Titles whose key is not in the listing fall back
+to a fuzzy lookup over the trigrams of the keys, which only answers when one IMSDb title is clearly the closest and
+has the same numbers in it (so "Toy Story 3" is never taken for "Toy Story"). A title leads to at most one fetch, and
+fuzzy matches are not fetched at all: they are written to REVIEW_FILE, and the ones that are right can be copied into
+MATCHES_FILE, which is read back as confirmed matches.
+"""
+
+import re
+import os
+import csv
+import html.parser
+import unicodedata
+import collections
+import urllib.request
+from Results_Store import read_bechdel_data
+
+
+IMSDB_URL = 'http://www.imsdb.com'
+LISTING_URL = IMSDB_URL + '/all-scripts.html'
+
+# A local copy of the IMSDb listing of every script
+LISTING_FILE = './IMSDb_Listing.html'
+
+# Fuzzy matches waiting to be checked, and matches that have been checked, as CSV rows of title and IMSDb title
+REVIEW_FILE = './Title_Review'
+MATCHES_FILE = './Title_Matches'
+
+ARTICLES = ["the", "a", "an"]
+
+# Links to the script pages in the listing look like "/Movie Scripts/Matrix, The Script.html"
+LISTING_LINK = re.compile(r'^/Movie Scripts/(.+) Script\.html$')
+TRAILING_YEAR = re.compile(r'\s*\((\d{4})\)\s*$')
+TRAILING_ARTICLE = re.compile(r',\s*(the|a|an)$')
+PUNCTUATION = re.compile(r'[^\w\s]+')
+
+# How similar (the Dice coefficient of their trigrams) the key of a title and the key of an IMSDb title have to be for
+# a fuzzy match, and how far ahead of the next closest IMSDb title the closest one has to be
+FUZZY_THRESHOLD = 0.85
+FUZZY_MARGIN = 0.05
+
+ROMAN_NUMERAL = re.compile(r'^m{0,3}(cm|cd|d?c{0,3})(xc|xl|l?x{0,3})(ix|iv|v?i{0,3})$')
+ROMAN_VALUES = {'i': 1, 'v': 5, 'x': 10, 'l': 50, 'c': 100, 'd': 500, 'm': 1000}
+
+
+###
+# Splits a title into its normalized key and the year in brackets on the end of it (or None). The key is casefolded,
+# has its accents, punctuation and leading or trailing article taken off, and has "&" spelled out as "and", e.g.
+# "Matrix, The (1999)" -> ("matrix", 1999) and "Romeo & Juliet" -> ("romeo and juliet", None).
+###
+def normalize_title(title):
+    year = None
+    found = TRAILING_YEAR.search(title)
+    if found is not None:
+        year = int(found.group(1))
+        title = title[:found.start()]
+    title = unicodedata.normalize('NFKD', title)
+    title = ''.join(character for character in title if not unicodedata.combining(character)).casefold()
+    title = TRAILING_ARTICLE.sub('', title.strip()).replace('&', ' and ')
+    words = PUNCTUATION.sub(' ', title.replace("'", '')).split()
+    if len(words) > 1 and words[0] in ARTICLES:
+        words = words[1:]
+    return ' '.join(words), year
+
+
+def title_key(title):
+    return normalize_title(title)[0]
+
+
+###
+# The numbers in a key, with roman numerals read as numbers, e.g. "rocky iv" -> [4] and "toy story 3" -> [3]. Sequels
+# differ from the films before them in little but these, so a fuzzy match has to have the same ones.
+###
+def key_numbers(key):
+    numbers = []
+    for word in key.split():
+        if word.isdigit():
+            numbers.append(int(word))
+        elif ROMAN_NUMERAL.match(word):
+            value = 0
+            for position, numeral in enumerate(word):
+                following = ROMAN_VALUES[word[position + 1]] if position + 1 < len(word) else 0
+                value += -ROMAN_VALUES[numeral] if ROMAN_VALUES[numeral] < following else ROMAN_VALUES[numeral]
+            numbers.append(value)
+    return numbers
+
+
+def trigrams(key):
+    padded = '  ' + key + ' '
+    return set(padded[index:index + 3] for index in range(len(padded) - 2))
+
+
+###
+# The address of the script page of a title in the IMSDb listing
+###
+def script_url(imsdb_title, base_url=IMSDB_URL):
+    return base_url + '/scripts/' + '-'.join(imsdb_title.split()) + '.html'
+
+
+###
+# An html.parser handler that collects the titles of the scripts linked to from the IMSDb listing
+###
+class ListingParser(html.parser.HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.titles = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a':
+            link = LISTING_LINK.match(dict(attrs).get('href') or '')
+            if link is not None:
+                self.titles.append(link.group(1).strip())
+
+
+###
+# Reads the titles out of a saved IMSDb listing, in the order they are listed. Returns an empty list if there is no
+# saved listing.
+###
+def read_listing(filename=LISTING_FILE):
+    parser = ListingParser()
+    try:
+        with open(filename, 'r', encoding='iso-8859-1') as listing:
+            for chunk in iter(lambda: listing.read(64 * 1024), ''):
+                parser.feed(chunk)
+    except FileNotFoundError:
+        return []
+    parser.close()
+    seen = set()
+    return [title for title in parser.titles if not (title in seen or seen.add(title))]
+
+
+###
+# Downloads the IMSDb listing to LISTING_FILE. It only needs to be done again when new scripts have been added.
+###
+def save_listing(url=LISTING_URL, filename=LISTING_FILE):
+    with urllib.request.urlopen(url) as response:
+        page = response.read()
+    with open(filename + '.tmp', 'wb') as listing:
+        listing.write(page)
+    os.replace(filename + '.tmp', filename)
+
+
+class TitleIndex:
+    def __init__(self, imsdb_titles=(), movies=()):
+        # key -> IMSDb titles, and trigram -> keys of IMSDb titles
+        self.scripts = collections.defaultdict(list)
+        self.grams = collections.defaultdict(set)
+        for title in imsdb_titles:
+            key = title_key(title)
+            if title not in self.scripts[key]:
+                self.scripts[key].append(title)
+            for gram in trigrams(key):
+                self.grams[gram].add(key)
+        # title -> (title, year, score), and key -> the same rows
+        self.exact = {}
+        self.movies = collections.defaultdict(list)
+        for title, year, score in movies:
+            self.exact.setdefault(title, (title, year, score))
+            self.movies[title_key(title)].append((title, year, score))
+
+    ###
+    # The closest key in the listing to a key that is not in it, or None if none of them is close enough (or two are
+    # about as close as each other). Keys with different numbers in them (e.g. a sequel) are never a match.
+    ###
+    def fuzzy_key(self, key):
+        grams = trigrams(key)
+        numbers = key_numbers(key)
+        shared = collections.Counter()
+        for gram in grams:
+            shared.update(self.grams.get(gram, ()))
+        scores = sorted(((2.0 * count / (len(grams) + len(trigrams(candidate))), candidate)
+                         for candidate, count in shared.items() if key_numbers(candidate) == numbers), reverse=True)
+        if len(scores) == 0 or scores[0][0] < FUZZY_THRESHOLD:
+            return None
+        if len(scores) > 1 and scores[0][0] - scores[1][0] < FUZZY_MARGIN:
+            return None
+        return scores[0][1]
+
+    ###
+    # The IMSDb title of a movie, or None if there is no script for it in the listing. If more than one script has the
+    # same key, the one with the year of the movie in its title wins, and otherwise it is left unresolved. Fuzzy
+    # matches are only made with fuzzy=True, since they are guesses that should be checked before they are used (see
+    # suggest).
+    ###
+    def resolve(self, title, year=None, fuzzy=False):
+        key, title_year = normalize_title(title)
+        year = year if year is not None else title_year
+        candidates = self.scripts.get(key)
+        if candidates is None and fuzzy:
+            closest = self.fuzzy_key(key)
+            candidates = self.scripts.get(closest) if closest is not None else None
+        if candidates is None:
+            return None
+        if len(candidates) > 1 and year is not None:
+            candidates = [candidate for candidate in candidates if normalize_title(candidate)[1] == year] or candidates
+        return candidates[0] if len(candidates) == 1 else None
+
+    ###
+    # The IMSDb title that a fuzzy lookup finds for a movie whose key is not in the listing, for someone to check, or
+    # None if it is in the listing already or nothing is close enough.
+    ###
+    def suggest(self, title, year=None):
+        if title_key(title) in self.scripts:
+            return None
+        return self.resolve(title, year, fuzzy=True)
+
+    def script_url(self, title, year=None, base_url=IMSDB_URL):
+        imsdb_title = self.resolve(title, year)
+        return script_url(imsdb_title, base_url) if imsdb_title is not None else None
+
+    ###
+    # The (title, year, score) row of a movie in Bechdel_Data, by its exact title or else by its key. Movies that share
+    # a key are told apart by the year, and are left unresolved (None) if there is no year to go on.
+    ###
+    def movie(self, title, year=None):
+        if year is None and title in self.exact:
+            return self.exact[title]
+        key, title_year = normalize_title(title)
+        year = year if year is not None else title_year
+        rows = self.movies.get(key, [])
+        if year is not None:
+            rows = [row for row in rows if row[1] == year]
+        return rows[0] if len(rows) == 1 else None
+
+
+###
+# Reads a CSV file of (title, IMSDb title) rows (REVIEW_FILE or MATCHES_FILE) into a dictionary. The rows are quoted
+# like any CSV, since titles such as "I, Robot" and "Matrix, The" have commas in them. Returns an empty dictionary if
+# there is no such file.
+###
+def read_matches(filename=MATCHES_FILE):
+    matches = {}
+    try:
+        with open(filename, 'r', newline='') as matches_file:
+            for row in csv.reader(matches_file):
+                if len(row) == 2:
+                    matches[row[0].strip()] = row[1].strip()
+    except FileNotFoundError:
+        pass
+    return matches
+
+
+def write_matches(matches, filename=REVIEW_FILE):
+    with open(filename, 'w', newline='') as matches_file:
+        writer = csv.writer(matches_file)
+        for title, imsdb_title in matches.items():
+            writer.writerow([title, imsdb_title])
+
+
+###
+# Builds the index from the saved IMSDb listing and Bechdel_Data.
+###
+def load_index(listing_file=LISTING_FILE, bechdel_file="Bechdel_Data"):
+    movies = read_bechdel_data(bechdel_file) if os.path.exists(bechdel_file) else []
+    return TitleIndex(read_listing(listing_file), movies)
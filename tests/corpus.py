@@ -0,0 +1,37 @@
+import os
+import shutil
+import tempfile
+import unittest
+import Benchmark
+import Script_Tagger
+
+
+###
+# A test case that runs in a temporary directory with a synthetic corpus (see Benchmark.write_synthetic_corpus) in
+# ./Scripts/ and ./Characters/, where Script_Tagger looks for them. count movies are made in each of styles.
+###
+class SyntheticCorpusTest(unittest.TestCase):
+    count = 2
+    styles = ["standard"]
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.directory = tempfile.mkdtemp()
+        os.chdir(self.directory)
+        Script_Tagger._parsed_scripts.clear()
+        self.movies = Benchmark.write_synthetic_corpus('./Scripts/', './Characters/', count=self.count,
+                                                       styles=self.styles)
+
+    def tearDown(self):
+        Script_Tagger._parsed_scripts.clear()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory)
+
+    def read(self, filename):
+        with open(filename) as results:
+            return results.read().splitlines()
+
+    def write(self, filename, lines):
+        with open(filename, "w") as output:
+            for line in lines:
+                output.write(line + "\n")
@@ -0,0 +1,63 @@
+import os
+import unittest
+import Build_Graph
+import Script_Tagger
+from tests.corpus import SyntheticCorpusTest
+
+
+class BuildGraphTest(SyntheticCorpusTest):
+    count = 3
+    styles = None
+
+    def setUp(self):
+        super().setUp()
+        self.write("Bechdel_Data", ["Title,Year,Score"] + [movie + ",2000,3" for movie in self.movies])
+
+    def build(self):
+        Script_Tagger._parsed_scripts.clear()
+        return Build_Graph.build(genders="characters", state_file="Build_State.json")
+
+    def outputs(self):
+        return dict((filename, self.read(filename)) for filename in ["Parseable", "t1", "t2", "t3"])
+
+    def rewrite_characters(self, movie, edit):
+        path = Script_Tagger.CHARACTER_PATH + movie
+        lines = edit(self.read(path))
+        self.write(path, lines)
+        # Make sure the change shows up even where modification times are coarse
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    def test_second_build_reuses_everything(self):
+        first = self.build()
+        self.assertEqual(first["recomputed"]["parseable"], len(self.movies))
+        self.assertGreater(first["recomputed"]["t2"], 0)
+        outputs = self.outputs()
+        second = self.build()
+        self.assertEqual(second["recomputed"], dict((node, 0) for node in Build_Graph.NODES))
+        self.assertEqual(second["reused"], first["recomputed"])
+        self.assertEqual(self.outputs(), outputs)
+
+    def test_characters_edit_recomputes_only_that_movie(self):
+        self.build()
+        movie = self.read("t2")[0].split(",")[0]
+        state = Build_Graph.load_state("Build_State.json")
+        passed_two = state["movies"][movie]["t2"]["value"]
+        outputs = self.outputs()
+        # A character who never speaks changes the file, but none of the results
+        self.rewrite_characters(movie, lambda lines: lines + ["NOBODY,male"])
+        counts = self.build()
+        self.assertEqual(counts["recomputed"], {"parseable": 0, "t1": 1, "t2": 1, "t3": 1 if passed_two else 0})
+        self.assertEqual(sum(counts["dropped"].values()), 0)
+        self.assertEqual(self.outputs(), outputs)
+        # Without any women it fails test one, and loses its t2 and t3 rows
+        self.rewrite_characters(movie, lambda lines: [line.rsplit(",", 1)[0] + ",male" for line in lines])
+        counts = self.build()
+        self.assertEqual(counts["recomputed"], {"parseable": 0, "t1": 1, "t2": 0, "t3": 0})
+        self.assertEqual(counts["dropped"], {"parseable": 0, "t1": 0, "t2": 1, "t3": 1 if passed_two else 0})
+        self.assertIn(movie + ",False", self.read("t1"))
+        self.assertEqual(self.read("t2"), [line for line in outputs["t2"] if not line.startswith(movie + ",")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import os
+import unittest
+import Corpus_Runner
+import Script_Tagger
+from tests.corpus import SyntheticCorpusTest
+
+
+class RunTestsTogetherTest(SyntheticCorpusTest):
+    def setUp(self):
+        super().setUp()
+        self.write("Parseable", self.movies)
+
+    def test_failing_movie_is_left_out(self):
+        os.remove(os.path.join('./Characters/', self.movies[1]))
+        Corpus_Runner.run_tests_together(processes=2, chunksize=1)
+        passes_t1, passes_t2, passes_t3 = Script_Tagger.evaluate_movie(self.movies[0])
+        self.assertEqual(self.read("t1"), [self.movies[0] + "," + str(passes_t1)])
+        self.assertEqual(self.read("t2"), [self.movies[0] + "," + str(passes_t2)] if passes_t1 else [])
+        self.assertEqual(len(self.read("t3")), 1 if passes_t1 and passes_t2 else 0)
+
+
+###
+# The process pool has to write exactly what the serial perform_* functions write
+###
+class SerialEquivalenceTest(SyntheticCorpusTest):
+    count = 3
+    styles = None
+
+    def setUp(self):
+        super().setUp()
+        # One of the movies has no script, like most of Bechdel_Data
+        self.write("Bechdel_Data", [movie + ",2000," + str(number % 4)
+                                    for number, movie in enumerate(self.movies + ["No Script"])])
+
+    def outputs(self):
+        return {filename: self.read(filename) for filename in ["Parseable", "t1", "t2", "t3"]}
+
+    def test_pool_matches_serial(self):
+        Script_Tagger.get_parseable_movies()
+        Script_Tagger.perform_tests()
+        together = self.outputs()
+        Script_Tagger.perform_test_two()
+        Script_Tagger.perform_test_three()
+        serial = self.outputs()
+        self.assertEqual(serial, together)
+        self.assertGreater(len(serial["Parseable"]), 0)
+        self.assertNotEqual(serial["t1"], serial["t2"])
+        for filename in serial:
+            os.remove(filename)
+        Script_Tagger._parsed_scripts.clear()
+
+        Corpus_Runner.run_parseable(processes=3, chunksize=2)
+        Corpus_Runner.run_tests_together(processes=3, chunksize=2)
+        self.assertEqual(self.outputs(), serial)
+        Corpus_Runner.run_test_two(processes=3, chunksize=2)
+        Corpus_Runner.run_test_three(processes=3, chunksize=2)
+        self.assertEqual(self.outputs(), serial)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+from Dialogue_Scanner import DialogueScanner
+
+
+def dialog(*lines):
+    return [(line, "D") for line in lines]
+
+
+class DialogueScannerTest(unittest.TestCase):
+    def terms(self, scanner, *lines):
+        return [reference.term for reference in scanner.scan(dialog(*lines))]
+
+    def test_punctuation(self):
+        scanner = DialogueScanner(["him", "his"])
+        self.assertEqual(self.terms(scanner, "Tell him, now.", "It was (his."), ["him", "his"])
+
+    def test_apostrophes(self):
+        # Apostrophes split words, so contractions and possessives are found by their first part
+        scanner = DialogueScanner(["he", "CHARLIE"])
+        self.assertEqual(self.terms(scanner, "He's late.", "That's Charlie's car."), ["he", "CHARLIE"])
+        self.assertEqual(self.terms(scanner, "Hello, Charles."), [])
+
+    def test_multi_word_names(self):
+        scanner = DialogueScanner(["CHARLIE CLARK"])
+        self.assertEqual(self.terms(scanner, "Ask Charlie Clark."), ["CHARLIE CLARK"])
+        # The name is found even when the dialog wraps between its words
+        references = scanner.scan(dialog("Ask Charlie", "Clark about it."))
+        self.assertEqual([(reference.text, reference.line) for reference in references], [("Charlie\nClark", 0)])
+        # Part of the name on its own is not a mention
+        self.assertEqual(self.terms(scanner, "Charlie said so.", "Clark too."), [])
+
+    def test_longest_match(self):
+        scanner = DialogueScanner(["CHARLIE", "CHARLIE CLARK", "clark"])
+        self.assertEqual(self.terms(scanner, "Charlie Clark and Clark."), ["CHARLIE CLARK", "clark"])
+        self.assertEqual(self.terms(scanner, "Charlie Clarkson."), ["CHARLIE"])
+
+    def test_name_that_is_a_prefix_of_another(self):
+        scanner = DialogueScanner(["AL", "ALAN"])
+        self.assertEqual(self.terms(scanner, "Alan and Al."), ["ALAN", "AL"])
+        self.assertEqual(self.terms(DialogueScanner(["AL"]), "Alan called."), [])
+
+    def test_only_dialog_is_scanned(self):
+        scanner = DialogueScanner(["he"])
+        self.assertIsNone(scanner.first_reference([("He walks in.", "N"), ("HE", "C"), ("Hi.", "D")]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    import numpy
+    import Evaluation
+except ImportError:
+    Evaluation = None
+
+
+BECHDEL_DATA = """Title,Year,Score
+Alien,1979,3
+Casino,1995,2
+Heat,1995,0
+Fargo,1996,3
+Jaws,1975,1
+Clue,1985,3
+Big,1988,2
+Rocky,1976,0
+"""
+
+PREDICTIONS = """Alien,True
+Casino,False
+Heat,True
+Fargo,True
+Jaws,False
+Clue,False
+Big,True
+Rocky,False
+Alien,False
+"""
+
+
+###
+# The counting of the original evaluate_test, which Evaluation replaced, kept here to check the new one against.
+# Returns the confusion matrix as a dictionary.
+###
+def legacy_evaluate_test(test_num, bechdel_file, test_file, include=None):
+    moviesfile = open(bechdel_file, 'r')
+    testfile = open(test_file, 'r')
+    moviesfile.readline()
+    bechdel_scores = {}
+    visited = {}
+    counts = {'true_pos': 0, 'false_pos': 0, 'true_neg': 0, 'false_neg': 0}
+    for line in moviesfile:
+        if len(line.split(',')) == 3:
+            data = line.split(',')
+            bechdel_scores[data[0].strip()] = data[2].strip()
+    for line in testfile:
+        data = line.split(',')
+        movie = data[0].strip()
+        if not visited.get(movie):
+            visited[movie] = True
+            if include is not None and not include(movie):
+                continue
+            if data[1].strip() == "True":
+                counts['true_pos' if int(bechdel_scores[movie]) >= test_num else 'false_pos'] += 1
+            else:
+                counts['true_neg' if int(bechdel_scores[movie]) < test_num else 'false_neg'] += 1
+    moviesfile.close()
+    testfile.close()
+    return counts
+
+
+def legacy_metrics(counts):
+    true_pos, false_pos, true_neg, false_neg = [counts[cell] for cell in ['true_pos', 'false_pos', 'true_neg',
+                                                                         'false_neg']]
+    return {
+        'accuracy': (true_pos + true_neg) / (true_pos + false_pos + true_neg + false_neg),
+        'recall_pos': true_pos / (true_pos + false_neg),
+        'precision_pos': true_pos / (true_pos + false_pos),
+        'recall_neg': true_neg / (true_neg + false_pos),
+        'precision_neg': true_neg / (true_neg + false_neg)
+    }
+
+
+@unittest.skipIf(Evaluation is None, "numpy is not installed")
+class EvaluationTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.bechdel_file = os.path.join(self.directory, "Bechdel_Data")
+        self.test_file = os.path.join(self.directory, "t2")
+        with open(self.bechdel_file, "w") as bechdel_data:
+            bechdel_data.write(BECHDEL_DATA)
+        with open(self.test_file, "w") as predictions:
+            predictions.write(PREDICTIONS)
+        self.years = {line.split(',')[0]: int(line.split(',')[1]) for line in BECHDEL_DATA.splitlines()[1:]}
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def evaluate(self, seed=0, resamples=200):
+        return Evaluation.evaluate(2, self.bechdel_file, self.test_file, resamples=resamples, seed=seed)
+
+    def test_matches_legacy_counts_and_metrics(self):
+        report = self.evaluate()
+        counts = legacy_evaluate_test(2, self.bechdel_file, self.test_file)
+        self.assertEqual(report['confusion'], counts)
+        self.assertEqual(report['total'], sum(counts.values()))
+        self.assertEqual(report['duplicates'], ["Alien"])
+        for metric, value in legacy_metrics(counts).items():
+            self.assertAlmostEqual(report['metrics'][metric], value)
+
+    def test_breakdowns_match_legacy_counts(self):
+        report = self.evaluate()
+        for breakdown, group_of in [('by_year', lambda year: year), ('by_decade', lambda year: year // 10 * 10)]:
+            groups = sorted(set(group_of(year) for year in self.years.values()))
+            self.assertEqual([row['group'] for row in report[breakdown]], groups)
+            for row in report[breakdown]:
+                counts = legacy_evaluate_test(2, self.bechdel_file, self.test_file,
+                                              lambda movie: group_of(self.years[movie]) == row['group'])
+                self.assertEqual({cell: row[cell] for cell in counts}, counts)
+
+    def test_empty_denominators(self):
+        # Every movie of 1979 (just Alien) passed, so there are no negatives to recall
+        row = [row for row in self.evaluate()['by_year'] if row['group'] == 1979][0]
+        self.assertIsNone(row['recall_neg'])
+        self.assertEqual(row['accuracy'], 1.0)
+
+    def test_bootstrap_is_deterministic(self):
+        first = self.evaluate(seed=7)['intervals']
+        self.assertEqual(self.evaluate(seed=7)['intervals'], first)
+        cells = numpy.array([3, 0, 2, 1, 3, 3, 0, 1])
+        self.assertEqual(Evaluation.bootstrap_intervals(cells, 500, 0.9, 3),
+                         Evaluation.bootstrap_intervals(cells, 500, 0.9, 3))
+        for metric, (low, high) in first.items():
+            if low is not None:
+                self.assertLessEqual(low, high)
+
+    def test_bootstrap_of_nothing(self):
+        intervals = Evaluation.bootstrap_intervals(numpy.array([], dtype=numpy.int64), 100)
+        self.assertEqual(intervals, {metric: [None, None] for metric in Evaluation.METRICS})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import time
+import random
+import asyncio
+import threading
+import unittest
+import Page_Fetcher
+
+
+###
+# Canned pages that count the requests for each path and how many are being served at once, and that can fail a
+# number of times before they are served
+###
+class CountingPages(dict):
+    def __init__(self, pages, delay=0.0, failures=None):
+        super().__init__(pages)
+        self.delay = delay
+        self.failures = dict(failures or {})
+        self.requests = {}
+        self.in_flight = 0
+        self.most_in_flight = 0
+        self.lock = threading.Lock()
+
+    def get(self, path, default=None):
+        with self.lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+            self.in_flight += 1
+            self.most_in_flight = max(self.most_in_flight, self.in_flight)
+            failing = self.failures.get(path, 0) > 0
+            if failing:
+                self.failures[path] -= 1
+        time.sleep(self.delay)
+        with self.lock:
+            self.in_flight -= 1
+        return (503, 'Try again') if failing else super().get(path, default)
+
+
+class PageFetcherTest(unittest.TestCase):
+    def serve(self, pages):
+        server, self.url = Page_Fetcher.serve_canned_pages(pages)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+    def fetch_all(self, fetcher, paths, headers=None):
+        async def fetch():
+            return await asyncio.gather(*[fetcher.fetch(self.url + path, headers) for path in paths])
+        try:
+            return asyncio.run(fetch())
+        finally:
+            fetcher.close()
+
+    def test_concurrency_is_limited(self):
+        pages = CountingPages({"/" + str(number): "page " + str(number) for number in range(12)}, delay=0.05)
+        self.serve(pages)
+        responses = self.fetch_all(Page_Fetcher.PageFetcher(concurrency=3, host_interval=0), list(pages))
+        self.assertEqual([response.text() for response in responses], list(pages.values()))
+        self.assertEqual(pages.most_in_flight, 3)
+
+    def test_retries_server_errors(self):
+        pages = CountingPages({"/flaky": "made it"}, failures={"/flaky": 2})
+        self.serve(pages)
+        response, = self.fetch_all(Page_Fetcher.PageFetcher(host_interval=0, backoff=0.01), ["/flaky"])
+        self.assertEqual((response.status, response.text()), (200, "made it"))
+        self.assertEqual(pages.requests["/flaky"], 3)
+
+    def test_gives_up_after_retries(self):
+        pages = CountingPages({"/down": "never"}, failures={"/down": 10})
+        self.serve(pages)
+        response, = self.fetch_all(Page_Fetcher.PageFetcher(host_interval=0, retries=2, backoff=0.01), ["/down"])
+        self.assertEqual(response.status, 503)
+        self.assertEqual(pages.requests["/down"], 3)
+
+    def test_backoff_does_not_hold_a_slot(self):
+        random.seed(0)
+        pages = CountingPages({"/down": "never", "/up": "fine"}, failures={"/down": 10})
+        self.serve(pages)
+        fetcher = Page_Fetcher.PageFetcher(concurrency=1, host_interval=0, retries=2, backoff=0.5)
+        finished = {}
+
+        async def fetch(path):
+            response = await fetcher.fetch(self.url + path)
+            finished[path] = time.monotonic()
+            return response
+
+        async def fetch_both():
+            return await asyncio.gather(fetch("/down"), fetch("/up"))
+        try:
+            asyncio.run(fetch_both())
+        finally:
+            fetcher.close()
+        # With the only slot held through the backoff, /up would have to wait for every retry of /down
+        self.assertLess(finished["/up"], finished["/down"])
+
+    def test_not_modified(self):
+        self.serve({"/page": (200, "contents", {"ETag": '"v1"'})})
+        fresh, cached = self.fetch_all(Page_Fetcher.PageFetcher(host_interval=0), ["/page", "/page"],
+                                       {"If-None-Match": '"v1"'})
+        self.assertEqual((fresh.status, cached.status), (304, 304))
+        plain, = self.fetch_all(Page_Fetcher.PageFetcher(host_interval=0), ["/page"])
+        self.assertEqual((plain.status, plain.headers["etag"], plain.text()), (200, '"v1"', "contents"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import os
+import shutil
+import tempfile
+import unittest
+import Corpus_Runner
+import Results_Store
+
+try:
+    import Evaluation
+except ImportError:
+    Evaluation = None
+
+
+BECHDEL_DATA = """Title,Year,Score
+The Matrix,1999,1
+Alien,1979,3
+Casino,1995,2
+"""
+
+
+class ResultsStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.directory = tempfile.mkdtemp()
+        os.chdir(self.directory)
+        with open("Bechdel_Data", "w") as bechdel_data:
+            bechdel_data.write(BECHDEL_DATA)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory)
+
+    def test_write_test_results_records_predictions(self):
+        Corpus_Runner.write_test_results("t1", [("Alien", True, None), ("Casino", None, "error"),
+                                                ("Matrix, The", False, None)], 1)
+        store = Results_Store.ResultsStore(Results_Store.STORE_FILE)
+        try:
+            self.assertEqual(store.predictions(1), {"Alien": True, "Matrix, The": False})
+            self.assertTrue(store.is_current("t1"))
+        finally:
+            store.close()
+
+    def test_parse_verdicts_keep_their_flags(self):
+        Corpus_Runner.write_parseable([("Alien", (True, True), None), ("Casino", (True, False), None),
+                                       ("The Matrix", None, None)])
+        with open("Parseable") as parseable:
+            self.assertEqual(parseable.read(), "Alien\n")
+        store = Results_Store.ResultsStore(Results_Store.STORE_FILE)
+        try:
+            rows = store.connection.execute("SELECT * FROM parse_verdicts ORDER BY title").fetchall()
+            self.assertEqual(rows, [("Alien", 1, 1, 1), ("Casino", 1, 0, 0)])
+        finally:
+            store.close()
+
+    def test_first_prediction_wins_on_import(self):
+        with open("t1", "w") as test_results:
+            test_results.write("Alien,True\nAlien,False\n")
+        store = Results_Store.ResultsStore(Results_Store.STORE_FILE)
+        try:
+            Results_Store.import_legacy(store, test_files=("t1",))
+            self.assertEqual(store.predictions(1), {"Alien": True})
+        finally:
+            store.close()
+
+    @unittest.skipIf(Evaluation is None, "numpy is not installed")
+    def test_evaluation_reads_the_store(self):
+        Corpus_Runner.write_test_results("t1", [("Alien", True, None), ("Matrix, The", False, None)], 1)
+        # Results that are only in the store are read from there
+        Results_Store.save_predictions(1, [("Alien", True), ("Matrix, The", False), ("Casino", True)], "t1")
+        predicted, scores, years, duplicates, unknown = Evaluation.load_test(1)
+        self.assertEqual(list(predicted), [True, False, True])
+        self.assertEqual(list(years), [1979, 1999, 1995])
+        # A test file that was written without the store is read instead
+        with open("t1", "a") as test_results:
+            test_results.write("Casino,False\n")
+        predicted, scores, years, duplicates, unknown = Evaluation.load_test(1)
+        self.assertEqual(list(predicted), [True, False, False])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import io
+import os
+import re
+import unittest
+import Result_Data_Scraper
+import Script_Data_Scraper
+
+try:
+    from bs4 import BeautifulSoup
+except ImportError:
+    BeautifulSoup = None
+
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES, name), 'r', encoding='iso-8859-1') as fixture:
+        return fixture.read()
+
+
+###
+# The extractors that the streaming ones replaced, kept here to check the new ones against
+###
+def legacy_extract_script(raw_html):
+    if re.search(r'<pre></pre>', raw_html):
+        return None
+    soup = BeautifulSoup(raw_html, 'html.parser')
+    raw_script = str(soup.find('pre'))
+    return BeautifulSoup(raw_script, 'html.parser').get_text()
+
+
+def legacy_parse_movie_page(raw_text):
+    if re.search(r'No such movie!', raw_text):
+        return None
+    movie_title = re.search(r'<title>(.*?) - Bechdel Test Movie List</title>', raw_text).group(1)
+    movie_year = re.search(r'\((\d{4})\)</span>', raw_text).group(1)
+    bechdel_score = re.search(r'alt="\[\[(\d)\]\]"', raw_text).group(1)
+    return [movie_title.replace('&#39;', "'").replace('&amp;', '&'), movie_year, bechdel_score]
+
+
+###
+# Splits a page into pieces of every size from 1 to size, so that tags and character references get cut in half
+###
+def chunks(text, size=7):
+    pieces = []
+    position = 0
+    length = 1
+    while position < len(text):
+        pieces.append(text[position:position + length])
+        position += length
+        length = length % size + 1
+    return pieces
+
+
+@unittest.skipIf(BeautifulSoup is None, "bs4 is not installed")
+class ScriptExtractorTest(unittest.TestCase):
+    def test_matches_beautiful_soup(self):
+        page = read_fixture('imsdb_script.html')
+        self.assertEqual(Script_Data_Scraper.extract_script(page), legacy_extract_script(page))
+
+    def test_streamed_in_pieces(self):
+        page = read_fixture('imsdb_script.html')
+        output = io.StringIO()
+        self.assertTrue(Script_Data_Scraper.stream_script(chunks(page), output))
+        self.assertEqual(output.getvalue(), legacy_extract_script(page))
+
+    def test_empty_script(self):
+        page = read_fixture('imsdb_empty.html')
+        self.assertIsNone(legacy_extract_script(page))
+        self.assertIsNone(Script_Data_Scraper.extract_script(page))
+
+
+class MoviePageParserTest(unittest.TestCase):
+    def test_matches_legacy_parse(self):
+        page = read_fixture('bechdel_movie.html')
+        self.assertEqual(Result_Data_Scraper.parse_movie_page(page), legacy_parse_movie_page(page))
+        self.assertEqual(Result_Data_Scraper.parse_movie_page(page), ["Ferris Bueller's Day Off & More", "1986", "1"])
+
+    def test_streamed_in_pieces(self):
+        page = read_fixture('bechdel_movie.html')
+        self.assertEqual(Result_Data_Scraper.parse_movie_page(chunks(page)), legacy_parse_movie_page(page))
+
+    def test_missing_movie(self):
+        page = read_fixture('bechdel_missing.html')
+        self.assertIsNone(legacy_parse_movie_page(page))
+        self.assertIsNone(Result_Data_Scraper.parse_movie_page(page))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import os
+import sys
+import random
+import shutil
+import tempfile
+import threading
+import unittest
+import Script_Pack
+
+
+class ScriptPackTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "Corpus.pack")
+        # Entries that do not compress and are bigger than the buffer of the file, so that reads go to the disk
+        self.entries = {"Movie " + str(number): random.Random(number).randbytes(20000 + number) for number in range(20)}
+        with Script_Pack.ScriptPack(self.path, writable=True) as pack:
+            for name, script in self.entries.items():
+                pack.add(name, script)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_concurrent_reads(self):
+        failures = []
+
+        def read_all(pack):
+            for repeat in range(50):
+                for name, script in self.entries.items():
+                    try:
+                        if pack.read(name) != script:
+                            failures.append(name)
+                    except Exception:
+                        failures.append(name)
+
+        # Switch threads as often as possible, so that a read between another thread's seek and read would show up
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            with Script_Pack.ScriptPack(self.path) as pack:
+                threads = [threading.Thread(target=read_all, args=(pack,)) for thread in range(4)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+        finally:
+            sys.setswitchinterval(interval)
+        self.assertEqual(failures, [])
+
+    def test_read_after_add(self):
+        with Script_Pack.ScriptPack(self.path, writable=True) as pack:
+            pack.add("New", b"new script\n")
+            self.assertEqual(pack.read("New"), b"new script\n")
+            self.assertEqual(pack.read("Movie 3"), self.entries["Movie 3"])
+        with Script_Pack.ScriptPack(self.path) as pack:
+            self.assertEqual(pack.read("New"), b"new script\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
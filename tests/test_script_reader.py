@@ -0,0 +1,87 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import Benchmark
+import Script_Tagger
+
+try:
+    from Script_Reader import ScriptReader
+except ImportError:
+    ScriptReader = None
+
+
+SCRIPTS = {
+    "newlines": "INT. HOUSE - DAY\r\n\r\n    Someone walks in.\rALICE\n        Hello.\r\n\n",
+    "no final newline": "ALICE\n    Hi\n        there",
+    "tabs and feeds": "\tALICE\n \t BOB\n\x0b\x0cCAROL\n\t\n   \n",
+    "other whitespace": "  ALICE\n　BOB\n\x1c\x1dCAROL\n  \n    \n\x85DAVE\n",
+    "order of levels": "      six\n  two\n      six\nnone\n  two\n    four\n",
+    "trailing spaces": "  ALICE   \n  \t\n    Hello.  \t\n",
+    "empty": "",
+    "blank": "\n\r\n   \n\t\r",
+}
+
+
+###
+# What parse_script did before it had ScriptReader: decode the whole file with universal newlines, split it into its
+# non-empty lines and measure their indentation with lstrip.
+###
+def legacy_lines(raw_script, encoding):
+    script = io.TextIOWrapper(io.BytesIO(raw_script), encoding=encoding).read()
+    return [line for line in script.split('\n') if len(line.strip()) > 0]
+
+
+@unittest.skipIf(ScriptReader is None, "numpy is not installed")
+class ScriptReaderTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, script, encoding):
+        path = os.path.join(self.directory, "test.script")
+        with open(path, "wb") as script_file:
+            script_file.write(script.encode(encoding))
+        return path
+
+    def check(self, script, encoding):
+        path = self.write(script, encoding)
+        with open(path, "rb") as script_file:
+            lines = legacy_lines(script_file.read(), encoding)
+        with ScriptReader(path, encoding) as reader:
+            self.assertEqual(list(reader), lines)
+            self.assertEqual([reader[index] for index in range(len(reader))], lines)
+            self.assertEqual(list(reader.indents), [len(line) - len(line.lstrip()) for line in lines])
+            # The levels have to come out in the order that they first show up, which nltk.FreqDist breaks ties by
+            self.assertEqual(list(reader.indentation_histogram().items()),
+                             list(Script_Tagger.indentation_levels(lines).items()))
+
+    def test_matches_legacy_reading(self):
+        for name, script in SCRIPTS.items():
+            for encoding in ["utf-8", "utf-16"]:
+                with self.subTest(script=name, encoding=encoding):
+                    self.check(script, encoding)
+
+    def test_single_byte_encoding(self):
+        self.check(" ALICE\n    Café\n \n", "latin-1")
+
+    def test_views(self):
+        path = self.write("  ALICE\n    Café\n", "utf-8")
+        with ScriptReader(path, "utf-8") as reader:
+            view = reader.view(1)
+            self.assertEqual(bytes(view), "    Café".encode("utf-8"))
+            view.release()
+
+    def test_tags_like_build_parse(self):
+        for style in sorted(Benchmark.INDENTATION_STYLES):
+            script, cast = Benchmark.generate_screenplay(seed=1, scenes=20, style=style)
+            with ScriptReader(self.write(script, "utf-8"), "utf-8") as reader:
+                parsed = Script_Tagger.tag_script(reader, reader.indents, reader.indentation_histogram())
+            self.assertEqual(parsed, Script_Tagger.build_parse(script))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+import bisect
+import random
+import unittest
+import Script_Tagger
+from tests.corpus import SyntheticCorpusTest
+
+
+###
+# The original sanity_check, which walked back from every dialog line to the character name before it, kept here to
+# check the linear one against. Returns the percentage of strange tags.
+###
+def legacy_strange_tag_ratio(tagged_lines):
+    strange_tags = 0
+    for x in range(len(tagged_lines)):
+        if tagged_lines[x][1] == "S":
+            if tagged_lines[x + 1][1] not in ["N", "C"]:
+                strange_tags += 1
+        if tagged_lines[x][1] == "D":
+            character_name_found = False
+            start_node = x - 1
+            while start_node >= 0 and not character_name_found:
+                if tagged_lines[start_node][1] == "C":
+                    character_name_found = True
+                else:
+                    if tagged_lines[start_node][1] not in "MND":
+                        strange_tags += 1
+                    start_node -= 1
+    return 100 * (strange_tags / len(tagged_lines))
+
+
+def tagged(tags):
+    return [("line " + str(number), tag) for number, tag in enumerate(tags)]
+
+
+class ParseMemoryTest(SyntheticCorpusTest):
+    count = 3
+
+    def setUp(self):
+        super().setUp()
+        self.memory_size = Script_Tagger.PARSE_MEMORY_SIZE
+        Script_Tagger.PARSE_MEMORY_SIZE = 2
+
+    def tearDown(self):
+        Script_Tagger.PARSE_MEMORY_SIZE = self.memory_size
+        super().tearDown()
+
+    def path(self, movie):
+        return Script_Tagger.SCRIPT_PATH + movie + ".script"
+
+    def test_least_recently_used_parse_is_dropped(self):
+        first = Script_Tagger.parse_script(self.movies[0])
+        Script_Tagger.parse_script(self.movies[1])
+        # Using the first parse again makes the second one the least recently used
+        self.assertIs(Script_Tagger.parse_script(self.movies[0]), first)
+        Script_Tagger.parse_script(self.movies[2])
+        self.assertEqual(list(Script_Tagger._parsed_scripts), [self.path(self.movies[0]), self.path(self.movies[2])])
+        # A dropped parse is read back from the cache on disk
+        cache_file = Script_Tagger.parse_cache_file(self.path(self.movies[1]))
+        self.assertEqual(Script_Tagger.parse_script(self.movies[1]), Script_Tagger.read_cached_parse(cache_file))
+        self.assertEqual(len(Script_Tagger._parsed_scripts), 2)
+
+
+class SanityCheckTest(SyntheticCorpusTest):
+    styles = None
+
+    def check(self, tagged_lines):
+        ratio = legacy_strange_tag_ratio(tagged_lines)
+        self.assertEqual(Script_Tagger.strange_tag_ratio(tagged_lines), ratio)
+        self.assertEqual(Script_Tagger.sanity_check(tagged_lines, stop_early=False), ratio < 10)
+        self.assertEqual(Script_Tagger.sanity_check(tagged_lines), ratio < 10)
+
+    def test_matches_legacy_on_synthetic_scripts(self):
+        for movie in self.movies:
+            self.check(Script_Tagger.tag_lines(movie))
+
+    def test_matches_legacy_on_random_tags(self):
+        generator = random.Random(0)
+        for script in range(500):
+            tags = [generator.choice("SNMCD ") for line in range(generator.randint(1, 60))]
+            # The original could not handle a scene boundary on the last line
+            self.check(tagged(tags + ["N"]))
+
+    def test_stops_early(self):
+        tagged_lines = tagged("SD" * 50 + "CD" * 1000)
+        # Once it has seen enough strange tags to fail, it stops counting them
+        ratio = Script_Tagger.strange_tag_ratio(tagged_lines)
+        self.assertGreaterEqual(Script_Tagger.strange_tag_ratio(tagged_lines, 10), 10)
+        self.assertLess(Script_Tagger.strange_tag_ratio(tagged_lines, 10), ratio)
+        self.assertFalse(Script_Tagger.sanity_check(tagged_lines))
+        self.assertFalse(Script_Tagger.sanity_check(tagged_lines, stop_early=False))
+
+    def test_edge_cases(self):
+        self.assertFalse(Script_Tagger.sanity_check([]))
+        # A scene boundary on the last line is strange
+        self.assertAlmostEqual(Script_Tagger.strange_tag_ratio(tagged("CDS")), 100 / 3)
+
+
+class CharacterIndexTest(SyntheticCorpusTest):
+    styles = None
+
+    def test_index(self):
+        # Scene 0 is before the heading on line 3, scene 1 is before the one on line 9, and scene 2 comes after it
+        index = Script_Tagger.build_character_index([1, 4, 5, 6, 7, 10, 11],
+                                                    ["ALICE", "BOB", "Alice (V.O.)", "ALICE CONT'D", "bob", "CAROL",
+                                                     "ALICE"], [3, 9])
+        self.assertEqual(index['names'], ["ALICE", "BOB", "CAROL"])
+        self.assertEqual(index['aliases'], {"ALICE": 0, "BOB": 1, "Alice (V.O.)": 0, "ALICE CONT'D": 0, "bob": 1,
+                                            "CAROL": 2})
+        self.assertEqual(index['cues'], [4, 2, 1])
+        self.assertEqual(index['scenes'], [[0, 1, 2], [1], [2]])
+        # The same character twice in a row is not an edge, and neither are two scenes in a row
+        self.assertEqual(index['edges'], [(0, 1, 2, 1), (0, 2, 1, 2)])
+        self.assertEqual(index['scene_count'], 2)
+        self.assertEqual(Script_Tagger.ranked_characters(index), ["ALICE", "BOB", "CAROL"])
+        self.assertEqual(Script_Tagger.ranked_characters(index, 1), ["ALICE"])
+        self.assertEqual(Script_Tagger.character_scenes(index, "Alice (V.O.)"), [0, 1, 2])
+        self.assertEqual(Script_Tagger.character_scenes(index, "Bob (O.S.)"), [1])
+        self.assertEqual(Script_Tagger.character_scenes(index, "DAVE"), [])
+        gender = {"Alice": "female", "CAROL": "female", "BOB": "male"}
+        # ALICE and CAROL only talk after the last heading, which test two does not look at
+        self.assertEqual(Script_Tagger.female_interactions(index, gender), [])
+        self.assertEqual(Script_Tagger.female_interactions(index, gender, include_last_scene=True),
+                         [("ALICE", "CAROL", 1, 2)])
+
+    def test_matches_scanning_the_scenes(self):
+        for movie in self.movies:
+            parsed = Script_Tagger.parse_script(movie)
+            index = parsed['character_index']
+            names = [Script_Tagger.canonical_name(name) for name in parsed['character_names']]
+            self.assertEqual(Script_Tagger.ranked_characters(index), Script_Tagger.get_popular_characters(names))
+            scene_characters = Script_Tagger.parse_scene_characters(parsed)
+            for scene, characters in enumerate(scene_characters):
+                speakers = set(name for name in index['names'] if scene in Script_Tagger.character_scenes(index, name))
+                self.assertEqual(speakers, set(Script_Tagger.canonical_name(name) for name in characters))
+            characters, gender = Script_Tagger.read_characters(movie)
+            self.assertEqual(len(Script_Tagger.female_interactions(index, gender)) > 0,
+                             Script_Tagger.passes_test_two(movie))
+            # Edges are counted in the scene after the last heading as well, which get_scenes leaves out
+            last = bisect.bisect_left(parsed['character_lines'], parsed['scene_starts'][-1])
+            pairs = {}
+            for scene, characters in enumerate(scene_characters + [parsed['character_names'][last:]]):
+                for first, second in zip(characters, characters[1:]):
+                    if first != second and gender.get(first) == "female" and gender.get(second) == "female":
+                        pair = pairs.setdefault(frozenset([first, second]), [0, scene])
+                        pair[0] += 1
+            interactions = Script_Tagger.female_interactions(index, gender, include_last_scene=True)
+            self.assertEqual(dict((frozenset([a, b]), [weight, first_scene])
+                                  for a, b, weight, first_scene in interactions), pairs)
+
+
+if __name__ == "__main__":
+    unittest.main()
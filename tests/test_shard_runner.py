@@ -0,0 +1,87 @@
+import os
+import json
+import time
+import shutil
+import threading
+import tempfile
+import unittest
+import Shard_Runner
+
+
+class LeaseTest(unittest.TestCase):
+    def setUp(self):
+        self.run_dir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.run_dir, "leases"))
+        self.leases = []
+
+    def tearDown(self):
+        for lease in self.leases:
+            lease.release()
+        shutil.rmtree(self.run_dir)
+
+    def lease(self, worker, lease_time=60.0):
+        # The heartbeats are run by hand (with renew) rather than by the thread
+        lease = Shard_Runner.Lease(self.run_dir, 0, worker, lease_time, heartbeat=3600.0)
+        self.leases.append(lease)
+        return lease
+
+    def holder(self):
+        return Shard_Runner.lease_worker(Shard_Runner.lease_file(self.run_dir, 0))
+
+    def expire(self, worker):
+        with open(Shard_Runner.lease_file(self.run_dir, 0), "w") as lease:
+            json.dump({"worker": worker, "expires": time.time() - 1}, lease)
+
+    def test_only_one_worker_gets_a_lease(self):
+        self.assertTrue(self.lease("a").acquire())
+        self.assertFalse(self.lease("b").acquire())
+        self.assertEqual(self.holder(), "a")
+
+    def test_renewal_after_a_take_over_loses_the_lease(self):
+        first = self.lease("a")
+        self.assertTrue(first.acquire())
+        self.expire("a")
+        self.assertTrue(self.lease("b").acquire())
+        self.assertFalse(first.renew())
+        self.assertEqual(self.holder(), "b")
+        # Releasing a lost lease leaves the new one alone
+        first.lost.set()
+        first.release()
+        self.assertEqual(self.holder(), "b")
+
+    def test_take_over_of_a_renewed_lease_is_refused(self):
+        first = self.lease("a")
+        self.assertTrue(first.acquire())
+        second = self.lease("b")
+        # The lease looked expired, but has been renewed by the time it is taken over
+        second.expired = lambda: True
+        self.assertTrue(first.renew())
+        self.assertFalse(second.acquire())
+        self.assertEqual(self.holder(), "a")
+        self.assertTrue(first.renew())
+
+    def test_lease_is_never_missing_during_renewal(self):
+        first = self.lease("a")
+        self.assertTrue(first.acquire())
+        renewing = threading.Thread(target=lambda: [first.renew() for renewal in range(500)])
+        renewing.start()
+        taken = []
+        while renewing.is_alive():
+            second = Shard_Runner.Lease(self.run_dir, 0, "b", heartbeat=3600.0)
+            if second.acquire():
+                taken.append(second)
+                second.release()
+        renewing.join()
+        self.assertEqual(taken, [])
+        self.assertEqual(self.holder(), "a")
+
+    def test_release(self):
+        first = self.lease("a")
+        self.assertTrue(first.acquire())
+        first.release()
+        self.assertIsNone(self.holder())
+        self.assertEqual(os.listdir(os.path.join(self.run_dir, "leases")), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,41 @@
+import json
+import socket
+import unittest
+import http.client
+import Tagger_Service
+
+
+class ContentLengthTest(unittest.TestCase):
+    def setUp(self):
+        # No request here gets as far as the classifier
+        self.server, url = Tagger_Service.start_service(port=0, service=Tagger_Service.TaggerService(object()))
+        self.port = self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def post(self, content_length, body=b''):
+        with socket.create_connection((Tagger_Service.HOST, self.port), timeout=5) as connection:
+            connection.sendall(b'POST /evaluate HTTP/1.1\r\nHost: localhost\r\nContent-Length: ' +
+                               content_length.encode('ascii') + b'\r\n\r\n' + body)
+            response = http.client.HTTPResponse(connection)
+            response.begin()
+            return response.status, json.loads(response.read().decode('utf-8'))
+
+    def test_non_numeric_length(self):
+        self.assertEqual(self.post("lots")[0], 400)
+
+    def test_negative_length(self):
+        # Without the check this would wait for the connection to close
+        self.assertEqual(self.post("-1", b'{}')[0], 400)
+
+    def test_too_large(self):
+        self.assertEqual(self.post(str(Tagger_Service.MAX_REQUEST_SIZE + 1))[0], 413)
+
+    def test_bad_json(self):
+        self.assertEqual(self.post("3", b'{{{')[0], 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,41 @@
+import os
+import shutil
+import tempfile
+import unittest
+import Title_Index
+
+
+class MatchesFileTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "Title_Matches")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_titles_with_commas(self):
+        matches = {"I, Robot": "I, Robot", "The Matrix": "Matrix, The", 'Say "Cheese"': "Say Cheese"}
+        Title_Index.write_matches(matches, self.filename)
+        self.assertEqual(Title_Index.read_matches(self.filename), matches)
+
+    def test_missing_file(self):
+        self.assertEqual(Title_Index.read_matches(self.filename), {})
+
+
+class TitleIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = Title_Index.TitleIndex(["Matrix, The", "I, Robot", "Toy Story", "Rocky"])
+
+    def test_normalized_titles(self):
+        self.assertEqual(self.index.resolve("The Matrix"), "Matrix, The")
+        self.assertEqual(self.index.resolve("i robot"), "I, Robot")
+
+    def test_sequels_are_not_fuzzy_matches(self):
+        self.assertIsNone(self.index.suggest("Toy Story 3"))
+        self.assertIsNone(self.index.suggest("Rocky IV"))
+        self.assertEqual(self.index.suggest("Toy Storyy"), "Toy Story")
+        self.assertIsNone(self.index.resolve("Toy Storyy"))
+
+
+if __name__ == "__main__":
+    unittest.main()